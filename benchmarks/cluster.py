@@ -0,0 +1,89 @@
+import json
+import time
+from functools import partial
+from threading import Thread
+
+from payloads import message_create, snowflake
+from smalld.cluster import ShardCluster
+from smalld.testing import FakeDiscord
+
+SHARDS = 8
+EVENTS_PER_SHARD = 5000
+# seconds a run may take before the benchmark gives up
+DEADLINE = 300
+
+
+def handle_message(data):
+    # stand in for a bot parsing a command out of each message
+    words = data.content.split()
+    return sum(len(word) for word in words for _ in range(20))
+
+
+def count_messages(events, smalld):
+    received = {}
+
+    @smalld.on_message_create
+    def on_message(data):
+        handle_message(data)
+
+        guild_id = data.guild_id
+        received[guild_id] = received.get(guild_id, 0) + 1
+        if received[guild_id] == events:
+            smalld.post(f"/guilds/{guild_id}/done")
+
+
+def shard_frames(shard):
+    guild_id = str(snowflake_for(*shard))
+    frames = []
+    for s in range(2, EVENTS_PER_SHARD + 2):
+        payload = message_create(guild_id)
+        payload["s"] = s
+        frames.append(json.dumps(payload))
+    return frames
+
+
+def snowflake_for(shard_id, shard_count):
+    # a guild id that routes to the given shard
+    guild_id = int(snowflake()) >> 22
+    return (guild_id - guild_id % shard_count + shard_id) << 22
+
+
+def bench(workers, frames):
+    with FakeDiscord(shards=SHARDS, max_concurrency=SHARDS) as discord:
+        discord.events_for = lambda shard: frames[shard[0]]
+
+        cluster = ShardCluster(
+            "token",
+            setup=partial(count_messages, EVENTS_PER_SHARD),
+            workers=workers,
+            base_url=discord.base_url,
+            event_workers=1,
+        )
+        thread = Thread(target=cluster.run)
+        thread.start()
+
+        deadline = time.monotonic() + DEADLINE
+        while len([r for r in discord.requests if r[1].endswith("/done")]) < SHARDS:
+            if time.monotonic() > deadline:
+                cluster.close()
+                thread.join()
+                raise SystemExit(f"{workers} workers did not finish in {DEADLINE} s")
+            time.sleep(0.01)
+
+        done = time.monotonic()
+        cluster.close()
+        thread.join()
+
+    seconds = done - min(t for t, _ in discord.identifies)
+    events = SHARDS * EVENTS_PER_SHARD
+    print(f"{workers} workers {seconds:8.2f} s {events / seconds:10.0f} events/s")
+
+
+def main():
+    frames = {idx: shard_frames((idx, SHARDS)) for idx in range(SHARDS)}
+    for workers in (1, 2, 4):
+        bench(workers, frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import time
+from threading import Event, Thread
+
+from payloads import message_create, snowflake
+from smalld import SmallD
+from smalld.aio import AsyncSmallD
+from smalld.smalld import HttpClient
+from smalld.testing import OP_RECONNECT, FakeDiscord
+
+EVENTS = 20000
+REST_SECONDS = 3
+RECONNECTS = 2
+
+
+def message_frames(events):
+    guild_id = snowflake()
+    frames = []
+    for s in range(2, events + 2):
+        payload = message_create(guild_id)
+        payload["s"] = s
+        frames.append(json.dumps(payload))
+    return frames
+
+
+def report(name, value, unit):
+    print(f"{name:<36} {value:12.1f} {unit}")
+
+
+def bench_ingest(frames):
+    with FakeDiscord() as discord:
+        discord.events = frames
+        smalld = SmallD("token", base_url=discord.base_url)
+        received = 0
+        done = Event()
+
+        @smalld.on_message_create
+        def on_message(data):
+            nonlocal received
+            received += 1
+            if received == len(frames):
+                done.set()
+
+        thread = Thread(target=smalld.run)
+        thread.start()
+        done.wait()
+        finished = time.monotonic()
+        smalld.close()
+        thread.join()
+
+    seconds = finished - discord.identifies[0][0]
+    report("SmallD.run ingest", len(frames) / seconds, "events/s")
+
+
+def bench_async_ingest(frames):
+    async def main():
+        async with FakeDiscord() as discord:
+            discord.events = frames
+            smalld = AsyncSmallD("token", base_url=discord.base_url)
+            received = 0
+
+            @smalld.on_message_create
+            async def on_message(data):
+                nonlocal received
+                received += 1
+                if received == len(frames):
+                    await smalld.close()
+
+            await smalld.run()
+            return time.monotonic() - discord.identifies[0][0]
+
+    loop = asyncio.new_event_loop()
+    try:
+        seconds = loop.run_until_complete(main())
+    finally:
+        loop.close()
+    report("AsyncSmallD.run ingest", len(frames) / seconds, "events/s")
+
+
+def sustain(client, path, counts, idx):
+    end = time.monotonic() + REST_SECONDS
+    while time.monotonic() < end:
+        client.get(path)
+        counts[idx] += 1
+
+
+def bench_rest(name, limit=None, per=None, buckets=1):
+    with FakeDiscord() as discord:
+        if limit:
+            discord.ratelimit("channels/{}/messages", limit, per)
+        client = HttpClient("token", discord.base_url, wait_on_ratelimit=True)
+
+        counts = [0] * buckets
+        threads = [
+            Thread(
+                target=sustain, args=(client, f"channels/{idx}/messages", counts, idx)
+            )
+            for idx in range(buckets)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client.close()
+
+    for count in counts:
+        report(f"REST {name}", count / REST_SECONDS, "requests/s per bucket")
+    if limit:
+        report(f"REST {name} 429s", len(discord.ratelimited), "responses")
+
+
+def bench_reconnect():
+    with FakeDiscord() as discord:
+        bot = SmallD("token", base_url=discord.base_url)
+        thread = Thread(target=bot.run)
+        thread.start()
+
+        while not discord.identifies:
+            time.sleep(0.01)
+
+        downtime, handshake = [], []
+        for idx in range(1, RECONNECTS + 1):
+            time.sleep(0.1)
+            requested = time.monotonic()
+            discord.call(discord.send_all(OP_RECONNECT))
+            while len(discord.resumes) < idx:
+                time.sleep(0.001)
+
+            resumed = discord.resumes[-1][0]
+            downtime.append(resumed - requested)
+            handshake.append(resumed - discord.connects[-1])
+
+        bot.close()
+        thread.join()
+
+    report("reconnect to resume", sum(downtime) / RECONNECTS * 1000, "ms")
+    report("connect to resume", sum(handshake) / RECONNECTS * 1000, "ms")
+
+
+def main():
+    frames = message_frames(EVENTS)
+    bench_ingest(frames)
+    bench_async_ingest(frames)
+
+    bench_rest("unlimited")
+    bench_rest("50/1s", limit=50, per=1)
+    bench_rest("50/1s x2", limit=50, per=1, buckets=2)
+
+    bench_reconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import json
+import timeit
+import zlib
+
+from payloads import sample_frames
+from smalld.gateway import ZlibStreamInflater
+
+
+def compress(frames):
+    compressor = zlib.compressobj()
+    return [
+        compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        for frame in frames
+    ]
+
+
+def decode_plain(frames):
+    for frame in frames:
+        json.loads(frame.decode("utf-8"))
+
+
+def decode_compressed(frames):
+    inflater = ZlibStreamInflater()
+    for frame in frames:
+        json.loads(inflater.feed(frame).decode("utf-8"))
+
+
+def bench(name, func, frames):
+    received = sum(len(frame) for frame in frames)
+    seconds = min(timeit.repeat(lambda: func(frames), number=1, repeat=5))
+    print(f"{name:<12} {received / 1024:10.1f} KiB received {seconds * 1000:8.2f} ms")
+
+
+def main():
+    frames = sample_frames()
+
+    bench("plain", decode_plain, frames)
+    bench("zlib-stream", decode_compressed, compress(frames))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import json
+import timeit
+
+from payloads import sample_payloads
+from smalld import etf
+
+
+def snowflakes_as_ints(value):
+    if isinstance(value, dict):
+        return {k: snowflakes_as_ints(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [snowflakes_as_ints(v) for v in value]
+    if isinstance(value, str) and value.isdigit() and len(value) > 15:
+        return int(value)
+    return value
+
+
+def bench(name, decode, frames):
+    received = sum(len(frame) for frame in frames)
+    seconds = min(
+        timeit.repeat(lambda: [decode(f) for f in frames], number=1, repeat=5)
+    )
+    print(
+        f"{name:<6} {received / 1024:10.1f} KiB {seconds * 1000:8.2f} ms"
+        f" {len(frames) / seconds:10.0f} payloads/s"
+    )
+
+
+def main():
+    payloads = sample_payloads()
+
+    json_frames = [json.dumps(payload).encode("utf-8") for payload in payloads]
+    etf_frames = [etf.pack(snowflakes_as_ints(payload)) for payload in payloads]
+
+    bench("json", lambda frame: json.loads(frame.decode("utf-8")), json_frames)
+    bench("etf", etf.unpack, etf_frames)
+
+
+if __name__ == "__main__":
+    main()
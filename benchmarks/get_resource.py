@@ -0,0 +1,75 @@
+import random
+import timeit
+
+from smalld.ratelimit import get_resource, mappings
+
+PATHS = [
+    "/channels/{channel}/messages",
+    "/channels/{channel}/messages/{message}",
+    "/channels/{channel}/messages/{message}/reactions/thumbsup/@me",
+    "/channels/{channel}/typing",
+    "/guilds/{guild}",
+    "/guilds/{guild}/members/{user}",
+    "/guilds/{guild}/members/{user}/roles/{role}",
+    "/guilds/{guild}/roles",
+    "/webhooks/{webhook}/abcdEFGH1234/github",
+    "/webhooks/{webhook}/abcdEFGH1234",
+]
+
+NUMBER = 100000
+
+
+def snowflake():
+    return random.randint(10 ** 17, 10 ** 18)
+
+
+def sample_paths(count, distinct_ids):
+    ids = [snowflake() for _ in range(distinct_ids)]
+    return [
+        random.choice(PATHS).format(
+            channel=random.choice(ids),
+            message=snowflake(),
+            guild=random.choice(ids),
+            user=snowflake(),
+            role=random.choice(ids),
+            webhook=random.choice(ids),
+        )
+        for _ in range(count)
+    ]
+
+
+def linear_get_resource(path):
+    path = path.strip().strip("/")
+    for (pattern, template) in mappings:
+        match = pattern.fullmatch(path)
+        if not match:
+            continue
+        return match.expand(template)
+    return path
+
+
+def bench(name, func, paths):
+    def run():
+        for path in paths:
+            func(path)
+
+    seconds = min(timeit.repeat(run, number=1, repeat=5))
+    print(f"{name:<20} {seconds / len(paths) * 1e6:8.2f} us/call")
+
+
+def main():
+    random.seed(0)
+    paths = sample_paths(NUMBER, distinct_ids=50)
+
+    for path in paths[:1000]:
+        assert linear_get_resource(path) == get_resource(path), path
+
+    bench("linear scan", linear_get_resource, paths)
+    bench("trie", get_resource.__wrapped__, paths)
+    get_resource.cache_clear()
+    bench("trie + cache", get_resource, paths)
+    print(get_resource.cache_info())
+
+
+if __name__ == "__main__":
+    main()
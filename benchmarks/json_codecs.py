@@ -0,0 +1,32 @@
+import timeit
+
+from payloads import sample_frames, sample_payloads
+from smalld.codec import JSON_CODECS
+
+
+def bench(name, func, count):
+    seconds = min(timeit.repeat(func, number=1, repeat=5))
+    print(f"{name:<16} {seconds * 1000:8.2f} ms {count / seconds:10.0f} payloads/s")
+
+
+def main():
+    frames = sample_frames()
+    payloads = sample_payloads()
+
+    for codec in JSON_CODECS.values():
+        if not codec.available:
+            print(f"{codec.name:<16} not installed")
+            continue
+
+        bench(
+            f"{codec.name} loads", lambda: [codec.loads(f) for f in frames], len(frames)
+        )
+        bench(
+            f"{codec.name} dumps",
+            lambda: [codec.dumps(p) for p in payloads],
+            len(payloads),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import time
+import tracemalloc
+
+from payloads import guild_create
+from smalld.json_elements import JsonObject
+
+MEMBERS = 10000
+
+
+def wrapped(guild):
+    for member in guild.members:
+        member.user.id, member.user.username, member.roles
+
+
+def native(guild):
+    for member in guild.to_native()["members"]:
+        member["user"]["id"], member["user"]["username"], member["roles"]
+
+
+def bench(name, func, data):
+    guild = JsonObject(data)
+    start = time.perf_counter()
+    func(guild)
+    first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    func(guild)
+    second = time.perf_counter() - start
+
+    guild = JsonObject(data)
+    tracemalloc.start()
+    func(guild)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{name:<8} first {first * 1000:7.2f} ms, again {second * 1000:7.2f} ms,"
+        f" {peak / 1024:8.1f} KiB peak, {current / 1024:8.1f} KiB retained"
+    )
+
+
+def main():
+    data = guild_create("1", MEMBERS)["d"]
+
+    bench("wrapped", wrapped, data)
+    bench("native", native, data)
+
+
+if __name__ == "__main__":
+    main()
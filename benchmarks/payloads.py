@@ -0,0 +1,89 @@
+import json
+import random
+
+
+def snowflake():
+    return str(random.randint(10 ** 17, 10 ** 18))
+
+
+def presence_update(guild_id):
+    return {
+        "op": 0,
+        "t": "PRESENCE_UPDATE",
+        "s": 1,
+        "d": {
+            "guild_id": guild_id,
+            "user": {"id": snowflake()},
+            "status": random.choice(["online", "idle", "dnd", "offline"]),
+            "activities": [{"name": "a game", "type": 0, "created_at": 1600000000}],
+            "client_status": {"desktop": "online"},
+        },
+    }
+
+
+def guild_create(guild_id, members):
+    return {
+        "op": 0,
+        "t": "GUILD_CREATE",
+        "s": 1,
+        "d": {
+            "id": guild_id,
+            "name": "a guild",
+            "members": [
+                {
+                    "user": {
+                        "id": snowflake(),
+                        "username": f"user{i}",
+                        "discriminator": f"{i % 10000:04}",
+                        "avatar": None,
+                    },
+                    "roles": [snowflake() for _ in range(3)],
+                    "joined_at": "2020-01-01T00:00:00.000000+00:00",
+                    "deaf": False,
+                    "mute": False,
+                }
+                for i in range(members)
+            ],
+            "channels": [
+                {"id": snowflake(), "name": f"channel{i}", "type": 0} for i in range(50)
+            ],
+        },
+    }
+
+
+def message_create(guild_id):
+    return {
+        "op": 0,
+        "t": "MESSAGE_CREATE",
+        "s": 1,
+        "d": {
+            "id": snowflake(),
+            "guild_id": guild_id,
+            "channel_id": snowflake(),
+            "author": {"id": snowflake(), "username": "user", "avatar": None},
+            "content": "++ping " * random.randint(1, 20),
+            "timestamp": "2020-01-01T00:00:00.000000+00:00",
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "attachments": [],
+            "embeds": [],
+        },
+    }
+
+
+def sample_payloads(events=2000, guilds=5, members=1000):
+    random.seed(0)
+    guild_id = snowflake()
+    payloads = [guild_create(guild_id, members) for _ in range(guilds)]
+    payloads += [
+        random.choice([presence_update, message_create])(guild_id)
+        for _ in range(events)
+    ]
+    return payloads
+
+
+def sample_frames(**kwargs):
+    return [
+        json.dumps(payload).encode("utf-8") for payload in sample_payloads(**kwargs)
+    ]
@@ -0,0 +1,43 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from payloads import sample_frames
+from smalld import SmallD
+from smalld.recording import GatewayRecorder, replay
+
+
+def record(path, frames):
+    recorder = GatewayRecorder(path)
+    for frame in frames:
+        recorder.record(frame)
+    recorder.close()
+
+
+def bench(name, path, **kwargs):
+    with patch("smalld.smalld.HttpClient"):
+        smalld = SmallD("token", **kwargs)
+
+    @smalld.on_message_create
+    def on_message(data):
+        data.content.split()
+
+    @smalld.on_presence_update
+    def on_presence(data):
+        data.status
+
+    count, seconds = replay(smalld, path)
+    print(f"{name:<20} {count:8} dispatches {count / seconds:10.0f} dispatches/s")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "gateway.rec")
+        record(path, sample_frames(events=20000))
+
+        bench("plain", path)
+        bench("profiled", path, profile_listeners=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,7 @@ setup(
     package_data={"smalld.resources": ["*"]},
     use_scm_version=True,
     install_requires=["requests>=2.23.0", "websocket_client>=0.57.0"],
+    extras_require={"async": ["aiohttp>=3.6.0"]},
     setup_requires=["setuptools-scm==3.3.3"],
     classifiers=[
         "Development Status :: 4 - Beta",
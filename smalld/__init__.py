@@ -1,2 +1,3 @@
 from .exceptions import HttpError, NetworkError, RateLimitError, SmallDError
+from .sharding import AutoShardedSmallD
 from .smalld import Intent, SmallD, __version__
@@ -0,0 +1,498 @@
+import asyncio
+import inspect
+import time
+
+import aiohttp
+
+from .cache import request_key
+from .codec import get_json_codec
+from .exceptions import HttpError, NetworkError, RateLimitError
+from .gateway import CloseReason, ZlibStreamInflater, decode_payload, with_query
+from .json_elements import JsonObject, wrap_value
+from .logger import logger
+from .pagination import get_pagination, has_remaining
+from .ratelimit import (
+    DEFAULT_MAX_WAIT,
+    GatewayRateLimiter,
+    RateLimiter,
+    is_retry_after_in_ms,
+)
+from .smalld import HttpClient, SmallD, __version__, is_recoverable_error
+from .standard_listeners import Heartbeat, Identify, SequenceNumber, SessionCheckpoint
+
+
+def add_async_standard_listeners(smalld):
+    sequence = SequenceNumber(smalld)
+    smalld.heartbeat = AsyncHeartbeat(smalld, sequence)
+    smalld.identify_listener = identify = AsyncIdentify(smalld, sequence)
+    smalld.reconnect_policy.listen(smalld)
+    if smalld.session_file:
+        smalld.session_checkpoint = SessionCheckpoint(smalld, sequence, identify)
+
+
+class AsyncIdentify(Identify):
+    async def on_invalid_session(self, data):
+        logger.info("Invalid session.")
+        self.session_id = None
+        await asyncio.sleep(2)
+        self.identify()
+
+
+class AsyncHeartbeat(Heartbeat):
+    def on_hello(self, data):
+        self.heartbeat_interval = data.d.heartbeat_interval / 1000
+
+        if not self.thread or self.thread.done():
+            self.thread = asyncio.ensure_future(self.run_heartbeat_loop())
+
+    async def run_heartbeat_loop(self):
+        await asyncio.sleep(self.heartbeat_interval)
+        while not self.smalld.closed:
+            try:
+                self.send_heartbeat()
+            except NetworkError:
+                continue
+            finally:
+                await asyncio.sleep(self.heartbeat_interval)
+
+            if self.received_ack.is_set():
+                self.received_ack.clear()
+            else:
+                logger.info("No heartbeat ack. Reconnecting...")
+                if self.smalld.metrics is not None:
+                    self.smalld.metrics.heartbeat_missed_acks.inc()
+                self.smalld.reconnect()
+                break
+
+
+class AsyncGateway:
+    def __init__(
+        self,
+        url,
+        session,
+        compress=False,
+        codec=None,
+        skip=None,
+        metrics=None,
+        recorder=None,
+    ):
+        self.codec = codec or get_json_codec()
+        self.url = with_query(url, compress=compress, encoding=self.codec.encoding)
+        self.compress = compress
+        self.skip = skip if self.codec.encoding == "json" else None
+        self.session = session
+        self.metrics = metrics
+        self.recorder = recorder
+        self.ws = None
+        self.close_reason = None
+        self.connect_failed = False
+        self.limiter = GatewayRateLimiter()
+        self.outgoing = asyncio.Queue()
+
+    def __aiter__(self):
+        return self.receive()
+
+    async def receive(self):
+        inflater = ZlibStreamInflater() if self.compress else None
+
+        try:
+            self.ws = await self.session.ws_connect(self.url)
+        except (aiohttp.ClientError, OSError) as e:
+            logger.debug("Exception connecting to gateway.", exc_info=True)
+            self.close_reason = CloseReason.exception(e)
+            self.connect_failed = True
+            logger.info("Gateway Closed: %s", self.close_reason)
+            return
+
+        writer = asyncio.ensure_future(self.write_outgoing())
+        try:
+            while not self.ws.closed:
+                msg = await self.ws.receive()
+
+                if msg.type == aiohttp.WSMsgType.CLOSE:
+                    self.close_reason = CloseReason(msg.data, msg.extra or "")
+                    break
+
+                if msg.type == aiohttp.WSMsgType.ERROR:
+                    self.close_reason = CloseReason.exception(self.ws.exception())
+                    break
+
+                data = msg.data
+                if data and self.metrics is not None:
+                    self.metrics.gateway_received_bytes.inc(amount=len(data))
+
+                if data and inflater and msg.type == aiohttp.WSMsgType.BINARY:
+                    data = inflater.feed(data)
+
+                if data and msg.type in (
+                    aiohttp.WSMsgType.TEXT,
+                    aiohttp.WSMsgType.BINARY,
+                ):
+                    if isinstance(data, str):
+                        data = data.encode("utf-8")
+
+                    if self.recorder is not None:
+                        self.recorder.record(data)
+
+                    yield decode_payload(data, self.codec, self.skip)
+        finally:
+            writer.cancel()
+
+        if not self.close_reason:
+            self.close_reason = CloseReason(self.ws.close_code)
+
+        logger.info("Gateway Closed: %s", self.close_reason)
+
+    async def write_outgoing(self):
+        while True:
+            payload = await self.outgoing.get()
+            try:
+                if isinstance(payload, bytes):
+                    await self.ws.send_bytes(payload)
+                else:
+                    await self.ws.send_str(payload)
+            except (aiohttp.ClientError, OSError):
+                logger.debug("Error sending payload.", exc_info=True)
+
+    def send(self, data):
+        if not self.ws or self.ws.closed:
+            raise NetworkError
+
+        self.limiter.on_send()
+        payload = self.codec.dumps(data)
+        logger.debug("Gateway payload sent: %s", data)
+        self.outgoing.put_nowait(payload)
+
+    async def close(self, status=1000):
+        if self.ws:
+            await self.ws.close(code=status)
+
+
+class AsyncSmallD(SmallD):
+    def __init__(self, *args, **kwargs):
+        self.gateway = None
+        self.heartbeat = None
+        super().__init__(*args, **kwargs)
+
+    def create_http_client(self, **kwargs):
+        return AsyncHttpClient(self.token, self.base_url, **kwargs)
+
+    def create_standard_listeners(self):
+        add_async_standard_listeners(self)
+
+    def reconnect(self):
+        asyncio.ensure_future(self.gateway.close(status=4900))
+
+    async def paginate(self, path, params=None, prefetch=True, **kwargs):
+        pagination = get_pagination(path, **kwargs)
+        params = {**(params or {}), "limit": pagination.limit}
+
+        async def fetch(cursor):
+            content = await self.get(
+                path, params=pagination.page_params(params, cursor)
+            )
+            return pagination.page_items(content.to_native())
+
+        next_page = None
+        try:
+            page = await fetch(params.get(pagination.direction))
+            while page:
+                next_page = None
+                if len(page) >= pagination.limit:
+                    cursor = pagination.next_cursor(page)
+                    if prefetch and has_remaining(self.http.limiter, path):
+                        next_page = asyncio.ensure_future(fetch(cursor))
+                    else:
+                        next_page = cursor
+
+                for item in page:
+                    yield wrap_value(item)
+
+                if next_page is None:
+                    return
+                elif isinstance(next_page, str):
+                    page = await fetch(next_page)
+                else:
+                    page = await next_page
+        finally:
+            if isinstance(next_page, asyncio.Future):
+                next_page.cancel()
+
+    async def close(self):
+        self.closed_event.set()
+        if self.heartbeat and self.heartbeat.thread:
+            self.heartbeat.thread.cancel()
+        if self.session_checkpoint:
+            self.session_checkpoint.save()
+        await self.http.close()
+        if self.gateway:
+            await self.gateway.close(status=self.close_status)
+        if self.recorder:
+            self.recorder.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        if not self.closed:
+            await self.close()
+
+    async def run(self):
+        logger.info("Running (SmallD v%s)...", __version__)
+
+        self.closed_event.clear()
+
+        connections = 0
+        while not self.closed:
+            logger.info("Gateway connecting...")
+            if self.metrics is not None:
+                self.metrics.on_connect(connections)
+            connections += 1
+
+            close_reason = None
+            try:
+                gateway_url = await self.get_connect_url()
+            except (HttpError, NetworkError) as e:
+                logger.info(f"Could not fetch gateway url. ({type(e).__name__}) {e}")
+            else:
+                self.gateway = AsyncGateway(
+                    gateway_url,
+                    self.http.get_session(),
+                    compress=self.compress,
+                    codec=self.gateway_codec,
+                    skip=self.skip_dispatch,
+                    metrics=self.metrics,
+                    recorder=self.recorder,
+                )
+
+                if self.metrics is None:
+                    async for data in self.gateway:
+                        await self.notify_listeners(data)
+                else:
+                    async for data in self.gateway:
+                        start = time.perf_counter()
+                        await self.notify_listeners(data)
+                        self.metrics.on_payload(data, time.perf_counter() - start)
+                    self.metrics.on_gateway_close(self.gateway.close_reason)
+
+                if self.gateway.connect_failed:
+                    self.forget_gateway_urls()
+
+                close_reason = self.gateway.close_reason
+                if not is_recoverable_error(close_reason):
+                    logger.fatal("Unrecoverable gateway closure: %s", close_reason)
+                    await self.close()
+
+            if not self.closed:
+                delay = self.reconnect_policy.next_delay(close_reason)
+                logger.debug("Waiting %s seconds to reconnect...", round(delay, 2))
+                await asyncio.sleep(delay)
+
+    async def get_connect_url(self):
+        return self.get_resume_url() or await self.fetch_gateway_url()
+
+    async def fetch_gateway_url(self):
+        try:
+            return self.cache_gateway_url(await self.get_gateway_url())
+        except (HttpError, NetworkError):
+            url = self.cached_gateway_url()
+            if url is None:
+                raise
+            logger.info("Could not fetch gateway url, using cached url.")
+            return url
+
+    async def get_gateway_url(self):
+        return (await self.get("/gateway/bot")).url
+
+    async def notify_listeners(self, data):
+        op, t = data.get("op"), data.get("t")
+        listeners = self.inline_listeners.get(op, t)
+        if "d" in data:
+            listeners = listeners + self.listeners.get(op, t)
+
+        for listener in listeners:
+            call = self.profiler and self.profiler.start(listener, data)
+            try:
+                result = listener(data)
+                if inspect.isawaitable(result):
+                    await result
+            except:
+                logger.warning("Exception in listener", exc_info=True)
+            finally:
+                if call:
+                    self.profiler.stop(call)
+
+
+class AsyncHttpClient:
+    headers = HttpClient.headers
+
+    def __init__(
+        self,
+        token,
+        base_url,
+        wait_on_ratelimit=False,
+        max_ratelimit_wait=DEFAULT_MAX_WAIT,
+        codec=None,
+        ratelimit_store=None,
+        response_cache=None,
+        metrics=None,
+    ):
+        self.token = token
+        self.base_url = base_url
+        self.codec = codec or get_json_codec()
+        self.cache = response_cache
+        self.metrics = metrics
+        # request key to asyncio.Future mapping, for GETs in flight
+        self.in_flight = {}
+        self.session = None
+        self.limiter = RateLimiter(
+            blocking=wait_on_ratelimit,
+            max_wait=max_ratelimit_wait,
+            store=ratelimit_store,
+            metrics=metrics,
+            retry_after_in_ms=is_retry_after_in_ms(base_url),
+        )
+        # bucket to asyncio.Lock mapping, so waiting requests go in order
+        self.locks = {}
+
+    def get_session(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(headers=self.headers())
+        return self.session
+
+    async def get(self, *args, **kwargs):
+        return await self.send_request("GET", *args, **kwargs)
+
+    async def post(self, *args, **kwargs):
+        return await self.send_request("POST", *args, **kwargs)
+
+    async def put(self, *args, **kwargs):
+        return await self.send_request("PUT", *args, **kwargs)
+
+    async def patch(self, *args, **kwargs):
+        return await self.send_request("PATCH", *args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        return await self.send_request("DELETE", *args, **kwargs)
+
+    async def take(self, bucket):
+        if bucket is self.limiter.no_ratelimit_bucket:
+            return
+
+        try:
+            lock = self.locks[bucket]
+        except KeyError:
+            lock = self.locks[bucket] = asyncio.Lock()
+
+        async with lock:
+            while True:
+                try:
+                    bucket.take()
+                    return
+                except RateLimitError as e:
+                    await asyncio.sleep(self.limiter.delay_for(e))
+
+    def request_args(self, payload, attachments, params):
+        if attachments:
+            data = aiohttp.FormData()
+            data.add_field("payload_json", self.codec.dumps(payload))
+            for idx, (name, content, content_type) in enumerate(attachments):
+                data.add_field(
+                    f"file{idx}", content, filename=name, content_type=content_type
+                )
+            args = {"data": data}
+        elif payload:
+            args = {
+                "data": self.codec.dumps(payload).encode("utf-8"),
+                "headers": {"Content-Type": "application/json"},
+            }
+        else:
+            args = {}
+
+        if params:
+            args["params"] = params
+
+        return args
+
+    async def send_request(
+        self, method, path, payload="", attachments=None, params=None
+    ):
+        if method != "GET":
+            return JsonObject(
+                await self.request(method, path, payload, attachments, params)
+            )
+
+        if self.cache is not None:
+            content = self.cache.get(path, params)
+            if content is not None:
+                return JsonObject(content)
+
+        # identical GETs made while one is in flight share its response
+        key = request_key(path, params)
+        future = self.in_flight.get(key)
+        if future is not None:
+            return JsonObject(await asyncio.shield(future))
+
+        future = self.in_flight[key] = asyncio.get_event_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            content = await self.request(method, path, payload, attachments, params)
+            future.set_result(content)
+            return JsonObject(content)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self.in_flight[key]
+
+    async def request(self, method, path, payload, attachments, params):
+        url = f"{self.base_url}/{path.lstrip('/')}"
+
+        while True:
+            await self.take(self.limiter.global_bucket)
+            await self.take(self.limiter.get_bucket(method, path))
+
+            args = self.request_args(payload, attachments, params)
+
+            start = time.perf_counter()
+            try:
+                async with self.get_session().request(method, url, **args) as res:
+                    if self.metrics is not None:
+                        self.metrics.on_rest_response(
+                            method, path, res.status, time.perf_counter() - start
+                        )
+
+                    try:
+                        self.limiter.on_response(method, path, res.headers, res.status)
+                    except RateLimitError as e:
+                        await asyncio.sleep(self.limiter.delay_for(e))
+                        continue
+
+                    if res.status >= 400:
+                        raise HttpError(response=res)
+
+                    content = await res.read()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                raise NetworkError
+            except aiohttp.ClientError:
+                raise HttpError
+
+            try:
+                content = self.codec.loads(content) if res.status != 204 else {}
+            except self.codec.decode_error:
+                raise HttpError(response=res)
+
+            if self.cache is not None:
+                if method == "GET":
+                    self.cache.put(path, params, content)
+                else:
+                    self.cache.invalidate(path)
+
+            return content
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
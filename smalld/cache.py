@@ -0,0 +1,326 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from .json_elements import JsonObject
+
+# guild fields that are cached on their own, or not at all
+GUILD_COLLECTIONS = ("channels", "threads", "members", "presences", "roles")
+
+
+class LRUCache:
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key to (expiry, value) mapping, least recently used first
+        self.items = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        with self.lock:
+            try:
+                expires, value = self.items[key]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            if expires is not None and time.monotonic() >= expires:
+                del self.items[key]
+                self.misses += 1
+                return None
+
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        return self.items.get(key, (None, None))[1]
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.items[key] = (expires, value)
+            self.items.move_to_end(key)
+            if self.maxsize is not None and len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self.lock:
+            return self.items.pop(key, (None, None))[1]
+
+    def remove_if(self, predicate):
+        with self.lock:
+            keys = [k for k, (_, v) in self.items.items() if predicate(k, v)]
+            for key in keys:
+                del self.items[key]
+            return len(keys)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.items),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class EntityCache:
+    """Caches guilds, channels, roles, members and users as seen on the gateway.
+
+    Listeners are registered inline, so the cache is up to date before other
+    listeners receive an event. Each entity type is bounded by its max_* argument
+    (None for no bound), evicting the least recently used entries.
+    """
+
+    def __init__(
+        self,
+        smalld,
+        max_guilds=None,
+        max_channels=None,
+        max_roles=None,
+        max_members=100000,
+        max_users=100000,
+    ):
+        self.guilds = LRUCache(max_guilds)
+        self.channels = LRUCache(max_channels)
+        self.roles = LRUCache(max_roles)
+        self.members = LRUCache(max_members)
+        self.users = LRUCache(max_users)
+
+        listeners = {
+            "READY": self.on_ready,
+            "GUILD_CREATE": self.on_guild_create,
+            "GUILD_UPDATE": self.on_guild_create,
+            "GUILD_DELETE": self.on_guild_delete,
+            "CHANNEL_CREATE": self.on_channel_update,
+            "CHANNEL_UPDATE": self.on_channel_update,
+            "CHANNEL_DELETE": self.on_channel_delete,
+            "THREAD_CREATE": self.on_channel_update,
+            "THREAD_UPDATE": self.on_channel_update,
+            "THREAD_DELETE": self.on_channel_delete,
+            "GUILD_ROLE_CREATE": self.on_role_update,
+            "GUILD_ROLE_UPDATE": self.on_role_update,
+            "GUILD_ROLE_DELETE": self.on_role_delete,
+            "GUILD_MEMBER_ADD": self.on_member_update,
+            "GUILD_MEMBER_UPDATE": self.on_member_update,
+            "GUILD_MEMBER_REMOVE": self.on_member_remove,
+            "GUILD_MEMBERS_CHUNK": self.on_members_chunk,
+            "USER_UPDATE": self.on_user_update,
+        }
+        for t, listener in listeners.items():
+            smalld.on_dispatch(
+                lambda data, listener=listener: listener(data.to_native()),
+                t=t,
+                inline=True,
+            )
+
+    def guild(self, guild_id):
+        return wrap(self.guilds.get(str(guild_id)))
+
+    def channel(self, channel_id):
+        return wrap(self.channels.get(str(channel_id)))
+
+    def role(self, role_id):
+        return wrap(self.roles.get(str(role_id)))
+
+    def member(self, guild_id, user_id):
+        return wrap(self.members.get((str(guild_id), str(user_id))))
+
+    def user(self, user_id):
+        return wrap(self.users.get(str(user_id)))
+
+    def stats(self):
+        return {
+            "guilds": self.guilds.stats(),
+            "channels": self.channels.stats(),
+            "roles": self.roles.stats(),
+            "members": self.members.stats(),
+            "users": self.users.stats(),
+        }
+
+    def on_ready(self, data):
+        self.on_user_update(data["user"])
+
+    def on_guild_create(self, data):
+        guild_id = str(data["id"])
+
+        guild = {k: v for k, v in data.items() if k not in GUILD_COLLECTIONS}
+        self.guilds.put(guild_id, guild)
+
+        for channel in [*data.get("channels", ()), *data.get("threads", ())]:
+            self.on_channel_update({**channel, "guild_id": guild_id})
+
+        for role in data.get("roles", ()):
+            self.on_role_update({"guild_id": guild_id, "role": role})
+
+        self.on_members_chunk(
+            {"guild_id": guild_id, "members": data.get("members", ())}
+        )
+
+    def on_guild_delete(self, data):
+        guild_id = str(data["id"])
+        self.guilds.pop(guild_id)
+
+        def in_guild(key, value):
+            return str(value.get("guild_id")) == guild_id
+
+        self.channels.remove_if(in_guild)
+        self.roles.remove_if(in_guild)
+        self.members.remove_if(lambda key, value: key[0] == guild_id)
+
+    def on_channel_update(self, data):
+        self.channels.put(str(data["id"]), data)
+
+    def on_channel_delete(self, data):
+        self.channels.pop(str(data["id"]))
+
+    def on_role_update(self, data):
+        role = data["role"]
+        self.roles.put(str(role["id"]), {**role, "guild_id": str(data["guild_id"])})
+
+    def on_role_delete(self, data):
+        self.roles.pop(str(data["role_id"]))
+
+    def on_member_update(self, data):
+        user = data["user"]
+        key = (str(data["guild_id"]), str(user["id"]))
+
+        # a new dict, as data is also passed to the listeners that follow
+        member = {**(self.members.peek(key) or {}), **data}
+        member.pop("guild_id", None)
+
+        self.members.put(key, member)
+        self.on_user_update(user)
+
+    def on_member_remove(self, data):
+        self.members.pop((str(data["guild_id"]), str(data["user"]["id"])))
+
+    def on_members_chunk(self, data):
+        guild_id = data["guild_id"]
+        for member in data["members"]:
+            self.on_member_update({**member, "guild_id": guild_id})
+
+    def on_user_update(self, data):
+        user_id = str(data["id"])
+        user = self.users.peek(user_id)
+        self.users.put(user_id, {**user, **data} if user else data)
+
+
+def wrap(value):
+    return None if value is None else JsonObject(value)
+
+
+def channel_paths(data):
+    paths = [f"channels/{data['id']}"]
+    if data.get("guild_id"):
+        paths.append(f"guilds/{data['guild_id']}/channels")
+    return paths
+
+
+def member_paths(data):
+    return [f"guilds/{data['guild_id']}/members/{data['user']['id']}"]
+
+
+def role_paths(data):
+    return [f"guilds/{data['guild_id']}/roles", f"guilds/{data['guild_id']}"]
+
+
+# dispatch to paths made stale by it
+GATEWAY_INVALIDATIONS = {
+    "GUILD_UPDATE": lambda data: [f"guilds/{data['id']}"],
+    "GUILD_DELETE": lambda data: [f"guilds/{data['id']}"],
+    "GUILD_ROLE_CREATE": role_paths,
+    "GUILD_ROLE_UPDATE": role_paths,
+    "GUILD_ROLE_DELETE": role_paths,
+    "GUILD_EMOJIS_UPDATE": lambda data: [f"guilds/{data['guild_id']}/emojis"],
+    "GUILD_MEMBER_ADD": member_paths,
+    "GUILD_MEMBER_UPDATE": member_paths,
+    "GUILD_MEMBER_REMOVE": member_paths,
+    "CHANNEL_CREATE": channel_paths,
+    "CHANNEL_UPDATE": channel_paths,
+    "CHANNEL_DELETE": channel_paths,
+    "CHANNEL_PINS_UPDATE": lambda data: [f"channels/{data['channel_id']}/pins"],
+    "USER_UPDATE": lambda data: ["users/@me", f"users/{data['id']}"],
+}
+
+
+# resources that change rarely and are evicted by gateway events
+DEFAULT_RESOURCES = (
+    "guilds/{}",
+    "guilds/{}/roles",
+    "guilds/{}/channels",
+    "guilds/{}/emojis",
+    "channels/{}",
+    "users/@me",
+)
+
+
+def normalize_path(path):
+    return path.strip().strip("/")
+
+
+def request_key(path, params=None):
+    if not params:
+        return normalize_path(path), ()
+
+    items = params.items() if isinstance(params, dict) else params
+    return normalize_path(path), tuple(sorted((str(k), str(v)) for k, v in items))
+
+
+def path_template(path):
+    return "/".join(
+        "{}" if segment.isdigit() else segment
+        for segment in normalize_path(path).split("/")
+    )
+
+
+class ResponseCache:
+    """Caches the content of GET responses for ttl seconds.
+
+    Entries are keyed by path and query parameters. A write to a path, and the
+    dispatches in GATEWAY_INVALIDATIONS, evict entries for that path, its children
+    and its parent. Only paths whose template (ids replaced by {}, e.g.
+    guilds/{}/roles) is in resources are cached, or every path if it is None.
+    """
+
+    def __init__(self, ttl=60, maxsize=1024, resources=DEFAULT_RESOURCES):
+        self.entries = LRUCache(maxsize, ttl=ttl)
+        self.resources = set(resources) if resources is not None else None
+        self.invalidations = 0
+
+    def listen(self, smalld):
+        for t, paths in GATEWAY_INVALIDATIONS.items():
+            smalld.on_dispatch(
+                lambda data, paths=paths: self.invalidate(*paths(data.to_native())),
+                t=t,
+                inline=True,
+            )
+
+    def get(self, path, params=None):
+        return self.entries.get(request_key(path, params))
+
+    def put(self, path, params, content):
+        if self.resources is None or path_template(path) in self.resources:
+            self.entries.put(request_key(path, params), content)
+
+    def invalidate(self, *paths):
+        for path in map(normalize_path, paths):
+            parent = path.rpartition("/")[0]
+            self.invalidations += self.entries.remove_if(
+                lambda key, value: key[0] == path
+                or key[0] == parent
+                or key[0].startswith(path + "/")
+            )
+
+    def stats(self):
+        return {**self.entries.stats(), "invalidations": self.invalidations}
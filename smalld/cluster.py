@@ -0,0 +1,329 @@
+import multiprocessing
+import os
+from itertools import count
+from threading import Event, Lock, Thread
+
+from .exceptions import HttpError, NetworkError, RateLimitError
+from .json_elements import JsonObject
+from .logger import logger
+from .ratelimit import GlobalRateLimitBucket, IdentifyRateLimiter, WaitQueue
+from .sharding import AutoShardedSmallD
+from .smalld import V9_BASE_URL, HttpClient, __version__
+
+
+class Channel:
+    """One end of a pipe that may be written to from several threads."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = Lock()
+
+    def send(self, message):
+        with self.lock:
+            self.conn.send(message)
+
+    def recv(self):
+        return self.conn.recv()
+
+
+class Coordinator:
+    """Owns the state that must be shared by all the workers of a ShardCluster.
+
+    Workers call the methods in METHODS over a pipe. Identifies are answered on
+    their own thread as they may wait for the identify rate limit.
+    """
+
+    METHODS = {"identify", "global_take", "global_update"}
+
+    def __init__(self, max_concurrency=1):
+        self.identify_limiter = IdentifyRateLimiter(max_concurrency)
+        self.global_bucket = GlobalRateLimitBucket()
+        self.global_lock = Lock()
+
+    def identify(self, shard_id):
+        self.identify_limiter.on_identify(shard_id)
+
+    def global_take(self):
+        with self.global_lock:
+            try:
+                self.global_bucket.take()
+            except RateLimitError as e:
+                return e.reset
+
+    def global_update(self, values):
+        with self.global_lock:
+            self.global_bucket.update(values)
+            return self.global_bucket.reset
+
+    def serve(self, channel):
+        while True:
+            try:
+                request_id, method, args = channel.recv()
+            except (EOFError, OSError):
+                return
+
+            if method not in self.METHODS:
+                logger.warning("Unknown coordinator method: %s", method)
+                channel.send((request_id, None))
+            elif method == "identify":
+                Thread(
+                    target=self.reply,
+                    args=(channel, request_id, method, args),
+                    daemon=True,
+                ).start()
+            else:
+                self.reply(channel, request_id, method, args)
+
+    def reply(self, channel, request_id, method, args):
+        result = getattr(self, method)(*args)
+        try:
+            channel.send((request_id, result))
+        except (BrokenPipeError, OSError):
+            pass
+
+
+class CoordinatorClient:
+    """The worker side of the pipe to a Coordinator.
+
+    Calls may be made from any thread; replies are matched to calls by id. on_close
+    is called when the coordinator asks the worker to close or goes away.
+    """
+
+    def __init__(self, conn, on_close=None):
+        self.channel = Channel(conn)
+        self.on_close = on_close
+        self.ids = count()
+        self.pending = {}
+        self.pending_lock = Lock()
+        self.reader = Thread(target=self.read, daemon=True)
+
+    def start(self):
+        self.reader.start()
+
+    def call(self, method, *args):
+        done = Event()
+        result = []
+        with self.pending_lock:
+            request_id = next(self.ids)
+            self.pending[request_id] = (done, result)
+        self.channel.send((request_id, method, args))
+        done.wait()
+        return result[0] if result else None
+
+    def read(self):
+        while True:
+            try:
+                request_id, value = self.channel.recv()
+            except (EOFError, OSError):
+                break
+
+            if request_id is None:
+                break
+
+            with self.pending_lock:
+                done, result = self.pending.pop(request_id)
+            result.append(value)
+            done.set()
+
+        with self.pending_lock:
+            for done, _ in self.pending.values():
+                done.set()
+            self.pending.clear()
+
+        if self.on_close:
+            self.on_close()
+
+
+class RemoteIdentifyRateLimiter:
+    def __init__(self, client):
+        self.client = client
+
+    def on_identify(self, shard_id):
+        self.client.call("identify", shard_id)
+
+
+class RemoteGlobalRateLimitBucket:
+    def __init__(self, client, retry_after_in_ms=False):
+        self.client = client
+        self.retry_after_in_ms = retry_after_in_ms
+        self.reset = None
+        self.queue = WaitQueue()
+
+    def take(self):
+        reset = self.client.call("global_take")
+        if reset is not None:
+            self.reset = reset
+            raise RateLimitError(reset, is_global=True)
+
+    def update(self, values):
+        # the coordinator's bucket reads Retry-After in seconds
+        retry_after = float(values.get("Retry-After", 0))
+        if self.retry_after_in_ms:
+            retry_after /= 1000
+        self.reset = self.client.call(
+            "global_update",
+            {
+                "X-RateLimit-Global": values.get("X-RateLimit-Global", "false"),
+                "Retry-After": retry_after,
+            },
+        )
+
+
+def run_worker(conn, token, shard_ids, gateway_bot, setup, kwargs):
+    smalld = AutoShardedSmallD(
+        token, shard_count=gateway_bot["shards"], shard_ids=shard_ids, **kwargs
+    )
+    client = CoordinatorClient(conn, on_close=smalld.close)
+
+    smalld.gateway_bot = JsonObject(gateway_bot)
+    smalld.identify_limiter = RemoteIdentifyRateLimiter(client)
+    limiter = smalld.http.limiter
+    limiter.global_bucket = RemoteGlobalRateLimitBucket(
+        client, limiter.global_bucket.retry_after_in_ms
+    )
+
+    # started first, as requests made by setup wait on replies it reads
+    client.start()
+
+    if setup:
+        setup(smalld)
+
+    smalld.run()
+
+
+def split_shards(shard_count, workers):
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for idx in range(workers):
+        end = start + size + (1 if idx < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class ShardCluster:
+    """Runs the shards of a bot across several worker processes.
+
+    Each worker runs an AutoShardedSmallD for a contiguous range of shards. setup is
+    called with it in the worker to register listeners, so it must be picklable
+    (e.g., a module level function). The identify rate limit and the global REST
+    rate limit are shared by all workers through a Coordinator in this process.
+    """
+
+    def __init__(
+        self,
+        token=os.environ.get("SMALLD_TOKEN"),
+        setup=None,
+        workers=2,
+        shard_count=None,
+        base_url=V9_BASE_URL,
+        **kwargs,
+    ):
+        self.token = token
+        self.setup = setup
+        self.workers = workers
+        self.shard_count = shard_count
+        self.base_url = base_url
+        self.kwargs = kwargs
+
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = []
+        self.channels = []
+        self.coordinator = None
+        self.closed_event = Event()
+
+    @property
+    def closed(self):
+        return self.closed_event.is_set()
+
+    def get_gateway_bot(self):
+        http = HttpClient(self.token, self.base_url)
+        try:
+            while not self.closed:
+                try:
+                    return http.get("/gateway/bot")
+                except (HttpError, NetworkError) as e:
+                    logger.info(
+                        f"Could not fetch gateway bot. ({type(e).__name__}) {e}"
+                    )
+                    self.closed_event.wait(5)
+        finally:
+            http.close()
+
+    def start_worker(self, shard_ids, gateway_bot):
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=run_worker,
+            args=(
+                child_conn,
+                self.token,
+                shard_ids,
+                gateway_bot,
+                self.setup,
+                {"base_url": self.base_url, **self.kwargs},
+            ),
+            name=f"smalld-shards-{shard_ids[0]}-{shard_ids[-1]}",
+        )
+        process.start()
+        child_conn.close()
+
+        channel = Channel(parent_conn)
+        Thread(target=self.coordinator.serve, args=(channel,), daemon=True).start()
+
+        self.processes.append(process)
+        self.channels.append(channel)
+
+    def run(self):
+        logger.info("Running cluster (SmallD v%s)...", __version__)
+
+        self.closed_event.clear()
+        self.processes = []
+        self.channels = []
+
+        gateway_bot = self.get_gateway_bot()
+        if self.closed:
+            return
+
+        gateway_bot = gateway_bot.to_native()
+        shard_count = self.shard_count or gateway_bot["shards"]
+        gateway_bot["shards"] = shard_count
+        max_concurrency = gateway_bot.get("session_start_limit", {}).get(
+            "max_concurrency", 1
+        )
+        workers = min(self.workers, shard_count)
+
+        logger.info(
+            "Starting %s shards in %s workers with max concurrency %s.",
+            shard_count,
+            workers,
+            max_concurrency,
+        )
+
+        self.coordinator = Coordinator(max_concurrency)
+        for shard_ids in split_shards(shard_count, workers):
+            self.start_worker(shard_ids, gateway_bot)
+
+        for process in self.processes:
+            process.join()
+            if process.exitcode:
+                logger.warning(
+                    "Worker %s exited with code %s", process.name, process.exitcode
+                )
+
+        self.closed_event.set()
+
+    def close(self):
+        self.closed_event.set()
+        for channel in self.channels:
+            try:
+                channel.send((None, "close"))
+            except (BrokenPipeError, OSError):
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if not self.closed:
+            self.close()
@@ -0,0 +1,107 @@
+import json
+
+from . import etf
+from .exceptions import SmallDError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JsonCodec:
+    name = "json"
+    encoding = "json"
+    decode_error = ValueError
+    available = True
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(value):
+        return json.dumps(value)
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+    available = orjson is not None
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+    @staticmethod
+    def dumps(value):
+        return orjson.dumps(value).decode("utf-8")
+
+
+class MsgspecCodec(JsonCodec):
+    name = "msgspec"
+    available = msgspec is not None
+
+    @staticmethod
+    def loads(data):
+        return msgspec.json.decode(data)
+
+    @staticmethod
+    def dumps(value):
+        return msgspec.json.encode(value).decode("utf-8")
+
+
+class UjsonCodec(JsonCodec):
+    name = "ujson"
+    available = ujson is not None
+
+    @staticmethod
+    def loads(data):
+        return ujson.loads(data)
+
+    @staticmethod
+    def dumps(value):
+        return ujson.dumps(value)
+
+
+class EtfCodec:
+    name = "etf"
+    encoding = "etf"
+    decode_error = etf.ETFError
+    available = True
+
+    loads = staticmethod(etf.unpack)
+    dumps = staticmethod(etf.pack)
+
+
+# in order of preference when picking a codec automatically
+JSON_CODECS = {
+    codec.name: codec for codec in (OrjsonCodec, MsgspecCodec, UjsonCodec, JsonCodec)
+}
+
+
+def get_json_codec(codec="auto"):
+    if not isinstance(codec, str):
+        return codec
+
+    if codec == "auto":
+        return next(codec for codec in JSON_CODECS.values() if codec.available)
+
+    try:
+        json_codec = JSON_CODECS[codec]
+    except KeyError:
+        raise SmallDError(f"Unknown json codec: {codec}") from None
+
+    if not json_codec.available:
+        raise SmallDError(f"Json codec {codec} is not installed")
+
+    return json_codec
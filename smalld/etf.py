@@ -0,0 +1,263 @@
+import struct
+import zlib
+
+from .exceptions import SmallDError
+
+FORMAT_VERSION = 131
+
+NEW_FLOAT_EXT = 70
+COMPRESSED = 80
+SMALL_INTEGER_EXT = 97
+INTEGER_EXT = 98
+FLOAT_EXT = 99
+ATOM_EXT = 100
+SMALL_TUPLE_EXT = 104
+LARGE_TUPLE_EXT = 105
+NIL_EXT = 106
+STRING_EXT = 107
+LIST_EXT = 108
+BINARY_EXT = 109
+SMALL_BIG_EXT = 110
+LARGE_BIG_EXT = 111
+SMALL_ATOM_EXT = 115
+MAP_EXT = 116
+ATOM_UTF8_EXT = 118
+SMALL_ATOM_UTF8_EXT = 119
+
+ATOMS = {"nil": None, "null": None, "true": True, "false": False}
+
+unpack_double = struct.Struct(">d").unpack_from
+unpack_int = struct.Struct(">i").unpack_from
+unpack_uint = struct.Struct(">I").unpack_from
+unpack_ushort = struct.Struct(">H").unpack_from
+
+
+class ETFError(SmallDError):
+    pass
+
+
+def unpack(data):
+    if not data or data[0] != FORMAT_VERSION:
+        raise ETFError("Unknown ETF format version")
+
+    try:
+        if data[1] == COMPRESSED:
+            (size,) = unpack_uint(data, 2)
+            data = bytes([FORMAT_VERSION]) + zlib.decompress(data[6:])
+            if len(data) != size + 1:
+                raise ETFError("Bad compressed term size")
+
+        value, _ = decode(data, 1)
+    except (IndexError, KeyError, struct.error, zlib.error) as e:
+        raise ETFError(f"Invalid ETF data: {e}") from None
+    return value
+
+
+def decode(data, pos):
+    return decoders[data[pos]](data, pos + 1)
+
+
+def decode_small_integer(data, pos):
+    return data[pos], pos + 1
+
+
+def decode_integer(data, pos):
+    return unpack_int(data, pos)[0], pos + 4
+
+
+def decode_new_float(data, pos):
+    return unpack_double(data, pos)[0], pos + 8
+
+
+def decode_float(data, pos):
+    return float(data[pos : pos + 31].split(b"\x00", 1)[0]), pos + 31
+
+
+def atom(name):
+    try:
+        return ATOMS[name]
+    except KeyError:
+        return name
+
+
+def decode_atom(data, pos):
+    (length,) = unpack_ushort(data, pos)
+    pos += 2
+    return atom(data[pos : pos + length].decode("latin-1")), pos + length
+
+
+def decode_small_atom(data, pos):
+    length = data[pos]
+    pos += 1
+    return atom(data[pos : pos + length].decode("latin-1")), pos + length
+
+
+def decode_atom_utf8(data, pos):
+    (length,) = unpack_ushort(data, pos)
+    pos += 2
+    return atom(data[pos : pos + length].decode("utf-8")), pos + length
+
+
+def decode_small_atom_utf8(data, pos):
+    length = data[pos]
+    pos += 1
+    return atom(data[pos : pos + length].decode("utf-8")), pos + length
+
+
+def decode_items(data, pos, length):
+    items = []
+    for _ in range(length):
+        item, pos = decoders[data[pos]](data, pos + 1)
+        items.append(item)
+    return items, pos
+
+
+def decode_small_tuple(data, pos):
+    return decode_items(data, pos + 1, data[pos])
+
+
+def decode_large_tuple(data, pos):
+    return decode_items(data, pos + 4, unpack_uint(data, pos)[0])
+
+
+def decode_nil(data, pos):
+    return [], pos
+
+
+def decode_string(data, pos):
+    (length,) = unpack_ushort(data, pos)
+    pos += 2
+    return list(data[pos : pos + length]), pos + length
+
+
+def decode_list(data, pos):
+    items, pos = decode_items(data, pos + 4, unpack_uint(data, pos)[0])
+    tail, pos = decode(data, pos)
+    if tail != []:
+        items.append(tail)
+    return items, pos
+
+
+def decode_binary(data, pos):
+    (length,) = unpack_uint(data, pos)
+    pos += 4
+    return data[pos : pos + length].decode("utf-8"), pos + length
+
+
+def decode_big(data, pos, length):
+    sign = data[pos]
+    pos += 1
+    value = int.from_bytes(data[pos : pos + length], "little")
+    return -value if sign else value, pos + length
+
+
+def decode_small_big(data, pos):
+    return decode_big(data, pos + 1, data[pos])
+
+
+def decode_large_big(data, pos):
+    return decode_big(data, pos + 4, unpack_uint(data, pos)[0])
+
+
+def decode_map(data, pos):
+    (arity,) = unpack_uint(data, pos)
+    pos += 4
+    result = {}
+    for _ in range(arity):
+        key, pos = decoders[data[pos]](data, pos + 1)
+        value, pos = decoders[data[pos]](data, pos + 1)
+        result[key] = value
+    return result, pos
+
+
+decoders = {
+    NEW_FLOAT_EXT: decode_new_float,
+    SMALL_INTEGER_EXT: decode_small_integer,
+    INTEGER_EXT: decode_integer,
+    FLOAT_EXT: decode_float,
+    ATOM_EXT: decode_atom,
+    SMALL_TUPLE_EXT: decode_small_tuple,
+    LARGE_TUPLE_EXT: decode_large_tuple,
+    NIL_EXT: decode_nil,
+    STRING_EXT: decode_string,
+    LIST_EXT: decode_list,
+    BINARY_EXT: decode_binary,
+    SMALL_BIG_EXT: decode_small_big,
+    LARGE_BIG_EXT: decode_large_big,
+    SMALL_ATOM_EXT: decode_small_atom,
+    MAP_EXT: decode_map,
+    ATOM_UTF8_EXT: decode_atom_utf8,
+    SMALL_ATOM_UTF8_EXT: decode_small_atom_utf8,
+}
+
+
+def pack(value):
+    buffer = bytearray([FORMAT_VERSION])
+    encode(value, buffer)
+    return bytes(buffer)
+
+
+def encode_atom(name, buffer):
+    name = name.encode("utf-8")
+    buffer.append(SMALL_ATOM_UTF8_EXT)
+    buffer.append(len(name))
+    buffer.extend(name)
+
+
+def encode_binary(value, buffer):
+    buffer.append(BINARY_EXT)
+    buffer.extend(struct.pack(">I", len(value)))
+    buffer.extend(value)
+
+
+def encode_int(value, buffer):
+    if 0 <= value <= 255:
+        buffer.append(SMALL_INTEGER_EXT)
+        buffer.append(value)
+    elif -(2 ** 31) <= value < 2 ** 31:
+        buffer.append(INTEGER_EXT)
+        buffer.extend(struct.pack(">i", value))
+    else:
+        magnitude = abs(value)
+        digits = magnitude.to_bytes((magnitude.bit_length() + 7) // 8, "little")
+        if len(digits) <= 255:
+            buffer.append(SMALL_BIG_EXT)
+            buffer.append(len(digits))
+        else:
+            buffer.append(LARGE_BIG_EXT)
+            buffer.extend(struct.pack(">I", len(digits)))
+        buffer.append(1 if value < 0 else 0)
+        buffer.extend(digits)
+
+
+def encode(value, buffer):
+    if value is None:
+        encode_atom("nil", buffer)
+    elif value is True:
+        encode_atom("true", buffer)
+    elif value is False:
+        encode_atom("false", buffer)
+    elif isinstance(value, int):
+        encode_int(value, buffer)
+    elif isinstance(value, float):
+        buffer.append(NEW_FLOAT_EXT)
+        buffer.extend(struct.pack(">d", value))
+    elif isinstance(value, str):
+        encode_binary(value.encode("utf-8"), buffer)
+    elif isinstance(value, (bytes, bytearray)):
+        encode_binary(value, buffer)
+    elif isinstance(value, dict):
+        buffer.append(MAP_EXT)
+        buffer.extend(struct.pack(">I", len(value)))
+        for key, item in value.items():
+            encode(key, buffer)
+            encode(item, buffer)
+    elif isinstance(value, (list, tuple)):
+        if value:
+            buffer.append(LIST_EXT)
+            buffer.extend(struct.pack(">I", len(value)))
+            for item in value:
+                encode(item, buffer)
+        buffer.append(NIL_EXT)
+    else:
+        raise ETFError(f"Can not encode {type(value).__name__} as ETF")
@@ -0,0 +1,77 @@
+import time
+from collections import abc
+from queue import Queue
+from threading import Lock, Thread
+
+from .logger import logger
+
+
+def partition_key(data):
+    t, d = data.get("t"), data.get("d")
+    if not isinstance(d, abc.Mapping):
+        return t
+
+    key = d.get("guild_id") or d.get("channel_id")
+    if not key and t and t.startswith("GUILD_"):
+        # GUILD_CREATE, GUILD_UPDATE and GUILD_DELETE are the guild itself
+        key = d.get("id")
+    return key or t
+
+
+class PartitionedExecutor:
+    def __init__(self, workers):
+        self.workers = workers
+        self.queues = []
+        self.threads = []
+        self.busy = []
+        self.started = None
+        self.lock = Lock()
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self.threads)
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+
+            self.queues = [Queue() for _ in range(self.workers)]
+            self.busy = [0.0] * self.workers
+            self.started = time.monotonic()
+            self.threads = [
+                Thread(target=self.run_worker, args=(idx,), daemon=True)
+                for idx in range(self.workers)
+            ]
+            for thread in self.threads:
+                thread.start()
+
+    def submit(self, key, func, *args):
+        self.queues[hash(key) % self.workers].put((func, args))
+
+    def run_worker(self, idx):
+        queue = self.queues[idx]
+        while True:
+            task = queue.get()
+            if task is None:
+                break
+
+            func, args = task
+            start = time.monotonic()
+            try:
+                func(*args)
+            except:
+                logger.warning("Exception in executor task", exc_info=True)
+            finally:
+                self.busy[idx] += time.monotonic() - start
+
+    def shutdown(self):
+        for queue in self.queues:
+            queue.put(None)
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return {
+            "queue_depth": [queue.qsize() for queue in self.queues],
+            "utilization": [busy / elapsed if elapsed else 0 for busy in self.busy],
+        }
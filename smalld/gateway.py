@@ -1,7 +1,9 @@
-import json
+import re
+import zlib
 
 from websocket import ABNF, WebSocket, WebSocketException
 
+from .codec import get_json_codec
 from .exceptions import NetworkError
 from .json_elements import JsonObject
 from .logger import logger, suppress_logging
@@ -29,19 +31,104 @@ class CloseReason:
         return CloseReason(reason=f"{type(e).__name__}: {e}")
 
 
+ZLIB_SUFFIX = b"\x00\x00\xff\xff"
+
+
+def with_query(url, compress=False, encoding="json"):
+    params = []
+    if encoding != "json":
+        params.append(f"encoding={encoding}")
+    if compress:
+        params.append("compress=zlib-stream")
+
+    if not params:
+        return url
+
+    separator = "&" if "?" in url else "?"
+    return url + separator + "&".join(params)
+
+
+class ZlibStreamInflater:
+    def __init__(self):
+        self.inflater = zlib.decompressobj()
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer.extend(data)
+        if not self.buffer.endswith(ZLIB_SUFFIX):
+            return None
+
+        inflated = self.inflater.decompress(self.buffer)
+        self.buffer = bytearray()
+        return inflated
+
+
+HEADER_FIELD = re.compile(rb'"(op|t|s)"\s*:\s*(?:"([^"]*)"|(\d+)|null)')
+DATA_FIELD = re.compile(rb'"d"\s*:')
+
+
+def peek(data):
+    """Reads op, t and s from a JSON payload without decoding d.
+
+    Only the fields before d are read. If any of op, t or s come after d, None is
+    returned and the payload must be fully decoded.
+    """
+    data_field = DATA_FIELD.search(data)
+    if not data_field:
+        return None
+
+    header = {}
+    for field in HEADER_FIELD.finditer(data, 0, data_field.start()):
+        key, string, number = field.groups()
+        if string is not None:
+            header[key.decode("utf-8")] = string.decode("utf-8")
+        elif number is not None:
+            header[key.decode("utf-8")] = int(number)
+        else:
+            header[key.decode("utf-8")] = None
+
+    if "op" not in header or "t" not in header or "s" not in header:
+        return None
+
+    return header
+
+
+def decode_payload(data, codec, skip=None):
+    """Decodes a payload, or only its header if skip returns True for its t."""
+    header = skip and peek(data)
+    if header and header["op"] == 0 and skip(header["t"]):
+        logger.debug("Gateway payload skipped: %s", header)
+        return JsonObject(header)
+
+    payload = codec.loads(data)
+    logger.debug("Gateway payload received: %s", payload)
+    return JsonObject(payload)
+
+
 class Gateway:
-    def __init__(self, url):
-        self.url = url
+    def __init__(
+        self, url, compress=False, codec=None, skip=None, metrics=None, recorder=None
+    ):
+        self.codec = codec or get_json_codec()
+        self.url = with_query(url, compress=compress, encoding=self.codec.encoding)
+        self.compress = compress
+        self.skip = skip if self.codec.encoding == "json" else None
         self.ws = WebSocket()
+        self.metrics = metrics
+        self.recorder = recorder
         self.close_reason = None
+        self.connect_failed = False
         self.limiter = GatewayRateLimiter()
 
     def __iter__(self):
+        inflater = ZlibStreamInflater() if self.compress else None
+
         try:
             self.ws.connect(self.url)
         except WebSocketError as e:
             logger.debug("Exception connecting to gateway.", exc_info=True)
             self.close_reason = CloseReason.exception(e)
+            self.connect_failed = True
 
         while self.ws.connected:
             try:
@@ -56,19 +143,29 @@ class Gateway:
                 self.close_reason = CloseReason.parse(data)
                 break
 
-            if data and opcode == ABNF.OPCODE_TEXT:
-                decoded_data = data.decode("utf-8")
-                logger.debug("Gateway payload received: %s", decoded_data)
-                yield JsonObject(json.loads(decoded_data))
+            if data and self.metrics is not None:
+                self.metrics.gateway_received_bytes.inc(amount=len(data))
+
+            if data and inflater and opcode == ABNF.OPCODE_BINARY:
+                data = inflater.feed(data)
+
+            if data and opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY):
+                if self.recorder is not None:
+                    self.recorder.record(data)
+
+                yield decode_payload(data, self.codec, self.skip)
 
         logger.info("Gateway Closed: %s", self.close_reason)
 
     def send(self, data):
         self.limiter.on_send()
-        payload = json.dumps(data)
-        logger.debug("Gateway payload sent: %s", payload)
+        payload = self.codec.dumps(data)
+        logger.debug("Gateway payload sent: %s", data)
         try:
-            self.ws.send(payload)
+            if isinstance(payload, bytes):
+                self.ws.send_binary(payload)
+            else:
+                self.ws.send(payload)
         except WebSocketError:
             logger.debug("Error sending payload.", exc_info=True)
             raise NetworkError
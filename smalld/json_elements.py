@@ -10,13 +10,26 @@ def wrap_value(value):
 
 
 class JsonObject(abc.Mapping):
-    __slots__ = ("__data",)
+    __slots__ = ("__data", "__children")
 
     def __init__(self, data):
         self.__data = data
+        self.__children = None
 
     def __getitem__(self, key):
-        return wrap_value(self.__data[key])
+        value = self.__data[key]
+        if not isinstance(value, (dict, list)):
+            return value
+
+        children = self.__children
+        if children is None:
+            children = self.__children = {}
+
+        try:
+            return children[key]
+        except KeyError:
+            child = children[key] = wrap_value(value)
+            return child
 
     def __iter__(self):
         return iter(self.__data)
@@ -35,18 +48,52 @@ class JsonObject(abc.Mapping):
     def __repr__(self):
         return f"<JsonObject {self.__data}>"
 
+    def to_native(self):
+        return self.__data
+
 
 class JsonArray(abc.Sequence):
-    __slots__ = ("__data",)
+    __slots__ = ("__data", "__children")
 
     def __init__(self, data):
         self.__data = data
+        self.__children = None
 
     def __getitem__(self, index):
-        return wrap_value(self.__data[index])
+        if isinstance(index, slice):
+            return JsonArray(self.__data[index])
+
+        value = self.__data[index]
+        if not isinstance(value, (dict, list)):
+            return value
+
+        if self.__children is None:
+            self.__children = [None] * len(self.__data)
+
+        child = self.__children[index]
+        if child is None:
+            child = self.__children[index] = wrap_value(value)
+        return child
+
+    def __iter__(self):
+        if self.__children is None:
+            self.__children = [None] * len(self.__data)
+        children = self.__children
+
+        for index, value in enumerate(self.__data):
+            if isinstance(value, (dict, list)):
+                child = children[index]
+                if child is None:
+                    child = children[index] = wrap_value(value)
+                yield child
+            else:
+                yield value
 
     def __len__(self):
         return len(self.__data)
 
     def __repr__(self):
         return f"<JsonArray {self.__data}>"
+
+    def to_native(self):
+        return self.__data
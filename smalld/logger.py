@@ -7,7 +7,8 @@ redactions = []
 
 
 def redact_from_logging(to_redact):
-    redactions.append(to_redact)
+    if to_redact not in redactions:
+        redactions.append(to_redact)
 
 
 def redact_from(s):
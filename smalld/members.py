@@ -0,0 +1,132 @@
+import time
+import uuid
+from queue import Empty, Queue
+from threading import Lock, current_thread
+
+from .exceptions import RateLimitError, SmallDError
+from .json_elements import wrap_value
+from .ratelimit import GatewayRateLimiter, WaitQueue
+
+OP_REQUEST_GUILD_MEMBERS = 8
+
+# of the 120 payloads a connection may send each minute, leave some for
+# heartbeats, presence updates and anything else the bot sends
+DEFAULT_BUDGET = 100
+
+
+class MemberChunks:
+    """The members of one request, yielded as their chunks arrive."""
+
+    def __init__(self, nonce, timeout, requests, connection):
+        self.nonce = nonce
+        self.timeout = timeout
+        self.requests = requests
+        self.connection = connection
+        self.chunks = Queue()
+        self.not_found = []
+
+    def __iter__(self):
+        # the chunks are read by the gateway thread, so it can't wait for them
+        if current_thread() is self.connection.gateway_thread:
+            self.requests.pop(self.nonce, None)
+            raise SmallDError(
+                "Guild members can't be iterated on the gateway thread that reads them"
+            )
+
+        while True:
+            try:
+                chunk = self.chunks.get(timeout=self.timeout)
+            except Empty:
+                self.requests.pop(self.nonce, None)
+                raise SmallDError(
+                    f"Timed out waiting for guild members ({self.nonce})"
+                ) from None
+
+            self.not_found.extend(chunk.get("not_found", ()))
+            for member in chunk["members"]:
+                yield wrap_value(member)
+
+            if chunk["chunk_index"] >= chunk["chunk_count"] - 1:
+                return
+
+
+class GuildMemberRequests:
+    """Requests guild members over the gateway (op 8).
+
+    Responses are matched to requests by nonce, so any number of requests may be
+    in flight at once. Sends are limited to budget per minute on each gateway
+    connection, waiting in turn when it is used up.
+    """
+
+    def __init__(self, smalld, budget=DEFAULT_BUDGET, timeout=30):
+        self.smalld = smalld
+        self.budget = budget
+        self.timeout = timeout
+        # nonce to MemberChunks mapping, for requests that are not complete
+        self.requests = {}
+        # gateway connection to (GatewayRateLimiter, WaitQueue) mapping
+        self.limiters = {}
+        self.lock = Lock()
+
+        smalld.on_dispatch(self.on_members_chunk, t="GUILD_MEMBERS_CHUNK", inline=True)
+
+    def request(self, guild_id, query="", limit=0, user_ids=None, presences=False):
+        nonce = uuid.uuid4().hex
+        chunks = self.requests[nonce] = MemberChunks(
+            nonce, self.timeout, self.requests, self.connection_for(guild_id)
+        )
+
+        d = {"guild_id": guild_id, "limit": limit, "presences": presences}
+        if user_ids:
+            d["user_ids"] = user_ids
+        else:
+            d["query"] = query
+        d["nonce"] = nonce
+
+        try:
+            self.send(guild_id, {"op": OP_REQUEST_GUILD_MEMBERS, "d": d})
+        except:
+            del self.requests[nonce]
+            raise
+
+        return chunks
+
+    def connection_for(self, guild_id):
+        # each shard of an AutoShardedSmallD has its own connection, and budget
+        shard_for = getattr(self.smalld, "shard_for", None)
+        return shard_for(guild_id) if shard_for else self.smalld
+
+    def limiter_for(self, guild_id):
+        connection = self.connection_for(guild_id)
+
+        with self.lock:
+            try:
+                return self.limiters[connection]
+            except KeyError:
+                limiter = self.limiters[connection] = (
+                    GatewayRateLimiter(self.budget),
+                    WaitQueue(),
+                )
+                return limiter
+
+    def send(self, guild_id, payload):
+        limiter, queue = self.limiter_for(guild_id)
+        with queue:
+            while True:
+                try:
+                    limiter.on_send()
+                    break
+                except RateLimitError as e:
+                    time.sleep(max(e.reset - time.time(), 0))
+
+        self.smalld.send_gateway_payload(payload)
+
+    def on_members_chunk(self, data):
+        nonce = data.get("nonce")
+        chunks = self.requests.get(nonce)
+        if chunks is None:
+            return
+
+        if data.chunk_index >= data.chunk_count - 1:
+            self.requests.pop(nonce, None)
+        chunks.chunks.put(data.to_native())
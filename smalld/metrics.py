@@ -0,0 +1,277 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+
+from .ratelimit import get_resource
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# path segments masked in route labels, by the segment one or two before them.
+# These are masked even when the path matches no rate limit resource.
+TOKEN_PARENTS = {"webhooks": "{webhook.token}", "interactions": "{interaction.token}"}
+CODE_PARENTS = {
+    "invites": "{invite.code}",
+    "reactions": "{emoji}",
+    "templates": "{template.code}",
+}
+
+
+def route_label(method, path):
+    """The method and rate limit resource of path, with ids, tokens and codes masked."""
+    segments = get_resource(path).split("/")
+    for idx, segment in enumerate(segments):
+        if segment.isdigit():
+            segments[idx] = "{}"
+        elif idx >= 2 and segments[idx - 2] in TOKEN_PARENTS:
+            segments[idx] = TOKEN_PARENTS[segments[idx - 2]]
+        elif idx >= 1 and segments[idx - 1] in CODE_PARENTS:
+            segments[idx] = CODE_PARENTS[segments[idx - 1]]
+    return f"{method} {'/'.join(segments)}"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = Lock()
+        # label values to count mapping
+        self.values = {} if self.labels else {(): 0}
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        return self.values.get(label_values, 0)
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+
+        for label_values, value in sorted(values):
+            yield self.name, format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = Lock()
+        # label values to [per bucket counts, sum, count] mapping
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            try:
+                counts = self.values[label_values]
+            except KeyError:
+                counts = self.values[label_values] = [[0] * len(self.buckets), 0, 0]
+
+            if index < len(self.buckets):
+                counts[0][index] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def count(self, *label_values):
+        return self.values.get(label_values, (None, 0, 0))[2]
+
+    def samples(self):
+        # the counts are updated in place, so they are copied too
+        with self.lock:
+            values = [
+                (label_values, (list(counts), total, count))
+                for label_values, (counts, total, count) in self.values.items()
+            ]
+
+        for label_values, (counts, total, count) in sorted(values):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(
+                    self.labels, label_values, [("le", format_value(float(bound)))]
+                )
+                yield f"{self.name}_bucket", labels, cumulative
+
+            labels = format_labels(self.labels, label_values, [("le", "+Inf")])
+            yield f"{self.name}_bucket", labels, count
+
+            labels = format_labels(self.labels, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def exposition(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9100, host="127.0.0.1"):
+        """Serves the exposition over HTTP from a daemon thread.
+
+        Returns the server, which can be stopped with shutdown().
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.exposition().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class Metrics(Registry):
+    """The metrics recorded by SmallD when given as its metrics argument.
+
+    REST metrics are labelled by route, the method and path with ids replaced by
+    {} (e.g., GET channels/{}/messages), and gateway metrics by event type.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rest_requests = self.counter(
+            "smalld_rest_requests_total",
+            "REST requests, by route and response status.",
+            ("route", "status"),
+        )
+        self.rest_duration = self.histogram(
+            "smalld_rest_request_duration_seconds",
+            "REST request latency, by route.",
+            ("route",),
+        )
+        self.rest_ratelimited = self.counter(
+            "smalld_rest_ratelimited_total",
+            "REST responses with status 429, by route and scope.",
+            ("route", "scope"),
+        )
+        self.ratelimit_waits = self.counter(
+            "smalld_ratelimit_waits_total",
+            "Requests delayed by a rate limit, by scope.",
+            ("scope",),
+        )
+        self.ratelimit_wait_seconds = self.counter(
+            "smalld_ratelimit_wait_seconds_total",
+            "Time requests spent delayed by a rate limit, by scope.",
+            ("scope",),
+        )
+        self.gateway_connections = self.counter(
+            "smalld_gateway_connections_total", "Gateway connections attempted."
+        )
+        self.gateway_reconnects = self.counter(
+            "smalld_gateway_reconnects_total",
+            "Gateway connections attempted after the first.",
+        )
+        self.gateway_downtime = self.histogram(
+            "smalld_gateway_downtime_seconds",
+            "Time from a gateway closing to a session being ready or resumed again.",
+            buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+        )
+        self.gateway_closes = self.counter(
+            "smalld_gateway_closes_total", "Gateway closures, by code.", ("code",)
+        )
+        self.gateway_received_bytes = self.counter(
+            "smalld_gateway_received_bytes_total",
+            "Bytes received from the gateway, before decompression.",
+        )
+        self.gateway_events = self.counter(
+            "smalld_gateway_events_total",
+            "Gateway payloads received, by op and event type.",
+            ("op", "t"),
+        )
+        self.notify_duration = self.histogram(
+            "smalld_notify_listeners_seconds",
+            "Time spent notifying listeners of a payload, by event type.",
+            ("t",),
+        )
+        self.heartbeat_ack = self.histogram(
+            "smalld_heartbeat_ack_seconds", "Heartbeat to heartbeat ack round trip."
+        )
+        self.heartbeat_missed_acks = self.counter(
+            "smalld_heartbeat_missed_acks_total", "Heartbeats that were not acked."
+        )
+
+    def on_connect(self, previous_connections):
+        self.gateway_connections.inc()
+        if previous_connections:
+            self.gateway_reconnects.inc()
+
+    def on_rest_response(self, method, path, status, duration):
+        route = route_label(method, path)
+        self.rest_requests.inc(route, str(status))
+        self.rest_duration.observe(duration, route)
+
+    def on_ratelimited(self, method, path, is_global):
+        route = route_label(method, path)
+        self.rest_ratelimited.inc(route, "global" if is_global else "bucket")
+
+    def on_ratelimit_wait(self, error, delay):
+        scope = "global" if error.is_global else "bucket"
+        self.ratelimit_waits.inc(scope)
+        self.ratelimit_wait_seconds.inc(scope, amount=delay)
+
+    def on_payload(self, data, duration):
+        t = data.get("t") or ""
+        self.gateway_events.inc(str(data.get("op")), t)
+        self.notify_duration.observe(duration, t)
+
+    def on_gateway_close(self, reason):
+        self.gateway_closes.inc(str(reason.code) if reason and reason.code else "")
@@ -0,0 +1,95 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import path_template
+from .json_elements import wrap_value
+
+
+def item_id(item):
+    return item["id"]
+
+
+def user_id(item):
+    return item["user"]["id"]
+
+
+class Pagination:
+    def __init__(self, limit=100, direction="after", cursor=item_id, items=None):
+        self.limit = limit
+        self.direction = direction
+        self.cursor = cursor
+        self.items = items
+
+    def page_params(self, params, cursor):
+        return {**params, self.direction: cursor} if cursor else params
+
+    def page_items(self, content):
+        return self.items(content) if self.items else content
+
+    def next_cursor(self, page):
+        ids = [int(self.cursor(item)) for item in page]
+        return str(min(ids) if self.direction == "before" else max(ids))
+
+
+# path template (see path_template) to how that resource is paged
+PAGINATIONS = {
+    "channels/{}/messages": Pagination(100, "before"),
+    "channels/{}/threads/archived/public": Pagination(100, "before"),
+    "guilds/{}/members": Pagination(1000, "after", user_id),
+    "guilds/{}/bans": Pagination(1000, "after", user_id),
+    "guilds/{}/audit-logs": Pagination(
+        100, "before", items=lambda content: content["audit_log_entries"]
+    ),
+    "users/@me/guilds": Pagination(200, "after"),
+}
+
+
+def get_pagination(path, limit=None, direction=None, cursor=None, items=None):
+    default = PAGINATIONS.get(path_template(path), Pagination())
+    return Pagination(
+        limit or default.limit,
+        direction or default.direction,
+        cursor or default.cursor,
+        items or default.items,
+    )
+
+
+def has_remaining(limiter, path):
+    bucket = limiter.get_bucket("GET", path)
+    remaining = getattr(bucket, "remaining", None)
+    return remaining is None or remaining > 0 or time.time() >= bucket.reset
+
+
+def paginate(http, path, params=None, prefetch=True, **kwargs):
+    """Yields the items of a list resource, requesting a page at a time.
+
+    While a page is being consumed, the next one is requested in the background,
+    unless the resource's rate limit bucket has no requests remaining.
+    """
+    pagination = get_pagination(path, **kwargs)
+    params = {**(params or {}), "limit": pagination.limit}
+
+    def fetch(cursor):
+        content = http.get(path, params=pagination.page_params(params, cursor))
+        return pagination.page_items(content.to_native())
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        page = fetch(params.get(pagination.direction))
+        while page:
+            next_page = None
+            if len(page) >= pagination.limit:
+                cursor = pagination.next_cursor(page)
+                if prefetch and has_remaining(http.limiter, path):
+                    next_page = pool.submit(fetch, cursor)
+                else:
+                    next_page = cursor
+
+            for item in page:
+                yield wrap_value(item)
+
+            if next_page is None:
+                return
+            elif isinstance(next_page, str):
+                page = fetch(next_page)
+            else:
+                page = next_page.result()
@@ -0,0 +1,151 @@
+import sys
+import time
+import traceback
+from collections import deque
+from itertools import count
+from threading import Lock, Thread, get_ident
+
+from .logger import logger
+
+
+def listener_name(listener):
+    listener = getattr(listener, "__wrapped__", listener)
+    qualname = getattr(listener, "__qualname__", None)
+    if qualname is None:
+        return repr(listener)
+    return f"{listener.__module__}.{qualname}"
+
+
+def percentile(durations, p):
+    if not durations:
+        return 0.0
+    ordered = sorted(durations)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class ListenerStats:
+    __slots__ = ("count", "total", "max", "recent")
+
+    def __init__(self, samples):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=samples)
+
+    def record(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.recent.append(duration)
+
+
+class ListenerProfiler:
+    """Times listener calls, by listener and event type.
+
+    The p99 is of the last samples calls. If slow_threshold is given, a watchdog
+    thread logs a stack sample of any listener that runs longer than it.
+    """
+
+    def __init__(self, slow_threshold=None, samples=1000):
+        self.slow_threshold = slow_threshold
+        self.samples = samples
+        self.lock = Lock()
+        # (listener name, t) to ListenerStats mapping
+        self.listeners = {}
+        # call id to (thread id, listener name, t, start) mapping, for the watchdog
+        self.running = {}
+        self.call_ids = count()
+        self.watchdog = None
+
+    def start(self, listener, data):
+        name, t = listener_name(listener), data.get("t")
+        call_id = next(self.call_ids)
+        if self.slow_threshold is not None:
+            with self.lock:
+                self.running[call_id] = (get_ident(), name, t, time.monotonic())
+                self.start_watchdog()
+        return call_id, name, t, time.perf_counter()
+
+    def stop(self, call):
+        call_id, name, t, start = call
+        duration = time.perf_counter() - start
+
+        with self.lock:
+            self.running.pop(call_id, None)
+            try:
+                stats = self.listeners[(name, t)]
+            except KeyError:
+                stats = self.listeners[(name, t)] = ListenerStats(self.samples)
+            stats.record(duration)
+
+    def call(self, listener, data):
+        call = self.start(listener, data)
+        try:
+            return listener(data)
+        finally:
+            self.stop(call)
+
+    def start_watchdog(self):
+        # called with the lock held, as is the check for running calls before the
+        # watchdog exits, so a call is never left without a watchdog
+        if self.watchdog is None:
+            self.watchdog = Thread(target=self.run_watchdog, daemon=True)
+            self.watchdog.start()
+
+    def run_watchdog(self):
+        reported = set()
+        while True:
+            time.sleep(self.slow_threshold / 2)
+
+            # stop when idle, start_watchdog starts another for the next call
+            with self.lock:
+                if not self.running:
+                    self.watchdog = None
+                    return
+
+                running = list(self.running.items())
+
+            now = time.monotonic()
+            for call_id, (thread_id, name, t, start) in running:
+                if call_id in reported or now - start < self.slow_threshold:
+                    continue
+
+                reported.add(call_id)
+                frame = sys._current_frames().get(thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame else ""
+                logger.warning(
+                    "Slow listener %s (%s) running for %s seconds:\n%s",
+                    name,
+                    t,
+                    round(now - start, 2),
+                    stack,
+                )
+
+            reported.intersection_update(call_id for call_id, _ in running)
+
+    def stats(self):
+        with self.lock:
+            stats = [
+                {
+                    "listener": name,
+                    "t": t,
+                    "count": s.count,
+                    "total": s.total,
+                    "p99": percentile(s.recent, 0.99),
+                    "max": s.max,
+                }
+                for (name, t), s in self.listeners.items()
+            ]
+
+        return sorted(stats, key=lambda s: s["total"], reverse=True)
+
+    def report(self):
+        lines = [
+            f"{'listener':<50} {'t':<24} {'count':>8} {'total s':>10} {'p99 ms':>8}"
+        ]
+        for s in self.stats():
+            lines.append(
+                f"{s['listener']:<50} {s['t'] or '':<24} {s['count']:>8}"
+                f" {s['total']:>10.3f} {s['p99'] * 1000:>8.2f}"
+            )
+        return "\n".join(lines)
@@ -1,14 +1,165 @@
+import json
+import os
 import re
 import time
 from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
 from math import ceil
+from threading import Event, Lock
 
 from pkg_resources import resource_string
 
-from .exceptions import RateLimitError
+from .exceptions import RateLimitError, SmallDError
+from .logger import logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_MAX_WAIT = 60
+
+
+class WaitQueue:
+    def __init__(self):
+        self.lock = Lock()
+        self.waiters = deque()
+
+    def __enter__(self):
+        turn = Event()
+        with self.lock:
+            self.waiters.append(turn)
+            if len(self.waiters) == 1:
+                turn.set()
+        turn.wait()
+
+    def __exit__(self, *args):
+        with self.lock:
+            self.waiters.popleft()
+            if self.waiters:
+                self.waiters[0].set()
+
+
+class MemoryBucketStore:
+    """Keeps rate limit state in memory, shared by the threads of one process."""
+
+    def __init__(self):
+        self.lock = Lock()
+        # bucket id to (remaining, reset) mapping
+        self.buckets = {}
+        # route ("METHOD resource") to bucket id mapping
+        self.routes = {}
+
+    def get(self, bucket_id):
+        return self.buckets.get(bucket_id, (None, None))
+
+    def take(self, bucket_id):
+        with self.lock:
+            remaining, reset = self.get(bucket_id)
+            if remaining is None:
+                return None
+            if remaining <= 0 and time.time() < reset:
+                return reset
+            self.buckets[bucket_id] = (remaining - 1, reset)
+
+    def update(self, bucket_id, remaining, reset):
+        with self.lock:
+            self.buckets[bucket_id] = (remaining, reset)
+
+    def get_route(self, route):
+        return self.routes.get(route)
+
+    def set_route(self, route, bucket_id):
+        self.routes[route] = bucket_id
+
+
+class FileBucketStore:
+    """Keeps rate limit state in a file, shared by every process using the same path.
+
+    Each access holds a lock on the file, so it is only available where fcntl is
+    (i.e., not on Windows). The file is only rewritten when the state changes.
+    """
+
+    def __init__(self, path):
+        if fcntl is None:
+            raise SmallDError("FileBucketStore requires fcntl")
+
+        self.path = path
+        self.lock = Lock()
+        self.file = None
+        self.pid = None
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    @contextmanager
+    def state(self, write=False):
+        with self.lock:
+            # a file opened before a fork shares its lock with the parent
+            if self.pid != os.getpid():
+                self.file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT), "r+b")
+                self.pid = os.getpid()
+
+            fcntl.flock(self.file, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            try:
+                self.file.seek(0)
+                content = self.file.read()
+                state = (
+                    json.loads(content) if content else {"buckets": {}, "routes": {}}
+                )
+
+                yield state
+
+                if write:
+                    # most takes change nothing, so the file is rewritten only if needed
+                    updated = json.dumps(state).encode("utf-8")
+                    if updated != content:
+                        self.file.seek(0)
+                        self.file.truncate()
+                        self.file.write(updated)
+                        self.file.flush()
+            finally:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+
+    def get(self, bucket_id):
+        with self.state() as state:
+            return tuple(state["buckets"].get(bucket_id, (None, None)))
+
+    def take(self, bucket_id):
+        with self.state(write=True) as state:
+            remaining, reset = state["buckets"].get(bucket_id, (None, None))
+            if remaining is None:
+                return None
+            if remaining <= 0 and time.time() < reset:
+                return reset
+            state["buckets"][bucket_id] = (remaining - 1, reset)
+
+    def update(self, bucket_id, remaining, reset):
+        with self.state(write=True) as state:
+            state["buckets"][bucket_id] = (remaining, reset)
+
+    def get_route(self, route):
+        with self.state() as state:
+            return state["routes"].get(route)
+
+    def set_route(self, route, bucket_id):
+        with self.state(write=True) as state:
+            state["routes"][route] = bucket_id
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            self.pid = None
 
 
 class NoRateLimitBucket:
+    reset = None
+
     def take(self):
         return
 
@@ -17,56 +168,125 @@ class NoRateLimitBucket:
 
 
 class ResourceRateLimitBucket:
-    def __init__(self, bucket_id):
+    def __init__(self, bucket_id, store=None):
         self.bucket_id = bucket_id
-        self.remaining = None
-        self.reset = None
+        self.store = store or MemoryBucketStore()
+        self.queue = WaitQueue()
+
+    @property
+    def remaining(self):
+        return self.store.get(self.bucket_id)[0]
+
+    @property
+    def reset(self):
+        return self.store.get(self.bucket_id)[1]
 
     def take(self):
-        if (
-            self.remaining is not None
-            and self.remaining <= 0
-            and time.time() < self.reset
-        ):
-            raise RateLimitError(self.reset)
-        self.remaining -= 1
+        reset = self.store.take(self.bucket_id)
+        if reset is not None:
+            raise RateLimitError(reset)
 
     def update(self, values):
-        self.remaining = float(values["X-RateLimit-Remaining"])
-        self.reset = float(values["X-RateLimit-Reset"])
+        self.store.update(
+            self.bucket_id,
+            float(values["X-RateLimit-Remaining"]),
+            float(values["X-RateLimit-Reset"]),
+        )
+
+
+def is_retry_after_in_ms(base_url):
+    """Whether Retry-After is in milliseconds, as it was before API v8."""
+    version = re.search(r"/v(\d+)", base_url or "")
+    return version is not None and int(version.group(1)) < 8
 
 
 class GlobalRateLimitBucket:
-    def __init__(self):
-        self.is_ratelimited = False
-        self.reset = None
+    bucket_id = "global"
+
+    def __init__(self, store=None, retry_after_in_ms=False):
+        self.store = store or MemoryBucketStore()
+        self.retry_after_in_ms = retry_after_in_ms
+        self.queue = WaitQueue()
+
+    @property
+    def is_ratelimited(self):
+        remaining = self.store.get(self.bucket_id)[0]
+        return remaining is not None and remaining <= 0
+
+    @property
+    def reset(self):
+        return self.store.get(self.bucket_id)[1]
 
     def take(self):
-        if self.is_ratelimited and time.time() < self.reset:
-            raise RateLimitError(self.reset, is_global=True)
+        reset = self.store.take(self.bucket_id)
+        if reset is not None:
+            raise RateLimitError(reset, is_global=True)
 
     def update(self, values):
-        self.is_ratelimited = (
-            values.get("X-RateLimit-Global", "false").lower() == "true"
-        )
-        if self.is_ratelimited:
-            retry_after = ceil(float(values.get("Retry-After", 0)) / 1000)
-            self.reset = time.time() + retry_after
+        is_ratelimited = values.get("X-RateLimit-Global", "false").lower() == "true"
+        if is_ratelimited:
+            retry_after = float(values.get("Retry-After", 0))
+            if self.retry_after_in_ms:
+                retry_after /= 1000
+            self.store.update(self.bucket_id, 0, time.time() + ceil(retry_after))
+        else:
+            self.store.update(self.bucket_id, None, self.reset)
 
 
 class RateLimiter:
     no_ratelimit_bucket = NoRateLimitBucket()
 
-    def __init__(self):
+    def __init__(
+        self,
+        blocking=False,
+        max_wait=DEFAULT_MAX_WAIT,
+        store=None,
+        metrics=None,
+        retry_after_in_ms=False,
+    ):
+        self.blocking = blocking
+        self.max_wait = max_wait
+        self.metrics = metrics
+        self.store = store or MemoryBucketStore()
         # bucket id to bucket mapping
         self.buckets = {}
         # resource to bucket mapping
         self.resource_buckets = {}
-        self.global_bucket = GlobalRateLimitBucket()
+        self.global_bucket = GlobalRateLimitBucket(self.store, retry_after_in_ms)
 
     def on_request(self, method, path):
-        self.global_bucket.take()
-        self.get_bucket(method, path).take()
+        self.take(self.global_bucket)
+        self.take(self.get_bucket(method, path))
+
+    def take(self, bucket):
+        if not self.blocking or bucket is self.no_ratelimit_bucket:
+            bucket.take()
+            return
+
+        with bucket.queue:
+            while True:
+                try:
+                    bucket.take()
+                    return
+                except RateLimitError as e:
+                    self.wait(e)
+
+    def wait(self, error):
+        time.sleep(self.delay_for(error))
+
+    def delay_for(self, error):
+        if not self.blocking or error.reset is None:
+            raise error
+
+        delay = error.reset - time.time()
+        if delay > self.max_wait:
+            raise error
+
+        logger.debug("Rate limited. Waiting %s seconds...", round(delay, 2))
+        delay = max(delay, 0)
+        if self.metrics is not None:
+            self.metrics.on_ratelimit_wait(error, delay)
+        return delay
 
     def on_response(self, method, path, headers, status_code):
         bucket = None
@@ -78,7 +298,13 @@ class RateLimiter:
         bucket.update(headers)
 
         if status_code == 429:
-            raise RateLimitError(bucket.reset, is_global=bucket is self.global_bucket)
+            reset_after = headers.get("X-RateLimit-Reset-After")
+            reset = time.time() + float(reset_after) if reset_after else bucket.reset
+            if self.metrics is not None:
+                self.metrics.on_ratelimited(
+                    method, path, is_global=bucket is self.global_bucket
+                )
+            raise RateLimitError(reset, is_global=bucket is self.global_bucket)
 
     def get_bucket(self, method, path, bucket_id=None):
         resource = get_resource(path)
@@ -90,13 +316,21 @@ class RateLimiter:
         except KeyError:
             pass
 
-        if not bucket_id:
-            return self.no_ratelimit_bucket
+        # the store may know the bucket from a response seen by another process
+        route = f"{method} {resource}"
+        if bucket_id:
+            self.store.set_route(route, bucket_id)
+        else:
+            bucket_id = self.store.get_route(route)
+            if not bucket_id:
+                return self.no_ratelimit_bucket
 
         try:
             bucket = self.buckets[bucket_id]
         except KeyError:
-            bucket = self.buckets[bucket_id] = ResourceRateLimitBucket(bucket_id)
+            bucket = self.buckets[bucket_id] = ResourceRateLimitBucket(
+                bucket_id, self.store
+            )
         self.resource_buckets[key] = bucket
         return bucket
 
@@ -105,19 +339,41 @@ class GatewayRateLimiter:
     MAX_EVENTS = 120
     RESET_INTERVAL = 60
 
-    def __init__(self):
-        self.window = deque(maxlen=self.MAX_EVENTS)
+    def __init__(self, max_events=MAX_EVENTS, reset_interval=RESET_INTERVAL):
+        self.max_events = max_events
+        self.reset_interval = reset_interval
+        self.window = deque(maxlen=max_events)
 
     def on_send(self):
         current_time = time.time()
         if (
-            len(self.window) == self.MAX_EVENTS
-            and current_time - self.window[0] < self.RESET_INTERVAL
+            len(self.window) == self.max_events
+            and current_time - self.window[0] < self.reset_interval
         ):
-            raise RateLimitError(self.window[0] + self.RESET_INTERVAL)
+            raise RateLimitError(self.window[0] + self.reset_interval)
         self.window.append(current_time)
 
 
+class IdentifyRateLimiter:
+    IDENTIFY_INTERVAL = 5
+
+    def __init__(self, max_concurrency=1):
+        self.max_concurrency = max_concurrency
+        self.locks = [Lock() for _ in range(max_concurrency)]
+        self.last_identify = [None] * max_concurrency
+
+    def on_identify(self, shard_id):
+        key = shard_id % self.max_concurrency
+        with self.locks[key]:
+            last_identify = self.last_identify[key]
+            if last_identify is not None:
+                delay = last_identify + self.IDENTIFY_INTERVAL - time.monotonic()
+                if delay > 0:
+                    logger.debug("Waiting %s seconds to identify...", round(delay, 2))
+                    time.sleep(delay)
+            self.last_identify[key] = time.monotonic()
+
+
 def extract_patterns(mappings):
     resources_patterns = []
 
@@ -133,15 +389,83 @@ def extract_patterns(mappings):
     return resources_patterns
 
 
+LITERAL_SEGMENT = re.compile(r"[\w@.-]+")
+TEMPLATE_GROUP = re.compile(r"\\(\d+)")
+
+
+class ResourceNode:
+    __slots__ = ("literals", "patterns", "resource")
+
+    def __init__(self):
+        self.literals = {}
+        self.patterns = []
+        self.resource = None
+
+
+class ResourceTrie:
+    def __init__(self, resources_patterns):
+        self.root = ResourceNode()
+        for priority, (pattern, template) in enumerate(resources_patterns):
+            self.add(priority, pattern.pattern, template)
+
+    def add(self, priority, pattern, template):
+        node = self.root
+        for segment in pattern.split("/"):
+            if LITERAL_SEGMENT.fullmatch(segment):
+                node = node.literals.setdefault(segment, ResourceNode())
+                continue
+
+            for segment_pattern, child in node.patterns:
+                if segment_pattern.pattern == segment:
+                    node = child
+                    break
+            else:
+                child = ResourceNode()
+                node.patterns.append((re.compile(segment), child))
+                node = child
+
+        if node.resource is None:
+            node.resource = (priority, TEMPLATE_GROUP.split(template))
+
+    def match(self, path):
+        segments = path.split("/")
+        best = None
+
+        stack = [(self.root, 0, ())]
+        while stack:
+            node, depth, groups = stack.pop()
+
+            if depth == len(segments):
+                if node.resource and (best is None or node.resource[0] < best[0][0]):
+                    best = (node.resource, groups)
+                continue
+
+            segment = segments[depth]
+            child = node.literals.get(segment)
+            if child:
+                stack.append((child, depth + 1, groups))
+
+            for segment_pattern, child in node.patterns:
+                match = segment_pattern.fullmatch(segment)
+                if match:
+                    stack.append((child, depth + 1, groups + match.groups()))
+
+        if best is None:
+            return None
+
+        (_, parts), groups = best
+        return "".join(
+            part if idx % 2 == 0 else groups[int(part) - 1]
+            for idx, part in enumerate(parts)
+        )
+
+
 mappings = resource_string("smalld.resources", "ratelimit_buckets").decode("utf-8")
 mappings = extract_patterns(mappings.split("\n"))
+resources = ResourceTrie(mappings)
 
 
+@lru_cache(maxsize=4096)
 def get_resource(path):
     path = path.strip().strip("/")
-    for (pattern, template) in mappings:
-        match = pattern.fullmatch(path)
-        if not match:
-            continue
-        return match.expand(template)
-    return path
+    return resources.match(path) or path
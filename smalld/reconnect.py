@@ -0,0 +1,85 @@
+import random
+import time
+
+from .logger import logger
+
+MIN_SECONDS_BETWEEN_CONNECTIONS = 120
+
+# close codes after which a session can not be resumed
+SESSION_INVALIDATING_CODES = {4007, 4009}
+
+
+class ReconnectPolicy:
+    """Decides how long to wait before reconnecting to the gateway.
+
+    The first reconnect after a session was established (READY or RESUMED) is
+    immediate. Further attempts that fail to establish one back off exponentially
+    from base_delay up to max_delay, with jitter. A connection that will identify,
+    rather than resume, also waits until identify_interval seconds have passed since
+    the last identify, so a failing bot does not use up its session starts.
+    """
+
+    def __init__(
+        self,
+        base_delay=1,
+        max_delay=60,
+        identify_interval=MIN_SECONDS_BETWEEN_CONNECTIONS,
+    ):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.identify_interval = identify_interval
+        self.metrics = None
+        self.failures = 0
+        self.established = False
+        self.has_session = False
+        self.last_identify = None
+        self.closed_at = None
+        # seconds between the last close and the session being established again
+        self.last_downtime = None
+
+    def listen(self, smalld):
+        self.metrics = smalld.metrics
+        smalld.on_dispatch(self.on_ready, t="READY", inline=True)
+        smalld.on_dispatch(self.on_resumed, t="RESUMED", inline=True)
+
+    def on_ready(self, data):
+        self.last_identify = time.monotonic()
+        self.on_established()
+
+    def on_resumed(self, data):
+        self.on_established()
+
+    def on_established(self):
+        self.established = True
+        self.has_session = True
+
+        if self.closed_at is not None:
+            self.last_downtime = time.monotonic() - self.closed_at
+            self.closed_at = None
+            logger.info("Reconnected after %s seconds.", round(self.last_downtime, 2))
+            if self.metrics is not None:
+                self.metrics.gateway_downtime.observe(self.last_downtime)
+
+    def next_delay(self, close_reason=None):
+        """Returns the seconds to wait before reconnecting after close_reason."""
+        if self.closed_at is None:
+            self.closed_at = time.monotonic()
+
+        if self.established:
+            self.failures = 0
+        self.established = False
+
+        if close_reason and close_reason.code in SESSION_INVALIDATING_CODES:
+            self.has_session = False
+
+        delay = 0
+        if self.failures:
+            backoff = min(self.max_delay, self.base_delay * 2 ** (self.failures - 1))
+            delay = backoff * random.uniform(0.5, 1)
+        self.failures += 1
+
+        if not self.has_session and self.last_identify is not None:
+            since_identify = time.monotonic() - self.last_identify
+            delay = max(delay, self.identify_interval - since_identify)
+
+        return delay
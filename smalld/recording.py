@@ -0,0 +1,89 @@
+import struct
+import time
+from threading import Lock
+
+from .exceptions import SmallDError
+from .gateway import decode_payload
+
+MAGIC = b"SMALLDREC1\n"
+
+# time received (seconds since the epoch) and length of each frame
+FRAME_HEADER = struct.Struct("<dI")
+
+
+class GatewayRecorder:
+    """Appends the frames received from the gateway to a file.
+
+    Frames are recorded after decompression, as sent by Discord, each preceded by
+    the time it was received and its length.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+
+    def record(self, data):
+        header = FRAME_HEADER.pack(time.time(), len(data))
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(header)
+                self.file.write(data)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_recording(path):
+    """Yields the (time received, frame) of each frame in a recording."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise SmallDError(f"Not a gateway recording: {path}")
+
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+
+            received, length = FRAME_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield received, data
+
+
+def replay(smalld, path, speed=None):
+    """Feeds the dispatches in a recording to the listeners of smalld.
+
+    With speed None dispatches are fed as fast as possible, otherwise at that
+    multiple of the rate they were recorded at. Other payloads (hello, heartbeat
+    acks, ...) are not replayed, so nothing is sent to the gateway.
+
+    Returns the number of dispatches replayed and the seconds it took.
+    """
+    codec = smalld.gateway_codec
+    skip = smalld.skip_dispatch if codec.encoding == "json" else None
+
+    if smalld.executor:
+        smalld.executor.start()
+
+    count = 0
+    first = None
+    start = time.perf_counter()
+    for received, data in read_recording(path):
+        if speed is not None:
+            if first is None:
+                first = received
+            delay = (received - first) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        payload = decode_payload(data, codec, skip)
+        if payload.get("op") == 0:
+            smalld.notify_listeners(payload)
+            count += 1
+
+    return count, time.perf_counter() - start
@@ -0,0 +1,78 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from .logger import logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# how long after being saved a session is still worth trying to resume
+RESUME_WINDOW = 5 * 60
+
+
+class SessionFile:
+    """Keeps the session of each shard in a file, so it can be resumed after a restart.
+
+    Sessions are keyed by shard (e.g., 0/1) and replaced atomically. Where fcntl is
+    available, processes sharing a path take turns updating it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+
+            with open(f"{self.path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self):
+        try:
+            with open(self.path, "rb") as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning("Ignoring unreadable session file %s", self.path)
+            return {}
+
+    def load(self, shard):
+        session = self.read().get(shard_key(shard))
+        if not session or time.time() - session["saved_at"] > RESUME_WINDOW:
+            return None
+        return session
+
+    def save(self, shard, session_id, sequence, resume_gateway_url=None):
+        session = {
+            "session_id": session_id,
+            "sequence": sequence,
+            "resume_gateway_url": resume_gateway_url,
+            "saved_at": time.time(),
+        }
+
+        with self.locked():
+            sessions = self.read()
+            sessions[shard_key(shard)] = session
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(sessions, f)
+            os.replace(tmp_path, self.path)
+
+
+def shard_key(shard):
+    return f"{shard[0]}/{shard[1]}"
@@ -0,0 +1,146 @@
+import time
+from copy import copy
+from threading import Thread
+
+from .exceptions import HttpError, NetworkError, SmallDError
+from .logger import logger
+from .ratelimit import IdentifyRateLimiter
+from .smalld import SmallD, __version__
+
+
+class Shard(SmallD):
+    """A single gateway connection of an AutoShardedSmallD.
+
+    Shares the HttpClient, listeners, executor, profiler and recorder of its parent,
+    but keeps its own standard listeners (sequence number, identify and heartbeat).
+    """
+
+    def __init__(self, parent, shard):
+        self.parent = parent
+        self.gateway = None
+        super().__init__(
+            parent.token,
+            base_url=parent.base_url,
+            intents=parent.intents,
+            shard=shard,
+            compress=parent.compress,
+            encoding=parent.encoding,
+            json_codec=parent.json_codec,
+            metrics=parent.metrics,
+            session_file=parent.session_file.path if parent.session_file else None,
+            reconnect_policy=copy(parent.reconnect_policy),
+        )
+        self.listeners = parent.listeners
+        self.executor = parent.executor
+        self.profiler = parent.profiler
+        self.recorder = parent.recorder
+        self.identify_limiter = parent.identify_limiter
+
+    def create_http_client(self, **kwargs):
+        return self.parent.http
+
+    def get_gateway_url(self):
+        return self.parent.get_gateway_url()
+
+    def skip_dispatch(self, t):
+        return super().skip_dispatch(t) and self.parent.skip_dispatch(t)
+
+    def notify_listeners(self, data):
+        self.call_listeners(
+            self.parent.inline_listeners.get(data.get("op"), data.get("t")), data
+        )
+        super().notify_listeners(data)
+
+    def close(self):
+        self.closed_event.set()
+        if self.session_checkpoint:
+            self.session_checkpoint.save()
+        if self.gateway:
+            self.gateway.close(status=self.close_status)
+
+
+class AutoShardedSmallD(SmallD):
+    def __init__(self, *args, shard_count=None, shard_ids=None, **kwargs):
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+        self.shards = []
+        self.shards_by_id = {}
+        self.gateway_bot = None
+        super().__init__(*args, **kwargs)
+
+    def create_standard_listeners(self):
+        pass
+
+    def get_gateway_url(self):
+        return self.gateway_bot.url
+
+    def shard_for(self, guild_id):
+        shard_id = (int(guild_id) >> 22) % self.shard_count
+        try:
+            return self.shards_by_id[shard_id]
+        except KeyError:
+            raise SmallDError(f"Shard {shard_id} is not run by this process") from None
+
+    def send_gateway_payload(self, data):
+        d = data.get("d")
+        guild_id = d.get("guild_id") if isinstance(d, dict) else None
+        shard = self.shard_for(guild_id) if guild_id else self.shards[0]
+        shard.send_gateway_payload(data)
+
+    def reconnect(self):
+        for shard in self.shards:
+            shard.reconnect()
+
+    def close(self):
+        self.closed_event.set()
+        for shard in self.shards:
+            shard.close()
+        self.http.close()
+        if self.executor:
+            self.executor.shutdown()
+        if self.recorder:
+            self.recorder.close()
+
+    def create_shards(self):
+        self.shard_count = self.shard_count or self.gateway_bot.shards
+        shard_ids = self.shard_ids or range(self.shard_count)
+        session_start_limit = self.gateway_bot.get("session_start_limit", {})
+        max_concurrency = session_start_limit.get("max_concurrency", 1)
+
+        logger.info(
+            "Starting %s of %s shards with max concurrency %s.",
+            len(shard_ids),
+            self.shard_count,
+            max_concurrency,
+        )
+
+        if self.identify_limiter is None:
+            self.identify_limiter = IdentifyRateLimiter(max_concurrency)
+        self.shards = [Shard(self, (idx, self.shard_count)) for idx in shard_ids]
+        self.shards_by_id = {shard.shard[0]: shard for shard in self.shards}
+
+    def run(self):
+        logger.info("Running (SmallD v%s)...", __version__)
+
+        self.closed_event.clear()
+
+        while not self.closed and not self.gateway_bot:
+            try:
+                self.gateway_bot = self.get("/gateway/bot")
+            except (HttpError, NetworkError) as e:
+                logger.info(f"Could not fetch gateway bot. ({type(e).__name__}) {e}")
+                time.sleep(5)
+
+        if self.closed:
+            return
+
+        self.create_shards()
+
+        threads = [Thread(target=shard.run) for shard in self.shards]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if not self.closed:
+            self.close()
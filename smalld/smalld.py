@@ -1,26 +1,31 @@
-import json
 import os
 import time
 from enum import Flag
-from threading import Event
+from functools import wraps
+from threading import Event, Lock, current_thread
 
 from pkg_resources import get_distribution
 
 import requests
 
-from .exceptions import HttpError, NetworkError, SmallDError
+from .cache import request_key
+from .codec import EtfCodec, get_json_codec
+from .exceptions import HttpError, NetworkError, RateLimitError, SmallDError
+from .executor import PartitionedExecutor, partition_key
 from .gateway import Gateway
 from .json_elements import JsonObject
 from .logger import logger, redact_from_logging
-from .ratelimit import RateLimiter
+from .pagination import paginate
+from .profiling import ListenerProfiler
+from .ratelimit import DEFAULT_MAX_WAIT, RateLimiter, is_retry_after_in_ms
+from .reconnect import ReconnectPolicy
+from .recording import GatewayRecorder
+from .session import SessionFile
 from .standard_listeners import add_standard_listeners
 
 __version__ = get_distribution("smalld").version
 
 
-MIN_SECONDS_BETWEEN_CONNECTIONS = 120
-
-
 class Intent(Flag):
     GUILDS = 1 << 0
     GUILD_MEMBERS = 1 << 1
@@ -70,6 +75,44 @@ V6_BASE_URL = "https://discord.com/api/v6"
 V8_BASE_URL = "https://discord.com/api/v8"
 V9_BASE_URL = "https://discord.com/api/v9"
 
+# how long a gateway url fetched from /gateway/bot is reused for
+GATEWAY_URL_TTL = 60 * 60
+
+
+class ListenerIndex:
+    def __init__(self):
+        self.count = 0
+        # (op, t) filter to [(registration order, listener)] mapping
+        self.by_filter = {}
+        # (op, t) of a payload to matching listeners, in registration order
+        self.matching = {}
+
+    def add(self, listener, op=None, t=None):
+        self.by_filter.setdefault((op, t or None), []).append((self.count, listener))
+        self.count += 1
+        self.matching = {}
+
+    def get(self, op, t):
+        try:
+            return self.matching[(op, t)]
+        except KeyError:
+            pass
+
+        filters = {(op, t), (op, None), (None, t), (None, None)}
+        listeners = [
+            listener for f in filters for listener in self.by_filter.get(f, ())
+        ]
+        listeners.sort(key=lambda listener: listener[0])
+
+        matching = self.matching[(op, t)] = [listener for _, listener in listeners]
+        return matching
+
+    def has_listeners(self, op, t, catch_all=True):
+        filters = {(op, t), (op, None), (None, t)}
+        if catch_all:
+            filters.add((None, None))
+        return any(f in self.by_filter for f in filters)
+
 
 class SmallD:
     def __init__(
@@ -78,6 +121,20 @@ class SmallD:
         base_url=V9_BASE_URL,
         intents=Intent.unprivileged(),
         shard=(0, 1),
+        wait_on_ratelimit=False,
+        max_ratelimit_wait=DEFAULT_MAX_WAIT,
+        event_workers=0,
+        compress=False,
+        encoding="json",
+        json_codec="auto",
+        ratelimit_store=None,
+        response_cache=None,
+        metrics=None,
+        profile_listeners=False,
+        slow_listener_threshold=None,
+        record_gateway=None,
+        session_file=None,
+        reconnect_policy=None,
     ):
         if not token:
             raise SmallDError("No bot token provided")
@@ -86,21 +143,59 @@ class SmallD:
         self.base_url = base_url
         self.intents = intents
         self.shard = shard
-
-        self.listeners = []
+        self.compress = compress
+        self.encoding = encoding
+        self.json_codec = get_json_codec(json_codec)
+        self.gateway_codec = EtfCodec if encoding == "etf" else self.json_codec
+        self.metrics = metrics
+
+        self.listeners = ListenerIndex()
+        self.inline_listeners = ListenerIndex()
+        self.executor = PartitionedExecutor(event_workers) if event_workers else None
+        self.profiler = (
+            ListenerProfiler(slow_listener_threshold)
+            if profile_listeners or slow_listener_threshold is not None
+            else None
+        )
+        self.identify_limiter = None
+        self.identify_listener = None
+        # the thread reading from the gateway, once running
+        self.gateway_thread = None
+        self.gateway_url = None
+        self.gateway_url_expires = 0
+        self.recorder = GatewayRecorder(record_gateway) if record_gateway else None
+        self.session_file = SessionFile(session_file) if session_file else None
+        self.session_checkpoint = None
+        self.reconnect_policy = reconnect_policy or ReconnectPolicy()
         self.closed_event = Event()
 
-        self.http = HttpClient(token, base_url)
+        self.http = self.create_http_client(
+            wait_on_ratelimit=wait_on_ratelimit,
+            max_ratelimit_wait=max_ratelimit_wait,
+            codec=self.json_codec,
+            ratelimit_store=ratelimit_store,
+            response_cache=response_cache,
+            metrics=metrics,
+        )
         self.get = self.http.get
         self.post = self.http.post
         self.put = self.http.put
         self.patch = self.http.patch
         self.delete = self.http.delete
 
-        add_standard_listeners(self)
+        self.create_standard_listeners()
+
+        if response_cache:
+            response_cache.listen(self)
 
         redact_from_logging(token)
 
+    def create_http_client(self, **kwargs):
+        return HttpClient(self.token, self.base_url, **kwargs)
+
+    def create_standard_listeners(self):
+        add_standard_listeners(self)
+
     @staticmethod
     def v6(*args, **kwargs):
         return SmallD(base_url=V6_BASE_URL, *args, **kwargs)
@@ -115,25 +210,21 @@ class SmallD:
 
         super().__getattr__(name)
 
-    def on_dispatch(self, func=None, *, t=None):
+    def on_dispatch(self, func=None, *, t=None, inline=False):
         def decorator(f):
-            self.on_gateway_payload(lambda payload: f(payload.d), op=0, t=t)
+            @wraps(f)
+            def dispatch_listener(payload):
+                return f(payload.d)
+
+            self.on_gateway_payload(dispatch_listener, op=0, t=t, inline=inline)
             return f
 
         return decorator if func is None else decorator(func)
 
-    def on_gateway_payload(self, func=None, *, op=None, t=None):
+    def on_gateway_payload(self, func=None, *, op=None, t=None, inline=False):
         def decorator(f):
-            def filtered_payload_listener(data):
-                if op is not None and data.op != op:
-                    return
-
-                if t and data.t != t:
-                    return
-
-                f(data)
-
-            self.listeners.append(filtered_payload_listener)
+            listeners = self.inline_listeners if inline else self.listeners
+            listeners.add(f, op=op, t=t)
             return f
 
         return decorator if func is None else decorator(func)
@@ -141,6 +232,14 @@ class SmallD:
     def send_gateway_payload(self, data):
         self.gateway.send(data)
 
+    def paginate(self, path, params=None, **kwargs):
+        return paginate(self.http, path, params, **kwargs)
+
+    def profile_report(self):
+        if self.profiler is None:
+            raise SmallDError("Listener profiling is not enabled")
+        return self.profiler.report()
+
     @property
     def closed(self):
         return self.closed_event.is_set()
@@ -148,10 +247,21 @@ class SmallD:
     def reconnect(self):
         self.gateway.close(status=4900)
 
+    @property
+    def close_status(self):
+        # Discord ends the session on a 1000 or 1001 close, so a saved one is kept
+        return 4900 if self.session_checkpoint else 1000
+
     def close(self):
         self.closed_event.set()
+        if self.session_checkpoint:
+            self.session_checkpoint.save()
         self.http.close()
-        self.gateway.close()
+        self.gateway.close(status=self.close_status)
+        if self.executor:
+            self.executor.shutdown()
+        if self.recorder:
+            self.recorder.close()
 
     def __enter__(self):
         return self
@@ -164,49 +274,192 @@ class SmallD:
         logger.info("Running (SmallD v%s)...", __version__)
 
         self.closed_event.clear()
+        self.gateway_thread = current_thread()
+
+        if self.executor:
+            self.executor.start()
 
+        connections = 0
         while not self.closed:
             logger.info("Gateway connecting...")
-            connection_time = int(time.monotonic())
+            if self.metrics is not None:
+                self.metrics.on_connect(connections)
+            connections += 1
 
+            close_reason = None
             try:
-                gateway_url = self.get("/gateway/bot").url
+                gateway_url = self.get_connect_url()
             except (HttpError, NetworkError) as e:
                 logger.info(f"Could not fetch gateway url. ({type(e).__name__}) {e}")
             else:
-                self.gateway = Gateway(gateway_url)
-
-                for data in self.gateway:
-                    self.notify_listeners(data)
+                self.gateway = Gateway(
+                    gateway_url,
+                    compress=self.compress,
+                    codec=self.gateway_codec,
+                    skip=self.skip_dispatch,
+                    metrics=self.metrics,
+                    recorder=self.recorder,
+                )
 
-                if not is_recoverable_error(self.gateway.close_reason):
-                    logger.fatal(
-                        "Unrecoverable gateway closure: %s", self.gateway.close_reason
-                    )
+                if self.metrics is None:
+                    for data in self.gateway:
+                        self.notify_listeners(data)
+                else:
+                    for data in self.gateway:
+                        start = time.perf_counter()
+                        self.notify_listeners(data)
+                        self.metrics.on_payload(data, time.perf_counter() - start)
+                    self.metrics.on_gateway_close(self.gateway.close_reason)
+
+                if self.gateway.connect_failed:
+                    self.forget_gateway_urls()
+
+                close_reason = self.gateway.close_reason
+                if not is_recoverable_error(close_reason):
+                    logger.fatal("Unrecoverable gateway closure: %s", close_reason)
                     self.close()
 
             if not self.closed:
-                logger.debug("Waiting to reconnect...")
-                since_last_connection = int(time.monotonic()) - connection_time
-                time.sleep(
-                    max(5, MIN_SECONDS_BETWEEN_CONNECTIONS - since_last_connection)
-                )
+                delay = self.reconnect_policy.next_delay(close_reason)
+                logger.debug("Waiting %s seconds to reconnect...", round(delay, 2))
+                time.sleep(delay)
+
+    def get_connect_url(self):
+        return self.get_resume_url() or self.fetch_gateway_url()
+
+    def get_resume_url(self):
+        identify = self.identify_listener
+        if identify is None or not identify.can_resume():
+            return None
+        return identify.resume_gateway_url or self.cached_gateway_url()
+
+    def fetch_gateway_url(self):
+        try:
+            return self.cache_gateway_url(self.get_gateway_url())
+        except (HttpError, NetworkError):
+            url = self.cached_gateway_url()
+            if url is None:
+                raise
+            logger.info("Could not fetch gateway url, using cached url.")
+            return url
+
+    def get_gateway_url(self):
+        return self.get("/gateway/bot").url
+
+    def cached_gateway_url(self):
+        if self.gateway_url and time.monotonic() < self.gateway_url_expires:
+            return self.gateway_url
+        return None
+
+    def cache_gateway_url(self, url):
+        self.gateway_url = url
+        self.gateway_url_expires = time.monotonic() + GATEWAY_URL_TTL
+        return url
+
+    def forget_gateway_urls(self):
+        self.gateway_url = None
+        if self.identify_listener is not None:
+            self.identify_listener.resume_gateway_url = None
+
+    def skip_dispatch(self, t):
+        # Inline listeners for every payload (e.g., the sequence number) are
+        # still called for skipped dispatches, but only with op, t and s.
+        return not (
+            self.listeners.has_listeners(0, t)
+            or self.inline_listeners.has_listeners(0, t, catch_all=False)
+        )
 
     def notify_listeners(self, data):
+        op, t = data.get("op"), data.get("t")
+
+        self.call_listeners(self.inline_listeners.get(op, t), data)
+
+        if "d" not in data:
+            return
+
+        listeners = self.listeners.get(op, t)
+        if self.executor and op == 0:
+            if listeners:
+                self.executor.submit(
+                    partition_key(data), self.call_listeners, listeners, data
+                )
+        else:
+            self.call_listeners(listeners, data)
+
+    def call_listeners(self, listeners, data):
+        for listener in listeners:
+            try:
+                if self.profiler is None:
+                    listener(data)
+                else:
+                    self.profiler.call(listener, data)
+            except:
+                logger.warning("Exception in listener", exc_info=True)
+
+
+class SingleFlight:
+    """Shares the result of a call with any identical calls made while it runs."""
+
+    def __init__(self):
+        self.lock = Lock()
+        # key to (done event, [result, error]) mapping
+        self.calls = {}
+
+    def call(self, key, func, *args):
+        with self.lock:
+            try:
+                done, outcome = self.calls[key]
+                is_leader = False
+            except KeyError:
+                done, outcome = self.calls[key] = (Event(), [None, None])
+                is_leader = True
+
+        if not is_leader:
+            done.wait()
+            result, error = outcome
+            if error:
+                raise error
+            return result
+
         try:
-            for listener in self.listeners:
-                listener(data)
-        except:
-            logger.warn("Exception in listener", exc_info=True)
+            outcome[0] = func(*args)
+            return outcome[0]
+        except BaseException as e:
+            outcome[1] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            done.set()
 
 
 class HttpClient:
-    def __init__(self, token, base_url):
+    def __init__(
+        self,
+        token,
+        base_url,
+        wait_on_ratelimit=False,
+        max_ratelimit_wait=DEFAULT_MAX_WAIT,
+        codec=None,
+        ratelimit_store=None,
+        response_cache=None,
+        metrics=None,
+    ):
         self.token = token
         self.base_url = base_url
+        self.codec = codec or get_json_codec()
+        self.cache = response_cache
+        self.metrics = metrics
+        self.in_flight = SingleFlight()
         self.session = requests.Session()
         self.session.headers.update(self.headers())
-        self.limiter = RateLimiter()
+        self.limiter = RateLimiter(
+            blocking=wait_on_ratelimit,
+            max_wait=max_ratelimit_wait,
+            store=ratelimit_store,
+            metrics=metrics,
+            retry_after_in_ms=is_retry_after_in_ms(base_url),
+        )
 
     def headers(self):
         return {
@@ -230,37 +483,77 @@ class HttpClient:
         return self.send_request("DELETE", *args, **kwargs)
 
     def send_request(self, method, path, payload="", attachments=None, params=None):
+        if method != "GET":
+            return JsonObject(self.request(method, path, payload, attachments, params))
+
+        if self.cache is not None:
+            content = self.cache.get(path, params)
+            if content is not None:
+                return JsonObject(content)
+
+        content = self.in_flight.call(
+            request_key(path, params),
+            self.request,
+            method,
+            path,
+            payload,
+            attachments,
+            params,
+        )
+        return JsonObject(content)
+
+    def request(self, method, path, payload, attachments, params):
         if attachments:
             files = [(f"file{idx}", a) for idx, a in enumerate(attachments)]
-            args = {"data": {"payload_json": json.dumps(payload)}, "files": files}
+            args = {"data": {"payload_json": self.codec.dumps(payload)}, "files": files}
         elif payload:
-            args = {"json": payload}
+            args = {
+                "data": self.codec.dumps(payload).encode("utf-8"),
+                "headers": {"Content-Type": "application/json"},
+            }
         else:
             args = {}
 
         if params:
             args["params"] = params
 
-        self.limiter.on_request(method, path)
+        while True:
+            self.limiter.on_request(method, path)
 
-        try:
-            res = self.session.request(method, f"{self.base_url}/{path}", **args)
-        except (requests.ConnectionError, requests.Timeout):
-            raise NetworkError
-        except requests.RequestException:
-            raise HttpError
+            start = time.perf_counter()
+            try:
+                res = self.session.request(method, f"{self.base_url}/{path}", **args)
+            except (requests.ConnectionError, requests.Timeout):
+                raise NetworkError
+            except requests.RequestException:
+                raise HttpError
+
+            if self.metrics is not None:
+                self.metrics.on_rest_response(
+                    method, path, res.status_code, time.perf_counter() - start
+                )
 
-        self.limiter.on_response(method, path, res.headers, res.status_code)
+            try:
+                self.limiter.on_response(method, path, res.headers, res.status_code)
+                break
+            except RateLimitError as e:
+                self.limiter.wait(e)
 
         if not res.ok:
             raise HttpError(response=res)
 
         try:
-            content = res.json() if res.status_code != 204 else {}
-        except json.JSONDecodeError:
+            content = self.codec.loads(res.content) if res.status_code != 204 else {}
+        except self.codec.decode_error:
             raise HttpError(response=res)
 
-        return JsonObject(content)
+        if self.cache is not None:
+            if method == "GET":
+                self.cache.put(path, params, content)
+            else:
+                self.cache.invalidate(path)
+
+        return content
 
     def close(self):
         self.session.close()
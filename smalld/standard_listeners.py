@@ -8,8 +8,11 @@ from .logger import logger
 
 def add_standard_listeners(smalld):
     sequence = SequenceNumber(smalld)
-    Identify(smalld, sequence)
     Heartbeat(smalld, sequence)
+    smalld.identify_listener = identify = Identify(smalld, sequence)
+    smalld.reconnect_policy.listen(smalld)
+    if smalld.session_file:
+        smalld.session_checkpoint = SessionCheckpoint(smalld, sequence, identify)
 
 
 OP_HEARTBEAT = 1
@@ -26,7 +29,7 @@ class SequenceNumber:
         self.smalld = smalld
         self.number = None
 
-        smalld.on_gateway_payload(self.on_payload)
+        smalld.on_gateway_payload(self.on_payload, inline=True)
 
     def on_payload(self, data):
         if data.s:
@@ -38,22 +41,30 @@ class Identify:
         self.smalld = smalld
         self.sequence = sequence
         self.session_id = None
+        self.resume_gateway_url = None
+        self.thread = None
 
-        smalld.on_ready(self.on_ready)
-        smalld.on_resumed(self.on_resumed)
-        smalld.on_gateway_payload(self.on_hello, op=OP_HELLO)
-        smalld.on_gateway_payload(self.on_invalid_session, op=OP_INVALID_SESSION)
-        smalld.on_gateway_payload(self.on_reconnect, op=OP_RECONNECT)
+        smalld.on_dispatch(self.on_ready, t="READY", inline=True)
+        smalld.on_dispatch(self.on_resumed, t="RESUMED", inline=True)
+        smalld.on_gateway_payload(self.on_hello, op=OP_HELLO, inline=True)
+        smalld.on_gateway_payload(
+            self.on_invalid_session, op=OP_INVALID_SESSION, inline=True
+        )
+        smalld.on_gateway_payload(self.on_reconnect, op=OP_RECONNECT, inline=True)
 
     def on_ready(self, data):
         logger.info("Ready.")
         self.session_id = data.session_id
+        self.resume_gateway_url = data.get("resume_gateway_url")
 
     def on_resumed(self, data):
         logger.info("Resumed.")
 
+    def can_resume(self):
+        return bool(self.session_id and self.sequence.number)
+
     def on_hello(self, data):
-        if self.session_id and self.sequence.number:
+        if self.can_resume():
             self.resume()
         else:
             self.identify()
@@ -69,6 +80,27 @@ class Identify:
         self.smalld.reconnect()
 
     def identify(self):
+        if self.smalld.identify_limiter:
+            # wait for a turn off the gateway thread, so heartbeats carry on meanwhile
+            self.thread = Thread(target=self.identify_when_allowed, daemon=True)
+            self.thread.start()
+        else:
+            self.send_identify()
+
+    def identify_when_allowed(self):
+        gateway = self.smalld.gateway
+        self.smalld.identify_limiter.on_identify(self.smalld.shard[0])
+
+        if self.smalld.closed or self.smalld.gateway is not gateway:
+            logger.debug("Gateway closed while waiting to identify.")
+            return
+
+        try:
+            self.send_identify()
+        except NetworkError:
+            logger.info("Could not identify, gateway connection lost.")
+
+    def send_identify(self):
         logger.info("Identifying...")
         self.smalld.send_gateway_payload(
             {
@@ -108,12 +140,17 @@ class Heartbeat:
         self.thread = None
         self.heartbeat_interval = None
         self.received_ack = Event()
-
-        smalld.on_gateway_payload(self.on_hello, op=OP_HELLO)
-        smalld.on_gateway_payload(self.on_heartbeat, op=OP_HEARTBEAT)
-        smalld.on_gateway_payload(self.on_heartbeat_ack, op=OP_HEARTBEAT_ACK)
-        smalld.on_ready(self.on_heartbeat_ack)
-        smalld.on_resumed(self.on_heartbeat_ack)
+        # round trip of the last acked heartbeat, in seconds
+        self.latency = None
+        self.sent_at = None
+
+        smalld.on_gateway_payload(self.on_hello, op=OP_HELLO, inline=True)
+        smalld.on_gateway_payload(self.on_heartbeat, op=OP_HEARTBEAT, inline=True)
+        smalld.on_gateway_payload(
+            self.on_heartbeat_ack, op=OP_HEARTBEAT_ACK, inline=True
+        )
+        smalld.on_dispatch(self.on_heartbeat_ack, t="READY", inline=True)
+        smalld.on_dispatch(self.on_heartbeat_ack, t="RESUMED", inline=True)
 
     def on_hello(self, data):
         self.heartbeat_interval = data.d.heartbeat_interval / 1000
@@ -128,6 +165,12 @@ class Heartbeat:
     def on_heartbeat_ack(self, data):
         self.received_ack.set()
 
+        if data.get("op") == OP_HEARTBEAT_ACK and self.sent_at is not None:
+            self.latency = time.monotonic() - self.sent_at
+            self.sent_at = None
+            if self.smalld.metrics is not None:
+                self.smalld.metrics.heartbeat_ack.observe(self.latency)
+
     def run_heartbeat_loop(self):
         time.sleep(self.heartbeat_interval)
         while not self.smalld.closed:
@@ -142,10 +185,67 @@ class Heartbeat:
                 self.received_ack.clear()
             else:
                 logger.info("No heartbeat ack. Reconnecting...")
+                if self.smalld.metrics is not None:
+                    self.smalld.metrics.heartbeat_missed_acks.inc()
                 self.smalld.reconnect()
                 break
 
     def send_heartbeat(self):
+        self.sent_at = time.monotonic()
         self.smalld.send_gateway_payload(
             {"op": OP_HEARTBEAT, "d": self.sequence.number}
         )
+
+
+class SessionCheckpoint:
+    """Saves the session to the session file of smalld, and restores it on start.
+
+    The session is saved when ready or resumed, on heartbeat acks at most every
+    CHECKPOINT_INTERVAL seconds, and when smalld is closed.
+    """
+
+    CHECKPOINT_INTERVAL = 30
+
+    def __init__(self, smalld, sequence, identify):
+        self.smalld = smalld
+        self.sequence = sequence
+        self.identify = identify
+        self.saved_at = 0
+
+        self.restore()
+
+        smalld.on_dispatch(self.on_session_change, t="READY", inline=True)
+        smalld.on_dispatch(self.on_session_change, t="RESUMED", inline=True)
+        smalld.on_gateway_payload(
+            self.on_session_change, op=OP_INVALID_SESSION, inline=True
+        )
+        smalld.on_gateway_payload(
+            self.on_heartbeat_ack, op=OP_HEARTBEAT_ACK, inline=True
+        )
+
+    def restore(self):
+        session = self.smalld.session_file.load(self.smalld.shard)
+        if session and session["session_id"]:
+            logger.info("Restored session. Will try to resume...")
+            self.identify.session_id = session["session_id"]
+            self.identify.resume_gateway_url = session["resume_gateway_url"]
+            self.sequence.number = session["sequence"]
+
+    def save(self):
+        self.saved_at = time.monotonic()
+        try:
+            self.smalld.session_file.save(
+                self.smalld.shard,
+                self.identify.session_id,
+                self.sequence.number,
+                self.identify.resume_gateway_url,
+            )
+        except OSError:
+            logger.warning("Could not save session", exc_info=True)
+
+    def on_session_change(self, data):
+        self.save()
+
+    def on_heartbeat_ack(self, data):
+        if time.monotonic() - self.saved_at >= self.CHECKPOINT_INTERVAL:
+            self.save()
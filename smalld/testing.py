@@ -0,0 +1,322 @@
+import asyncio
+import json
+import time
+from threading import Event, Thread
+
+from aiohttp import WSMsgType, web
+
+from .cache import path_template
+
+OP_DISPATCH = 0
+OP_HEARTBEAT = 1
+OP_IDENTIFY = 2
+OP_RESUME = 6
+OP_RECONNECT = 7
+OP_INVALID_SESSION = 9
+OP_HELLO = 10
+OP_HEARTBEAT_ACK = 11
+
+
+class FakeBucket:
+    def __init__(self, bucket_id, limit, per):
+        self.bucket_id = bucket_id
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset = 0
+
+    def take(self):
+        now = time.time()
+        if now >= self.reset:
+            self.remaining = self.limit
+            self.reset = now + self.per
+
+        limited = self.remaining == 0
+        if not limited:
+            self.remaining -= 1
+
+        return (
+            limited,
+            {
+                "X-RateLimit-Bucket": self.bucket_id,
+                "X-RateLimit-Limit": str(self.limit),
+                "X-RateLimit-Remaining": str(self.remaining),
+                "X-RateLimit-Reset": f"{self.reset:.3f}",
+                "X-RateLimit-Reset-After": f"{max(self.reset - now, 0):.3f}",
+            },
+        )
+
+
+class Connection:
+    def __init__(self, ws):
+        self.ws = ws
+        self.shard = None
+        self.session_id = None
+        self.seq = 0
+        # (seq, payload) of each dispatch of the session, replayed on resume
+        self.dispatches = []
+
+    async def send(self, payload):
+        if isinstance(payload, str):
+            await self.ws.send_str(payload)
+        else:
+            await self.ws.send_json(payload)
+
+    def add_dispatch(self, event):
+        self.seq += 1
+        if isinstance(event, (bytes, str)):
+            payload = event if isinstance(event, str) else event.decode()
+        else:
+            payload = {"op": OP_DISPATCH, "s": self.seq, **event}
+        self.dispatches.append((self.seq, payload))
+        return payload
+
+    async def dispatch(self, t, d):
+        await self.send(self.add_dispatch({"t": t, "d": d}))
+
+    async def replay(self, seq):
+        for dispatch_seq, payload in self.dispatches:
+            if dispatch_seq > seq:
+                await self.send(payload)
+
+
+class FakeDiscord:
+    """A local stand-in for the Discord gateway and REST API.
+
+    The gateway sends HELLO, answers IDENTIFY with READY followed by the events
+    from events_for(shard), RESUME of a known session with the dispatches after its
+    seq and RESUMED (or an invalid session otherwise), and acknowledges heartbeats. send_all and close_all send
+    other payloads (e.g., a reconnect request) or close codes to clients.
+
+    REST requests are recorded and answered with an empty JSON object unless a
+    response is queued in responses for the path. Routes given to ratelimit answer
+    with X-RateLimit-* headers, and with a 429 when their bucket is exhausted.
+    """
+
+    def __init__(self, shards=1, max_concurrency=1, heartbeat_interval=41250):
+        self.shards = shards
+        self.max_concurrency = max_concurrency
+        self.heartbeat_interval = heartbeat_interval
+        self.events = []
+        self.identifies = []
+        self.resumes = []
+        self.connects = []
+        self.received = []
+        self.requests = []
+        self.responses = {}
+        self.ratelimited = []
+        self.connections = []
+        # session id to the Connection that last used it
+        self.sessions = {}
+        # path template to (limit, per) mapping
+        self.ratelimits = {}
+        # path to FakeBucket mapping
+        self.buckets = {}
+
+        self.app = web.Application()
+        self.app.router.add_get("/gateway", self.on_gateway)
+        self.app.router.add_route("*", "/api/{path:.*}", self.on_request)
+
+        self.loop = None
+        self.runner = None
+        self.thread = None
+        self.url = None
+
+    @property
+    def base_url(self):
+        return f"{self.url}/api"
+
+    @property
+    def gateway_url(self):
+        return f"{self.url.replace('http', 'ws', 1)}/gateway"
+
+    def events_for(self, shard):
+        return self.events
+
+    def ratelimit(self, route, limit, per):
+        """Limits each path matching route (a path template) to limit per seconds."""
+        self.ratelimits[path_template(route)] = (limit, per)
+
+    def take(self, path):
+        try:
+            bucket = self.buckets[path]
+        except KeyError:
+            route = path_template(path)
+            if route not in self.ratelimits:
+                return False, {}
+            bucket = self.buckets[path] = FakeBucket(
+                route.replace("/", ":"), *self.ratelimits[route]
+            )
+        return bucket.take()
+
+    async def on_request(self, request):
+        path = request.match_info["path"].strip("/")
+        body = await request.read()
+        self.requests.append((request.method, path, body))
+
+        limited, headers = self.take(path)
+        if limited:
+            self.ratelimited.append((request.method, path))
+            retry_after = float(headers["X-RateLimit-Reset-After"])
+            return web.json_response(
+                {"message": "You are being rate limited.", "retry_after": retry_after},
+                status=429,
+                headers={**headers, "Retry-After": str(retry_after)},
+            )
+
+        if path == "gateway/bot":
+            return web.json_response(
+                {
+                    "url": self.gateway_url,
+                    "shards": self.shards,
+                    "session_start_limit": {
+                        "total": 1000,
+                        "remaining": 1000,
+                        "reset_after": 0,
+                        "max_concurrency": self.max_concurrency,
+                    },
+                }
+            )
+
+        responses = self.responses.get(path)
+        if not responses:
+            return web.json_response({}, headers=headers)
+
+        response = responses.pop(0) if len(responses) > 1 else responses[0]
+        response.headers.update(headers)
+        return response
+
+    async def on_gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        self.connects.append(time.monotonic())
+        connection = Connection(ws)
+        self.connections.append(connection)
+
+        try:
+            await connection.send(
+                {
+                    "op": OP_HELLO,
+                    "s": None,
+                    "t": None,
+                    "d": {"heartbeat_interval": self.heartbeat_interval},
+                }
+            )
+
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+
+                payload = json.loads(msg.data)
+                self.received.append(payload)
+
+                if payload["op"] == OP_HEARTBEAT:
+                    await connection.send(
+                        {"op": OP_HEARTBEAT_ACK, "s": None, "t": None, "d": None}
+                    )
+                elif payload["op"] == OP_IDENTIFY:
+                    await self.on_identify(connection, payload["d"])
+                elif payload["op"] == OP_RESUME:
+                    await self.on_resume(connection, payload["d"])
+        finally:
+            self.connections.remove(connection)
+
+        return ws
+
+    async def on_identify(self, connection, identify):
+        shard = tuple(identify.get("shard") or (0, 1))
+        self.identifies.append((time.monotonic(), shard))
+
+        connection.shard = shard
+        connection.session_id = f"session-{shard[0]}-{len(self.identifies)}"
+        self.sessions[connection.session_id] = connection
+        await connection.dispatch(
+            "READY", {"session_id": connection.session_id, "shard": list(shard)}
+        )
+
+        # the events are part of the session even if the connection closes before
+        # they are all sent, so a resume can replay them
+        start = connection.seq
+        for event in self.events_for(shard):
+            connection.add_dispatch(event)
+        await connection.replay(start)
+
+    async def on_resume(self, connection, resume):
+        session_id = resume["session_id"]
+        self.resumes.append((time.monotonic(), session_id, resume["seq"]))
+
+        previous = self.sessions.get(session_id)
+        if previous is None:
+            await connection.send(
+                {"op": OP_INVALID_SESSION, "s": None, "t": None, "d": False}
+            )
+            return
+
+        connection.shard = previous.shard
+        connection.session_id = session_id
+        connection.seq = previous.seq
+        connection.dispatches = previous.dispatches
+        self.sessions[session_id] = connection
+        await connection.replay(resume["seq"] or 0)
+        await connection.dispatch("RESUMED", {})
+
+    async def send_all(self, op, d=None):
+        """Sends a payload to every connected client."""
+        for connection in list(self.connections):
+            await connection.send({"op": op, "s": None, "t": None, "d": d})
+
+    async def close_all(self, code=1000):
+        """Closes every client connection with the given close code."""
+        for connection in list(self.connections):
+            await connection.ws.close(code=code)
+
+    def call(self, coro):
+        """Runs a coroutine (e.g., send_all) on the thread started by start."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def start_server(self):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop_server(self):
+        await self.runner.cleanup()
+
+    async def __aenter__(self):
+        await self.start_server()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop_server()
+
+    def start(self):
+        """Starts the server on its own thread and event loop."""
+        started = Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.start_server())
+            started.set()
+            self.loop.run_forever()
+            self.loop.run_until_complete(self.stop_server())
+            self.loop.close()
+
+        self.thread = Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
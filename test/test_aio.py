@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from aiohttp import web  # isort:skip
+from smalld import HttpError, RateLimitError  # isort:skip
+from smalld.aio import AsyncHttpClient, AsyncSmallD  # isort:skip
+from smalld.testing import FakeDiscord  # isort:skip
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(asyncio.wait_for(coro, 5))
+    finally:
+        loop.close()
+
+
+def test_async_smalld_identifies_and_dispatches_events():
+    message = {"t": "MESSAGE_CREATE", "d": {"channel_id": "1", "content": "++ping"}}
+
+    async def main():
+        async with FakeDiscord() as discord:
+            discord.events = [message]
+            smalld = AsyncSmallD("token", base_url=discord.base_url)
+
+            @smalld.on_message_create
+            async def on_message(msg):
+                await smalld.post(f"/channels/{msg.channel_id}/messages", {"x": 1})
+                await smalld.close()
+
+            await smalld.run()
+            return discord
+
+    discord = run(main())
+
+    assert discord.received[0]["op"] == 2
+    assert discord.received[0]["d"]["token"] == "token"
+    method, path, body = discord.requests[-1]
+    assert (method, path, json.loads(body)) == ("POST", "channels/1/messages", {"x": 1})
+
+
+def test_async_smalld_close_cancels_heartbeat():
+    async def main():
+        async with FakeDiscord() as discord:
+            smalld = AsyncSmallD("token", base_url=discord.base_url)
+
+            @smalld.on_ready
+            async def on_ready(data):
+                await smalld.close()
+
+            await smalld.run()
+            await asyncio.sleep(0)
+            return smalld.heartbeat.thread
+
+    heartbeat = run(main())
+
+    assert heartbeat.cancelled()
+
+
+def test_async_http_client_raises_for_non_2xx_status():
+    async def main():
+        async with FakeDiscord() as discord:
+            discord.responses["get"] = [web.Response(status=404)]
+            client = AsyncHttpClient("token", discord.base_url)
+            try:
+                await client.get("get")
+            finally:
+                await client.close()
+
+    with pytest.raises(HttpError):
+        run(main())
+
+
+def test_async_http_client_waits_and_retries_ratelimited_requests():
+    async def main():
+        async with FakeDiscord() as discord:
+            headers = {
+                "X-RateLimit-Bucket": "abc",
+                "X-RateLimit-Remaining": "0",
+                "X-RateLimit-Reset": "0",
+                "X-RateLimit-Reset-After": "0.01",
+            }
+            discord.responses["get"] = [
+                web.Response(status=429, headers=headers),
+                web.json_response(
+                    {"data": "value"}, headers={**headers, "X-RateLimit-Remaining": "1"}
+                ),
+            ]
+            client = AsyncHttpClient("token", discord.base_url, wait_on_ratelimit=True)
+            try:
+                return await client.get("get"), discord
+            finally:
+                await client.close()
+
+    res, discord = run(main())
+
+    assert res.data == "value"
+    assert len(discord.requests) == 2
+
+
+def test_async_http_client_raises_ratelimit_error_when_not_waiting():
+    async def main():
+        async with FakeDiscord() as discord:
+            headers = {"X-RateLimit-Global": "true", "Retry-After": "1000"}
+            discord.responses["get"] = [web.Response(status=429, headers=headers)]
+            client = AsyncHttpClient("token", discord.base_url)
+            try:
+                await client.get("get")
+            finally:
+                await client.close()
+
+    with pytest.raises(RateLimitError):
+        run(main())
+
+
+def test_async_http_client_coalesces_identical_gets():
+    async def main():
+        async with FakeDiscord() as discord:
+            client = AsyncHttpClient("token", discord.base_url)
+            try:
+                results = await asyncio.gather(
+                    *[client.get("guilds/1") for _ in range(5)], client.get("guilds/2")
+                )
+                return results, discord
+            finally:
+                await client.close()
+
+    results, discord = run(main())
+
+    assert all(res == {} for res in results)
+    assert sorted(path for _, path, _ in discord.requests) == ["guilds/1", "guilds/2"]
+
+
+def test_async_smalld_paginates():
+    async def main():
+        async with FakeDiscord() as discord:
+            discord.responses["users/@me/guilds"] = [
+                web.json_response([{"id": "1"}, {"id": "2"}]),
+                web.json_response([{"id": "3"}]),
+            ]
+            smalld = AsyncSmallD("token", base_url=discord.base_url)
+            try:
+                items = [
+                    item.id
+                    async for item in smalld.paginate("users/@me/guilds", limit=2)
+                ]
+                return items, discord
+            finally:
+                await smalld.close()
+
+    items, discord = run(main())
+
+    assert items == ["1", "2", "3"]
+    assert len(discord.requests) == 2
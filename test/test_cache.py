@@ -0,0 +1,196 @@
+from unittest.mock import patch
+
+import pytest
+from smalld.cache import EntityCache, LRUCache, ResponseCache
+from smalld.json_elements import JsonObject
+from smalld.smalld import SmallD
+
+
+@pytest.fixture
+def smalld():
+    with patch("smalld.smalld.HttpClient", autospec=True):
+        yield SmallD("token")
+
+
+@pytest.fixture
+def cache(smalld):
+    return EntityCache(smalld, max_members=2)
+
+
+def dispatch(smalld, t, d):
+    smalld.notify_listeners(JsonObject({"op": 0, "t": t, "s": 1, "d": d}))
+
+
+GUILD = {
+    "id": "1",
+    "name": "a guild",
+    "channels": [{"id": "10", "name": "general"}],
+    "roles": [{"id": "20", "name": "everyone"}],
+    "members": [{"user": {"id": "30", "username": "a"}, "roles": ["20"]}],
+}
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats() == {
+        "size": 2,
+        "maxsize": 2,
+        "hits": 2,
+        "misses": 1,
+        "hit_ratio": 2 / 3,
+        "evictions": 1,
+    }
+
+
+def test_entity_cache_caches_guild_create(smalld, cache):
+    dispatch(smalld, "GUILD_CREATE", GUILD)
+
+    assert cache.guild(1).name == "a guild"
+    assert "channels" not in cache.guild("1")
+    assert cache.channel("10").guild_id == "1"
+    assert cache.role("20").name == "everyone"
+    assert list(cache.member("1", "30").roles) == ["20"]
+    assert cache.user("30").username == "a"
+
+
+def test_entity_cache_updates_before_other_listeners(smalld, cache):
+    dispatch(smalld, "GUILD_CREATE", GUILD)
+    seen = []
+
+    @smalld.on_channel_update
+    def on_channel_update(data):
+        seen.append(cache.channel(data.id).name)
+
+    dispatch(smalld, "CHANNEL_UPDATE", {"id": "10", "name": "renamed"})
+
+    assert seen == ["renamed"]
+
+
+def test_entity_cache_merges_member_updates(smalld, cache):
+    dispatch(smalld, "GUILD_CREATE", GUILD)
+    dispatch(
+        smalld,
+        "GUILD_MEMBER_UPDATE",
+        {"guild_id": "1", "user": {"id": "30"}, "nick": "nick"},
+    )
+
+    member = cache.member("1", "30")
+    assert member.nick == "nick"
+    assert list(member.roles) == ["20"]
+    assert "guild_id" not in member
+    assert cache.user("30").username == "a"
+
+
+def test_entity_cache_leaves_member_payloads_to_listeners(smalld, cache):
+    payloads = []
+    smalld.on_guild_member_add(payloads.append)
+
+    dispatch(smalld, "GUILD_MEMBER_ADD", {"guild_id": "1", "user": {"id": "30"}})
+
+    assert payloads[0].guild_id == "1"
+    assert "guild_id" not in cache.member("1", "30")
+
+
+def test_entity_cache_removes_deleted_entities(smalld, cache):
+    dispatch(smalld, "GUILD_CREATE", GUILD)
+    dispatch(smalld, "GUILD_ROLE_DELETE", {"guild_id": "1", "role_id": "20"})
+    dispatch(smalld, "GUILD_MEMBER_REMOVE", {"guild_id": "1", "user": {"id": "30"}})
+
+    assert cache.role("20") is None
+    assert cache.member("1", "30") is None
+
+    dispatch(smalld, "GUILD_DELETE", {"id": "1"})
+
+    assert cache.guild("1") is None
+    assert cache.channel("10") is None
+
+
+def test_entity_cache_bounds_members(smalld, cache):
+    dispatch(
+        smalld,
+        "GUILD_MEMBERS_CHUNK",
+        {"guild_id": "1", "members": [{"user": {"id": str(i)}} for i in range(3)]},
+    )
+
+    assert cache.member("1", "0") is None
+    assert cache.member("1", "2") is not None
+    assert cache.stats()["members"]["evictions"] == 1
+
+
+def test_lru_cache_expires_entries_after_ttl():
+    cache = LRUCache(ttl=10)
+    with patch("time.monotonic", return_value=0):
+        cache.put("a", 1)
+    with patch("time.monotonic", return_value=9):
+        assert cache.get("a") == 1
+    with patch("time.monotonic", return_value=10):
+        assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_response_cache_keys_by_path_and_params():
+    cache = ResponseCache(resources=None)
+    cache.put("/guilds/1/members", {"limit": 10, "after": 0}, [1])
+
+    assert cache.get("guilds/1/members", {"after": 0, "limit": 10}) == [1]
+    assert cache.get("guilds/1/members") is None
+
+
+def test_response_cache_invalidates_path_children_and_parent():
+    cache = ResponseCache(resources=None)
+    for path in ["guilds/1", "guilds/1/roles", "guilds/1/roles/2", "guilds/2/roles"]:
+        cache.put(path, None, {})
+
+    cache.invalidate("guilds/1/roles")
+
+    assert cache.get("guilds/1/roles") is None
+    assert cache.get("guilds/1/roles/2") is None
+    assert cache.get("guilds/1") is None
+    assert cache.get("guilds/2/roles") == {}
+    assert cache.stats()["invalidations"] == 3
+
+
+def test_response_cache_only_caches_given_resources():
+    cache = ResponseCache(resources={"users/@me", "guilds/{}/roles"})
+    cache.put("users/@me", None, {})
+    cache.put("/guilds/1/roles", None, [])
+    cache.put("channels/1", None, {})
+
+    assert cache.get("users/@me") == {}
+    assert cache.get("guilds/1/roles") == []
+    assert cache.get("channels/1") is None
+
+
+def test_response_cache_only_caches_slow_changing_resources_by_default():
+    cache = ResponseCache()
+    for path in ["guilds/1", "guilds/1/roles", "users/@me", "guilds/1/members"]:
+        cache.put(path, None, {})
+    cache.put("channels/1/messages", {"limit": 10}, [])
+
+    assert cache.get("guilds/1") == {}
+    assert cache.get("guilds/1/roles") == {}
+    assert cache.get("users/@me") == {}
+    assert cache.get("guilds/1/members") is None
+    assert cache.get("channels/1/messages", {"limit": 10}) is None
+
+
+def test_response_cache_is_invalidated_by_gateway_events():
+    cache = ResponseCache(resources=None)
+    with patch("smalld.smalld.HttpClient", autospec=True):
+        smalld = SmallD("token", response_cache=cache)
+    cache.put("guilds/1/roles", None, [])
+    cache.put("guilds/1/members/2", None, {})
+
+    dispatch(smalld, "GUILD_ROLE_UPDATE", {"guild_id": "1", "role": {"id": "3"}})
+    dispatch(smalld, "GUILD_MEMBER_UPDATE", {"guild_id": "1", "user": {"id": "2"}})
+
+    assert cache.get("guilds/1/roles") is None
+    assert cache.get("guilds/1/members/2") is None
+    assert cache.stats()["hit_ratio"] == 0
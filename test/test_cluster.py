@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import time
+from multiprocessing import Pipe
+from threading import Thread
+from unittest.mock import patch
+
+import pytest
+from smalld.cluster import (
+    Channel,
+    Coordinator,
+    CoordinatorClient,
+    RemoteGlobalRateLimitBucket,
+    RemoteIdentifyRateLimiter,
+    ShardCluster,
+    run_worker,
+    split_shards,
+)
+from smalld.exceptions import RateLimitError
+from smalld.sharding import AutoShardedSmallD
+from smalld.testing import FakeDiscord
+
+
+def connect(coordinator):
+    parent_conn, child_conn = Pipe()
+    Thread(target=coordinator.serve, args=(Channel(parent_conn),), daemon=True).start()
+    client = CoordinatorClient(child_conn)
+    client.start()
+    return client
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def reply_with_pid(smalld):
+    @smalld.on_message_create
+    def on_message(data):
+        smalld.post(f"/channels/{data.channel_id}/messages", {"pid": os.getpid()})
+
+
+def test_split_shards_into_contiguous_ranges():
+    assert split_shards(5, 2) == [[0, 1, 2], [3, 4]]
+    assert split_shards(4, 4) == [[0], [1], [2], [3]]
+
+
+def test_coordinator_spaces_identifies_from_all_workers():
+    coordinator = Coordinator(max_concurrency=1)
+    limiters = [RemoteIdentifyRateLimiter(connect(coordinator)) for _ in range(2)]
+
+    with patch.object(coordinator.identify_limiter, "IDENTIFY_INTERVAL", 0.2):
+        identified = []
+
+        def identify(limiter):
+            limiter.on_identify(0)
+            identified.append(time.monotonic())
+
+        threads = [Thread(target=identify, args=(l,)) for l in limiters]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+    assert len(identified) == 2
+    assert abs(identified[1] - identified[0]) >= 0.2
+
+
+def test_coordinator_shares_global_ratelimit_between_workers():
+    coordinator = Coordinator()
+    bucket_a = RemoteGlobalRateLimitBucket(connect(coordinator))
+    bucket_b = RemoteGlobalRateLimitBucket(connect(coordinator))
+
+    bucket_a.take()
+    bucket_a.update({"X-RateLimit-Global": "true", "Retry-After": 5000})
+
+    with pytest.raises(RateLimitError) as e:
+        bucket_b.take()
+
+    assert e.value.is_global
+    assert e.value.reset == bucket_a.reset
+
+
+def test_client_closes_when_coordinator_goes_away():
+    closed = []
+    parent_conn, child_conn = Pipe()
+    CoordinatorClient(child_conn, on_close=lambda: closed.append(True)).start()
+
+    parent_conn.close()
+
+    wait_for(lambda: closed)
+
+
+def test_worker_setup_can_make_requests():
+    parent_conn, child_conn = Pipe()
+    Thread(
+        target=Coordinator().serve, args=(Channel(parent_conn),), daemon=True
+    ).start()
+    fetched = []
+
+    def setup(smalld):
+        fetched.append(smalld.get("users/@me"))
+
+    with FakeDiscord() as discord, patch.object(AutoShardedSmallD, "run"):
+        worker = Thread(
+            target=run_worker,
+            args=(
+                child_conn,
+                "token",
+                [0],
+                {"shards": 1},
+                setup,
+                {"base_url": discord.base_url},
+            ),
+            daemon=True,
+        )
+        worker.start()
+        worker.join(10)
+
+    assert fetched == [{}]
+
+
+def test_cluster_runs_shards_across_workers(caplog):
+    caplog.set_level(logging.INFO, logger="smalld")
+
+    with FakeDiscord(shards=4, max_concurrency=4, heartbeat_interval=1000) as discord:
+        discord.events_for = lambda shard: [
+            {"t": "MESSAGE_CREATE", "d": {"channel_id": str(shard[0])}}
+        ]
+
+        cluster = ShardCluster(
+            "token", setup=reply_with_pid, workers=2, base_url=discord.base_url
+        )
+        thread = Thread(target=cluster.run)
+        thread.start()
+
+        try:
+            wait_for(lambda: len([r for r in discord.requests if r[0] == "POST"]) == 4)
+        finally:
+            cluster.close()
+            thread.join(20)
+
+    assert not thread.is_alive()
+    assert sorted(shard for _, shard in discord.identifies) == [
+        (i, 4) for i in range(4)
+    ]
+
+    pids = {
+        path: json.loads(body)["pid"]
+        for method, path, body in discord.requests
+        if method == "POST"
+    }
+    assert pids["channels/0/messages"] == pids["channels/1/messages"]
+    assert pids["channels/2/messages"] == pids["channels/3/messages"]
+    assert pids["channels/0/messages"] != pids["channels/2/messages"]
+    assert os.getpid() not in pids.values()
+    assert "Starting 4 shards in 2 workers with max concurrency 4." in caplog.messages
@@ -0,0 +1,41 @@
+import pytest
+from smalld.codec import JSON_CODECS, EtfCodec, JsonCodec, get_json_codec
+from smalld.exceptions import SmallDError
+
+available_codecs = [codec for codec in JSON_CODECS.values() if codec.available]
+
+
+@pytest.mark.parametrize("codec", available_codecs, ids=lambda codec: codec.name)
+def test_json_codec_round_trips(codec):
+    value = {"op": 0, "d": {"id": "175928847299117063", "list": [1, 2.5, None]}}
+
+    assert codec.loads(codec.dumps(value).encode("utf-8")) == value
+    assert codec.loads(b'{"key": "value"}') == {"key": "value"}
+
+
+@pytest.mark.parametrize("codec", available_codecs, ids=lambda codec: codec.name)
+def test_json_codec_raises_decode_error(codec):
+    with pytest.raises(codec.decode_error):
+        codec.loads(b"invalid json")
+
+
+def test_get_json_codec_prefers_available_fast_codecs():
+    assert get_json_codec() is available_codecs[0]
+    assert get_json_codec("json") is JsonCodec
+
+
+def test_get_json_codec_passes_codecs_through():
+    assert get_json_codec(EtfCodec) is EtfCodec
+
+
+def test_get_json_codec_raises_for_unknown_codec():
+    with pytest.raises(SmallDError):
+        get_json_codec("unknown")
+
+
+@pytest.mark.parametrize(
+    "codec", [c for c in JSON_CODECS.values() if not c.available], ids=str
+)
+def test_get_json_codec_raises_for_unavailable_codec(codec):
+    with pytest.raises(SmallDError):
+        get_json_codec(codec.name)
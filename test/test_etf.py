@@ -0,0 +1,70 @@
+import pytest
+from smalld.etf import ETFError, pack, unpack
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (b"\x83a\x05", 5),
+        (b"\x83b\xff\xff\xff\xfe", -2),
+        (b"\x83F?\xf8\x00\x00\x00\x00\x00\x00", 1.5),
+        (b"\x83w\x03nil", None),
+        (b"\x83w\x04true", True),
+        (b"\x83d\x00\x05false", False),
+        (b"\x83w\x02op", "op"),
+        (b"\x83m\x00\x00\x00\x03abc", "abc"),
+        (b"\x83j", []),
+        (b"\x83l\x00\x00\x00\x02a\x01a\x02j", [1, 2]),
+        (b"\x83h\x02a\x01a\x02", [1, 2]),
+        (b"\x83k\x00\x02\x01\x02", [1, 2]),
+        (b"\x83n\x08\x00\x00\x00\x00\x00\x00\x00\x00\x01", 2 ** 56),
+        (b"\x83n\x01\x01\x05", -5),
+        (b"\x83t\x00\x00\x00\x01w\x01aa\x01", {"a": 1}),
+    ],
+)
+def test_unpack(data, expected):
+    assert unpack(data) == expected
+
+
+def test_unpack_compressed():
+    assert unpack(b"\x83P\x00\x00\x00\x02x\x9cKd\x05\x00\x00\xc9\x00g") == 5
+
+
+@pytest.mark.parametrize("data", [b"", b"\x82a\x01", b"\x83\xffa", b"\x83m\x00\x00"])
+def test_unpack_raises_for_invalid_data(data):
+    with pytest.raises(ETFError):
+        unpack(data)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        True,
+        False,
+        0,
+        255,
+        256,
+        -1,
+        2 ** 31,
+        -(2 ** 40),
+        175928847299117063,
+        1.25,
+        "",
+        "snowman ☃",
+        [],
+        [1, [2, "three"]],
+        {"op": 2, "d": {"token": "abc", "shard": [0, 1], "presence": None}},
+    ],
+)
+def test_pack_round_trips(value):
+    assert unpack(pack(value)) == value
+
+
+def test_pack_encodes_tuples_as_lists():
+    assert unpack(pack((0, 1))) == [0, 1]
+
+
+def test_pack_raises_for_unsupported_types():
+    with pytest.raises(ETFError):
+        pack(object())
@@ -0,0 +1,72 @@
+from threading import Event
+
+from smalld.executor import PartitionedExecutor, partition_key
+from smalld.json_elements import JsonObject
+
+
+def test_partition_key_prefers_guild_then_channel():
+    def payload(**d):
+        return JsonObject({"op": 0, "t": "EVENT", "d": d})
+
+    assert partition_key(payload(guild_id="1", channel_id="2")) == "1"
+    assert partition_key(payload(channel_id="2")) == "2"
+    assert partition_key(payload()) == "EVENT"
+    assert partition_key(JsonObject({"op": 0, "t": "EVENT", "d": None})) == "EVENT"
+
+
+def test_partition_key_of_guild_events_is_the_guild():
+    guild_create = JsonObject({"op": 0, "t": "GUILD_CREATE", "d": {"id": "42"}})
+    member_add = JsonObject(
+        {"op": 0, "t": "GUILD_MEMBER_ADD", "d": {"guild_id": "42", "user": {}}}
+    )
+    guild_delete = JsonObject({"op": 0, "t": "GUILD_DELETE", "d": {"id": "42"}})
+
+    assert partition_key(guild_create) == partition_key(member_add) == "42"
+    assert partition_key(guild_delete) == "42"
+
+
+def test_executor_keeps_partition_order():
+    executor = PartitionedExecutor(4)
+    executor.start()
+    results = {key: [] for key in range(8)}
+
+    for i in range(100):
+        for key in results:
+            executor.submit(key, results[key].append, i)
+
+    executor.shutdown()
+    for thread in executor.threads:
+        thread.join()
+
+    assert all(result == list(range(100)) for result in results.values())
+
+
+def test_executor_runs_partitions_in_parallel():
+    executor = PartitionedExecutor(2)
+    executor.start()
+    blocked, unblock = Event(), Event()
+
+    def block():
+        blocked.set()
+        unblock.wait(5)
+
+    keys = [0, 1]  # hash(n) == n for small ints, one per worker
+    executor.submit(keys[0], block)
+    blocked.wait(5)
+    executor.submit(keys[1], unblock.set)
+
+    assert unblock.wait(5)
+    executor.shutdown()
+
+
+def test_executor_reports_stats():
+    executor = PartitionedExecutor(2)
+    executor.start()
+    executor.shutdown()
+    for thread in executor.threads:
+        thread.join()
+
+    stats = executor.stats()
+
+    assert stats["queue_depth"] == [0, 0]
+    assert len(stats["utilization"]) == 2
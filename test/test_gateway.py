@@ -1,7 +1,9 @@
+import zlib
 from unittest import mock
 
 import pytest
-from smalld.gateway import Gateway
+from smalld.codec import EtfCodec, get_json_codec
+from smalld.gateway import Gateway, decode_payload, peek
 from websocket import ABNF, WebSocketException
 
 CONNECTION_URL = "ws://example.url/"
@@ -90,3 +92,119 @@ def test_gateway_end_when_websocket_exception(ws_mock):
 
     for data in gateway:
         pytest.fail("Should receive no data")
+
+
+def zlib_stream_frames(*payloads):
+    compressor = zlib.compressobj()
+    return [
+        compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        for payload in payloads
+    ]
+
+
+def test_gateway_connects_with_compression(ws_mock):
+    ws_mock.recv_data.return_value = ABNF.OPCODE_TEXT, b"{}"
+    gateway = Gateway(CONNECTION_URL, compress=True)
+
+    it = iter(gateway)
+    next(it)
+    it.close()
+
+    ws_mock.connect.assert_called_once_with(CONNECTION_URL + "?compress=zlib-stream")
+
+
+def test_gateway_inflates_zlib_stream_frames(ws_mock):
+    first, second = zlib_stream_frames(b'{"key": "value"}', b'{"key": "other"}')
+    ws_mock.recv_data.side_effect = [
+        (ABNF.OPCODE_BINARY, first),
+        (ABNF.OPCODE_BINARY, second[:3]),
+        (ABNF.OPCODE_BINARY, second[3:]),
+    ]
+    gateway = Gateway(CONNECTION_URL, compress=True)
+
+    it = iter(gateway)
+    results = [next(it), next(it)]
+    it.close()
+
+    assert results == [{"key": "value"}, {"key": "other"}]
+
+
+def test_gateway_resets_inflater_on_reconnect(ws_mock):
+    frames = zlib_stream_frames(b'{"key": "value"}')
+    gateway = Gateway(CONNECTION_URL, compress=True)
+
+    for _ in range(2):
+        ws_mock.recv_data.side_effect = [(ABNF.OPCODE_BINARY, frames[0])]
+        it = iter(gateway)
+        assert next(it) == {"key": "value"}
+        it.close()
+
+
+def test_gateway_decodes_etf_frames(ws_mock):
+    ws_mock.recv_data.side_effect = [
+        (ABNF.OPCODE_BINARY, b"\x83t\x00\x00\x00\x01w\x03keym\x00\x00\x00\x05value")
+    ]
+    gateway = Gateway(CONNECTION_URL, codec=EtfCodec)
+
+    it = iter(gateway)
+    result = next(it)
+    it.close()
+
+    ws_mock.connect.assert_called_once_with(CONNECTION_URL + "?encoding=etf")
+    assert result == {"key": "value"}
+
+
+def test_gateway_sends_etf_as_binary(ws_mock):
+    gateway = Gateway(CONNECTION_URL, codec=EtfCodec)
+
+    gateway.send({"op": 1})
+
+    ws_mock.send_binary.assert_called_once_with(
+        b"\x83t\x00\x00\x00\x01m\x00\x00\x00\x02opa\x01"
+    )
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (
+            b'{"t":"TYPING_START","s":42,"op":0,"d":{"t":"X","op":1}}',
+            {"op": 0, "t": "TYPING_START", "s": 42},
+        ),
+        (
+            b'{"t": null, "s": null, "op": 11, "d": null}',
+            {"op": 11, "t": None, "s": None},
+        ),
+        (b'{"op": 0, "t": "READY", "d": {}}', None),
+        (b'{"op": 0, "t": "PRESENCE_UPDATE", "d": {}, "s": 42}', None),
+        (b'{"d": {"t": "X"}, "op": 0, "t": "READY", "s": 1}', None),
+        (b'{"op": 0, "s": 1}', None),
+    ],
+)
+def test_peek(data, expected):
+    assert peek(data) == expected
+
+
+def test_decode_payload_keeps_s_that_comes_after_d():
+    data = b'{"op":0,"t":"PRESENCE_UPDATE","d":{"a":1},"s":42}'
+
+    payload = decode_payload(data, get_json_codec("json"), skip=lambda t: True)
+
+    assert payload["s"] == 42
+
+
+def test_gateway_skips_decoding_unwanted_dispatches(ws_mock):
+    ws_mock.recv_data.side_effect = [
+        (ABNF.OPCODE_TEXT, b'{"t":"TYPING_START","s":1,"op":0,"d":{"x":1}}'),
+        (ABNF.OPCODE_TEXT, b'{"t":"MESSAGE_CREATE","s":2,"op":0,"d":{"x":1}}'),
+    ]
+    gateway = Gateway(CONNECTION_URL, skip=lambda t: t == "TYPING_START")
+
+    it = iter(gateway)
+    results = [next(it), next(it)]
+    it.close()
+
+    assert results == [
+        {"op": 0, "t": "TYPING_START", "s": 1},
+        {"op": 0, "t": "MESSAGE_CREATE", "s": 2, "d": {"x": 1}},
+    ]
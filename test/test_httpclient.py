@@ -1,9 +1,13 @@
+import json
+import threading
+import time
 from unittest.mock import patch
 
 import pytest
 import responses
-from smalld import HttpError, NetworkError
-from smalld.smalld import HttpClient
+from smalld import HttpError, NetworkError, RateLimitError
+from smalld.cache import ResponseCache
+from smalld.smalld import HttpClient, SingleFlight
 
 
 @pytest.fixture(autouse=True)
@@ -95,3 +99,106 @@ def test_httpclient_raises_for_response_decoding_errors(invalid_json):
     client = HttpClient("token", "https://domain.com")
     with pytest.raises(HttpError):
         client.get("get")
+
+
+@responses.activate
+def test_httpclient_retries_when_limiter_waits_for_ratelimit(limiter):
+    limiter.on_response.side_effect = [RateLimitError(1), None]
+    responses.add(responses.GET, "https://domain.com/get", status=429)
+    responses.add(responses.GET, "https://domain.com/get", json={"data": "value"})
+
+    client = HttpClient("token", "https://domain.com", wait_on_ratelimit=True)
+    res = client.get("get")
+
+    assert res.data == "value"
+    assert len(responses.calls) == 2
+    limiter.wait.assert_called_once()
+
+
+@responses.activate
+def test_httpclient_raises_when_limiter_does_not_wait(limiter):
+    limiter.on_response.side_effect = RateLimitError(1)
+
+    def reraise(e):
+        raise e
+
+    limiter.wait.side_effect = reraise
+    responses.add(responses.GET, "https://domain.com/get", status=429)
+
+    client = HttpClient("token", "https://domain.com")
+    with pytest.raises(RateLimitError):
+        client.get("get")
+
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_httpclient_sends_payload_as_json():
+    responses.add(responses.POST, "https://domain.com/post", json={})
+    client = HttpClient("token", "https://domain.com")
+
+    client.post("post", {"key": "value"})
+
+    request = responses.calls[0].request
+    assert request.headers["Content-Type"] == "application/json"
+    assert json.loads(request.body) == {"key": "value"}
+
+
+@responses.activate
+def test_httpclient_serves_cached_get_until_written():
+    responses.add(responses.GET, "https://domain.com/guilds/1/roles", json=[1])
+    responses.add(responses.POST, "https://domain.com/guilds/1/roles", json={})
+    client = HttpClient("token", "https://domain.com", response_cache=ResponseCache())
+
+    assert list(client.get("guilds/1/roles")) == [1]
+    assert list(client.get("/guilds/1/roles/")) == [1]
+    assert len(responses.calls) == 1
+
+    client.post("guilds/1/roles", {"name": "role"})
+    client.get("guilds/1/roles")
+
+    assert len(responses.calls) == 3
+
+
+def test_single_flight_shares_result_of_concurrent_calls():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def fetch():
+        calls.append(1)
+        release.wait()
+        return {"data": "value"}
+
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(single_flight.call("key", fetch))
+        )
+        for _ in range(5)
+    ]
+    threads[0].start()
+    while "key" not in single_flight.calls:
+        pass
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"data": "value"}] * 5
+    assert single_flight.calls == {}
+
+
+def test_single_flight_raises_error_for_all_callers():
+    single_flight = SingleFlight()
+
+    def fail():
+        raise HttpError
+
+    with pytest.raises(HttpError):
+        single_flight.call("key", fail)
+
+    assert single_flight.call("key", lambda: 1) == 1
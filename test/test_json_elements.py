@@ -0,0 +1,50 @@
+import pytest
+from smalld.json_elements import JsonArray, JsonObject
+
+
+@pytest.fixture
+def guild():
+    return JsonObject(
+        {
+            "id": "1",
+            "members": [{"user": {"id": "2"}}, {"user": {"id": "3"}}],
+            "features": ["A", "B"],
+        }
+    )
+
+
+def test_json_object_wraps_children(guild):
+    assert isinstance(guild.members, JsonArray)
+    assert isinstance(guild.members[0], JsonObject)
+    assert guild.members[0].user.id == "2"
+    assert guild.id == "1"
+
+
+def test_json_object_reuses_child_wrappers(guild):
+    assert guild.members is guild["members"]
+    assert guild.members[0] is guild.members[0]
+    assert guild.members[-1] is guild.members[1]
+    assert guild.members[0].user is guild.members[0].user
+
+
+def test_json_array_iterates_wrapped_children(guild):
+    assert [member.user.id for member in guild.members] == ["2", "3"]
+    assert list(guild.features) == ["A", "B"]
+    assert list(guild.members)[1] is guild.members[1]
+
+
+def test_json_array_slices(guild):
+    sliced = guild.members[1:]
+
+    assert isinstance(sliced, JsonArray)
+    assert [member.user.id for member in sliced] == ["3"]
+
+
+def test_to_native_returns_unwrapped_data(guild):
+    assert guild.to_native()["members"][0] == {"user": {"id": "2"}}
+    assert guild.members.to_native() == [{"user": {"id": "2"}}, {"user": {"id": "3"}}]
+
+
+def test_json_object_raises_attribute_error_for_missing_keys(guild):
+    with pytest.raises(AttributeError):
+        guild.missing
@@ -0,0 +1,96 @@
+from threading import current_thread
+from unittest.mock import Mock, patch
+
+import pytest
+from smalld.exceptions import SmallDError
+from smalld.json_elements import JsonObject
+from smalld.members import GuildMemberRequests
+from smalld.smalld import SmallD
+
+
+@pytest.fixture
+def smalld():
+    with patch("smalld.smalld.HttpClient", autospec=True):
+        smalld = SmallD("token")
+    smalld.send_gateway_payload = Mock()
+    return smalld
+
+
+def chunk(smalld, nonce, members, index=0, count=1, **kwargs):
+    d = {
+        "guild_id": "1",
+        "members": [{"user": {"id": m}} for m in members],
+        "chunk_index": index,
+        "chunk_count": count,
+        "nonce": nonce,
+        **kwargs,
+    }
+    smalld.notify_listeners(
+        JsonObject({"op": 0, "t": "GUILD_MEMBERS_CHUNK", "s": 1, "d": d})
+    )
+
+
+def sent_nonce(smalld, call=-1):
+    return smalld.send_gateway_payload.call_args_list[call][0][0]["d"]["nonce"]
+
+
+def test_request_sends_request_guild_members(smalld):
+    GuildMemberRequests(smalld).request("1", query="a", limit=10)
+
+    payload = smalld.send_gateway_payload.call_args[0][0]
+    assert payload["op"] == 8
+    assert payload["d"] == {
+        "guild_id": "1",
+        "query": "a",
+        "limit": 10,
+        "presences": False,
+        "nonce": sent_nonce(smalld),
+    }
+
+
+def test_request_streams_members_of_matching_chunks(smalld):
+    requests = GuildMemberRequests(smalld)
+    first = requests.request("1")
+    second = requests.request("1", user_ids=["5", "6"])
+
+    chunk(smalld, sent_nonce(smalld, 0), ["1", "2"], index=0, count=2)
+    chunk(smalld, sent_nonce(smalld, 1), ["5"], not_found=["6"])
+    chunk(smalld, "unknown", ["9"])
+    chunk(smalld, sent_nonce(smalld, 0), ["3"], index=1, count=2)
+
+    assert [m.user.id for m in first] == ["1", "2", "3"]
+    assert [m.user.id for m in second] == ["5"]
+    assert second.not_found == ["6"]
+    assert requests.requests == {}
+
+
+def test_request_waits_when_budget_is_used(smalld):
+    requests = GuildMemberRequests(smalld, budget=2)
+
+    with patch("time.time", return_value=100), patch("time.sleep") as sleep:
+        sleep.side_effect = lambda seconds: requests.limiters[smalld][0].window.clear()
+        for _ in range(3):
+            requests.request("1")
+
+    sleep.assert_called_once_with(60)
+    assert smalld.send_gateway_payload.call_count == 3
+
+
+def test_request_times_out_without_chunks(smalld):
+    requests = GuildMemberRequests(smalld, timeout=0.01)
+    members = requests.request("1")
+
+    with pytest.raises(SmallDError):
+        list(members)
+
+    assert requests.requests == {}
+
+
+def test_request_can_not_be_iterated_on_the_gateway_thread(smalld):
+    requests = GuildMemberRequests(smalld)
+    smalld.gateway_thread = current_thread()
+
+    with pytest.raises(SmallDError):
+        list(requests.request("1"))
+
+    assert requests.requests == {}
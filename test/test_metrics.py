@@ -0,0 +1,180 @@
+import time
+import urllib.request
+from threading import Event, Thread
+from unittest.mock import patch
+
+import pytest
+import responses
+from smalld.json_elements import JsonObject
+from smalld.metrics import Metrics, Registry
+from smalld.smalld import HttpClient, SmallD
+from smalld.standard_listeners import Heartbeat
+
+
+def test_registry_exposes_counters():
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests.", ("route",))
+    counter.inc('GET "a"\n')
+    counter.inc('GET "a"\n', amount=2)
+
+    assert registry.exposition() == (
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="GET \\"a\\"\\n"} 3\n'
+    )
+
+
+def test_registry_exposes_histograms():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert registry.exposition() == (
+        "# HELP latency_seconds Latency.\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{le="0.1"} 1\n'
+        'latency_seconds_bucket{le="1.0"} 2\n'
+        'latency_seconds_bucket{le="+Inf"} 3\n'
+        "latency_seconds_sum 5.55\n"
+        "latency_seconds_count 3\n"
+    )
+
+
+def test_histogram_samples_are_consistent_while_observing():
+    histogram = Registry().histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    done = Event()
+
+    def observe():
+        while not done.is_set():
+            histogram.observe(0.5)
+
+    thread = Thread(target=observe)
+    thread.start()
+    try:
+        for _ in range(100):
+            samples = {}
+            for name, labels, value in histogram.samples():
+                samples[name, labels] = value
+                time.sleep(0)
+            bucket = samples["latency_seconds_bucket", '{le="1.0"}']
+            assert bucket == samples["latency_seconds_count", ""]
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_registry_serves_exposition():
+    registry = Registry()
+    registry.counter("events_total", "Events.").inc()
+    server = registry.serve(port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as res:
+            body = res.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert body == registry.exposition()
+
+
+@responses.activate
+def test_httpclient_records_rest_metrics():
+    metrics = Metrics()
+    url = "https://domain.com/channels/1/messages"
+    headers = {
+        "X-RateLimit-Bucket": "abc",
+        "X-RateLimit-Remaining": "0",
+        "X-RateLimit-Reset": "0",
+        "X-RateLimit-Reset-After": "0",
+    }
+    responses.add(responses.GET, url, json={}, status=429, headers=headers)
+    responses.add(responses.GET, url, json=[], headers=headers)
+
+    client = HttpClient(
+        "token", "https://domain.com", wait_on_ratelimit=True, metrics=metrics
+    )
+    client.get("channels/1/messages")
+
+    route = "GET channels/{}/messages"
+    assert metrics.rest_requests.get(route, "429") == 1
+    assert metrics.rest_requests.get(route, "200") == 1
+    assert metrics.rest_duration.count(route) == 2
+    assert metrics.rest_ratelimited.get(route, "bucket") == 1
+    assert metrics.ratelimit_waits.get("bucket") == 1
+
+
+def test_rest_routes_mask_tokens_and_codes():
+    metrics = Metrics()
+    metrics.on_rest_response("POST", "webhooks/1/SECRET-token", 204, 0.1)
+    metrics.on_rest_response("PATCH", "webhooks/1/SECRET-token/messages/2", 200, 0.1)
+    metrics.on_ratelimited(
+        "PUT", "channels/1/messages/2/reactions/%F0%9F%91%8D/@me", False
+    )
+
+    exposition = metrics.exposition()
+
+    assert "SECRET" not in exposition
+    assert metrics.rest_requests.get("POST webhooks/{}/{webhook.token}", "204") == 1
+    assert (
+        metrics.rest_requests.get(
+            "PATCH webhooks/{}/{webhook.token}/messages/{}", "200"
+        )
+        == 1
+    )
+    assert (
+        metrics.rest_ratelimited.get(
+            "PUT channels/{}/messages/{}/reactions/{emoji}/@me", "bucket"
+        )
+        == 1
+    )
+
+
+def test_smalld_records_gateway_metrics():
+    metrics = Metrics()
+    payloads = [
+        {"op": 0, "t": "MESSAGE_CREATE", "s": 1, "d": {}},
+        {"op": 11, "t": None, "d": None},
+    ]
+
+    with patch("smalld.smalld.HttpClient", autospec=True) as client_cls, patch(
+        "smalld.smalld.Gateway"
+    ) as gateway_cls, patch("time.sleep"):
+        client_cls.return_value.get.return_value = JsonObject({"url": "url"})
+        smalld = SmallD("token", metrics=metrics)
+        connections = iter([payloads, payloads])
+
+        def iter_gateway():
+            try:
+                yield from map(JsonObject, next(connections))
+            except StopIteration:
+                smalld.close()
+
+        gateway_cls.return_value.__iter__.side_effect = iter_gateway
+        gateway_cls.return_value.close_reason = None
+        smalld.run()
+
+    assert gateway_cls.call_args[1]["metrics"] is metrics
+    assert metrics.gateway_connections.get() == 3
+    assert metrics.gateway_reconnects.get() == 2
+    assert metrics.gateway_events.get("0", "MESSAGE_CREATE") == 2
+    assert metrics.gateway_events.get("11", "") == 2
+    assert metrics.notify_duration.count("MESSAGE_CREATE") == 2
+
+
+def test_heartbeat_records_ack_round_trip():
+    metrics = Metrics()
+    with patch("smalld.smalld.HttpClient", autospec=True):
+        smalld = SmallD("token", metrics=metrics)
+    smalld.send_gateway_payload = lambda data: None
+    heartbeat = Heartbeat(smalld, JsonObject({"number": 1}))
+
+    with patch("time.monotonic", return_value=10):
+        heartbeat.send_heartbeat()
+    with patch("time.monotonic", return_value=10.25):
+        heartbeat.on_heartbeat_ack(JsonObject({"op": 11}))
+
+    assert heartbeat.latency == pytest.approx(0.25)
+    assert metrics.heartbeat_ack.count() == 1
@@ -0,0 +1,88 @@
+import time
+from threading import Event
+
+from smalld.json_elements import JsonObject
+from smalld.pagination import get_pagination, paginate
+from smalld.ratelimit import RateLimiter
+
+
+class FakeHttp:
+    def __init__(self, ids, key="id", blocked=None):
+        self.items = [{key: str(i)} for i in ids]
+        self.key = key
+        self.requests = []
+        self.blocked = blocked
+        self.limiter = RateLimiter()
+
+    def get(self, path, params):
+        self.requests.append(params)
+        if self.blocked and len(self.requests) > 1:
+            self.blocked.wait()
+
+        ids = lambda: ((int(item[self.key]), item) for item in self.items)
+        if "before" in params:
+            page = [item for i, item in ids() if i < int(params["before"])][::-1]
+        else:
+            after = int(params.get("after", 0))
+            page = [item for i, item in ids() if i > after]
+        return JsonObject(page[: params["limit"]])
+
+
+def test_paginate_yields_every_item_a_page_at_a_time():
+    http = FakeHttp(range(1, 251))
+
+    items = paginate(http, "users/@me/guilds")
+
+    assert [item.id for item in items] == [str(i) for i in range(1, 251)]
+    assert http.requests == [{"limit": 200}, {"limit": 200, "after": "200"}]
+
+
+def test_paginate_goes_backwards_for_messages():
+    http = FakeHttp(range(1, 6))
+
+    items = paginate(http, "/channels/1/messages", {"before": "6"}, limit=2)
+
+    assert [item.id for item in items] == ["5", "4", "3", "2", "1"]
+    assert [params.get("before") for params in http.requests] == ["6", "4", "2"]
+
+
+def test_paginate_prefetches_next_page_while_page_is_consumed():
+    blocked = Event()
+    http = FakeHttp(range(1, 5), blocked=blocked)
+    items = paginate(http, "users/@me/guilds", limit=2)
+
+    assert next(items).id == "1"
+
+    # the second page is requested while the generator is suspended
+    deadline = time.monotonic() + 5
+    while len(http.requests) < 2:
+        assert time.monotonic() < deadline
+    blocked.set()
+
+    assert [item.id for item in items] == ["2", "3", "4"]
+
+
+def test_paginate_does_not_prefetch_from_exhausted_bucket():
+    http = FakeHttp(range(1, 5))
+    http.limiter.on_response(
+        "GET",
+        "users/@me/guilds",
+        {
+            "X-RateLimit-Bucket": "abc",
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": "1e12",
+        },
+        200,
+    )
+    items = paginate(http, "users/@me/guilds", limit=2)
+
+    next(items)
+
+    assert len(http.requests) == 1
+
+
+def test_paginate_uses_user_id_for_members():
+    pagination = get_pagination("guilds/1/members")
+
+    assert pagination.limit == 1000
+    assert pagination.next_cursor([{"user": {"id": "3"}}, {"user": {"id": "5"}}]) == "5"
@@ -0,0 +1,85 @@
+import logging
+import time
+from unittest.mock import patch
+
+import pytest
+from smalld.exceptions import SmallDError
+from smalld.json_elements import JsonObject
+from smalld.profiling import ListenerProfiler, percentile
+from smalld.smalld import SmallD
+
+
+def create_smalld(**kwargs):
+    with patch("smalld.smalld.HttpClient", autospec=True):
+        return SmallD("token", **kwargs)
+
+
+def dispatch(smalld, t):
+    smalld.notify_listeners(JsonObject({"op": 0, "t": t, "s": 1, "d": {}}))
+
+
+def test_profiler_keys_by_listener_name_and_event_type():
+    smalld = create_smalld(profile_listeners=True)
+
+    @smalld.on_message_create
+    def on_message(data):
+        pass
+
+    dispatch(smalld, "MESSAGE_CREATE")
+    dispatch(smalld, "MESSAGE_CREATE")
+
+    stats = {(s["listener"], s["t"]): s for s in smalld.profiler.stats()}
+    name = f"{__name__}.test_profiler_keys_by_listener_name_and_event_type.<locals>.on_message"
+    assert stats[(name, "MESSAGE_CREATE")]["count"] == 2
+    assert name in smalld.profile_report()
+
+
+def test_profiler_times_listeners_that_raise():
+    profiler = ListenerProfiler()
+
+    def fail(data):
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        profiler.call(fail, {"t": "READY"})
+
+    assert profiler.stats()[0]["count"] == 1
+    assert profiler.running == {}
+
+
+def test_watchdog_logs_stack_of_slow_listener(caplog):
+    smalld = create_smalld(slow_listener_threshold=0.05)
+
+    @smalld.on_message_create
+    def slow_listener(data):
+        time.sleep(0.3)
+
+    with caplog.at_level(logging.WARNING, logger="smalld"):
+        dispatch(smalld, "MESSAGE_CREATE")
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert len(messages) == 1
+    assert "slow_listener" in messages[0]
+    assert "time.sleep(0.3)" in messages[0]
+
+
+def test_watchdog_stops_when_idle_and_starts_for_next_call():
+    profiler = ListenerProfiler(slow_threshold=0.02)
+    profiler.call(lambda data: None, {"t": "READY"})
+    profiler.watchdog.join(timeout=1)
+
+    assert profiler.watchdog is None
+
+    call = profiler.start(lambda data: None, {"t": "READY"})
+    assert profiler.watchdog.is_alive()
+    profiler.stop(call)
+
+
+def test_profile_report_raises_when_not_profiling():
+    with pytest.raises(SmallDError):
+        create_smalld().profile_report()
+
+
+def test_percentile():
+    assert percentile(list(range(100)), 0.99) == 99
+    assert percentile([], 0.99) == 0.0
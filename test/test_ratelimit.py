@@ -1,4 +1,7 @@
-from unittest.mock import patch
+import multiprocessing
+import pickle
+import threading
+from unittest.mock import Mock, patch
 
 import pytest
 from smalld.ratelimit import *
@@ -39,6 +42,13 @@ def time():
         yield time
 
 
+@pytest.fixture()
+def sleep(time):
+    with patch("time.sleep") as sleep_mock:
+        sleep_mock.side_effect = lambda seconds: time.set_to(time() + seconds)
+        yield sleep_mock
+
+
 def test_resource_ratelimit_bucket(time):
     time.set_to(1000)
     bucket = ResourceRateLimitBucket("abc123")
@@ -65,7 +75,7 @@ def test_global_ratelimit_bucket(time):
     assert not limit.is_ratelimited
     limit.take()  # doesn't raise
 
-    limit.update(make_global_ratelimit_headers(100))
+    limit.update(make_global_ratelimit_headers(1))
 
     assert limit.is_ratelimited
 
@@ -76,6 +86,32 @@ def test_global_ratelimit_bucket(time):
     assert e.reset == 101 and e.is_global == True
 
 
+def test_global_ratelimit_bucket_reads_retry_after_in_ms(time):
+    time.set_to(100)
+    limit = GlobalRateLimitBucket(retry_after_in_ms=True)
+
+    limit.update(make_global_ratelimit_headers(1500))
+
+    with pytest.raises(RateLimitError) as exc_info:
+        limit.take()
+
+    assert exc_info.value.reset == 102
+
+
+@pytest.mark.parametrize(
+    "base_url, expected",
+    [
+        ("https://discord.com/api/v6", True),
+        ("https://discord.com/api/v8", False),
+        ("https://discord.com/api/v9", False),
+        ("https://discord.com/api/v10", False),
+        ("http://localhost:8080", False),
+    ],
+)
+def test_is_retry_after_in_ms(base_url, expected):
+    assert is_retry_after_in_ms(base_url) == expected
+
+
 def test_ratelimit_passes_first_request():
     limiter = RateLimiter()
     limiter.on_request("GET", "/path/to/resource")  # doesn't raise
@@ -95,7 +131,7 @@ def test_ratelimit_passes_good_response(time):
             0,
             1,
             True,
-            ("GET", "/path/to/resource", make_global_ratelimit_headers(100), 429),
+            ("GET", "/path/to/resource", make_global_ratelimit_headers(1), 429),
         ),
         (
             1000,
@@ -136,6 +172,138 @@ def test_ratelimit_raises_on_request_exhausted_resource(time):
     assert exc_info.value.reset == 1002
 
 
+def test_blocking_ratelimit_waits_for_exhausted_resource(time, sleep):
+    time.set_to(1000)
+    limiter = RateLimiter(blocking=True)
+    bucket = limiter.resource_buckets[
+        ("GET", "path/to/resource")
+    ] = ResourceRateLimitBucket("abc123")
+    bucket.update(make_ratelimit_headers("abc123", 10, 0, 1002, 2))
+
+    limiter.on_request("GET", "path/to/resource")  # doesn't raise
+
+    sleep.assert_called_once_with(2)
+    assert time() == 1002
+
+
+def test_blocking_ratelimit_raises_when_reset_exceeds_max_wait(time, sleep):
+    time.set_to(1000)
+    limiter = RateLimiter(blocking=True, max_wait=1)
+    limiter.global_bucket.update(make_global_ratelimit_headers(5))
+
+    with pytest.raises(RateLimitError) as exc_info:
+        limiter.on_request("GET", "path/to/resource")
+
+    assert exc_info.value.is_global
+    sleep.assert_not_called()
+
+
+def test_ratelimit_wait_raises_when_not_blocking(sleep):
+    limiter = RateLimiter()
+
+    with pytest.raises(RateLimitError):
+        limiter.wait(RateLimitError(1))
+
+    sleep.assert_not_called()
+
+
+def exhaust_bucket(store):
+    limiter = RateLimiter(store=store)
+    limiter.on_response(
+        "GET", "channels/1/messages", make_ratelimit_headers("abc123", 10, 0, 1e12), 200
+    )
+
+
+def test_limiters_sharing_a_store_share_buckets(time):
+    store = MemoryBucketStore()
+    limiter = RateLimiter(store=store)
+
+    exhaust_bucket(store)
+
+    with pytest.raises(RateLimitError) as exc_info:
+        limiter.on_request("GET", "channels/1/messages")
+
+    assert exc_info.value.reset == 1e12
+
+
+def test_limiters_sharing_a_store_share_global_ratelimit(time):
+    store = MemoryBucketStore()
+    limiter = RateLimiter(store=store)
+
+    RateLimiter(store=store).global_bucket.update(make_global_ratelimit_headers(1))
+
+    with pytest.raises(RateLimitError) as exc_info:
+        limiter.on_request("GET", "channels/1/messages")
+
+    assert exc_info.value.is_global
+
+
+def test_file_bucket_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "ratelimits")
+    store_a = FileBucketStore(path)
+    store_b = pickle.loads(pickle.dumps(FileBucketStore(path)))
+
+    store_a.update("abc123", 1, 1e12)
+    store_a.set_route("GET channels/{id}", "abc123")
+
+    assert store_b.get_route("GET channels/{id}") == "abc123"
+    assert store_b.take("abc123") is None
+    assert store_a.get("abc123") == (0, 1e12)
+    assert store_a.take("abc123") == 1e12
+
+
+def test_file_bucket_store_only_writes_changes(tmp_path):
+    store = FileBucketStore(str(tmp_path / "ratelimits"))
+    store.update("abc123", 0, 1e12)
+    store.set_route("GET channels/{id}", "abc123")
+
+    with patch.object(store, "file", Mock(wraps=store.file)) as file:
+        assert store.take("abc123") == 1e12
+        assert store.take("unknown") is None
+        store.set_route("GET channels/{id}", "abc123")
+
+    file.write.assert_not_called()
+
+
+def test_file_bucket_store_is_shared_between_processes(tmp_path, time):
+    path = str(tmp_path / "ratelimits")
+
+    process = multiprocessing.get_context("spawn").Process(
+        target=exhaust_bucket, args=(FileBucketStore(path),)
+    )
+    process.start()
+    process.join()
+
+    limiter = RateLimiter(store=FileBucketStore(path))
+
+    assert process.exitcode == 0
+    with pytest.raises(RateLimitError):
+        limiter.on_request("GET", "channels/1/messages")
+
+
+def test_wait_queue_is_fifo():
+    queue = WaitQueue()
+    order = []
+
+    def waiter(i):
+        with queue:
+            order.append(i)
+
+    threads = []
+    with queue:
+        for i in range(5):
+            thread = threading.Thread(target=waiter, args=(i,))
+            thread.start()
+            threads.append(thread)
+            while len(queue.waiters) < i + 2:
+                pass
+
+    for thread in threads:
+        thread.join()
+
+    assert order == list(range(5))
+
+
 @pytest.mark.parametrize(
     "path, resource",
     [
@@ -150,6 +318,18 @@ def test_ratelimit_raises_on_request_exhausted_resource(time):
         ("/users/9864325349523", "users/{user.id}"),
         ("/users/@me/guilds", "users/@me/guilds"),
         ("/invites/0vCdhLbwjZZTWZLD", "invites/{invite.code}"),
+        (
+            "/guilds/197038439483310086/members/@me/nick",
+            "guilds/197038439483310086/members/@me/nick",
+        ),
+        (
+            "/channels/290926798626357/messages/1234/reactions/abc/@me",
+            "channels/290926798626357/messages/{message.id}/reactions/{emoji}/@me",
+        ),
+        (
+            "/webhooks/223704706/abcDEF/github",
+            "webhooks/223704706/{webhook.token}/github",
+        ),
         ("/unknown/path", "unknown/path"),
     ],
 )
@@ -157,6 +337,18 @@ def test_get_resource(path, resource):
     assert get_resource(path) == resource
 
 
+def test_resource_trie_prefers_earlier_patterns():
+    trie = ResourceTrie(
+        extract_patterns(
+            ["a/(\\w+)=a/{word}", "a/(\\d+)=a/\\1", "b/(\\d+)/(\\d+)=b/\\2/\\1"]
+        )
+    )
+
+    assert trie.match("a/123") == "a/{word}"
+    assert trie.match("b/1/2") == "b/2/1"
+    assert trie.match("c") is None
+
+
 def exhausted_gateway_limiter():
     limiter = GatewayRateLimiter()
     for _ in range(limiter.MAX_EVENTS):
@@ -0,0 +1,153 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from smalld.exceptions import NetworkError
+from smalld.gateway import CloseReason
+from smalld.json_elements import JsonObject
+from smalld.metrics import Metrics
+from smalld.reconnect import ReconnectPolicy
+from smalld.smalld import GATEWAY_URL_TTL, SmallD
+
+
+@pytest.fixture(autouse=True)
+def monotonic():
+    with patch("time.monotonic", return_value=1000) as monotonic:
+        yield monotonic
+
+
+@pytest.fixture
+def smalld():
+    with patch("smalld.smalld.HttpClient", autospec=True):
+        yield SmallD("token", metrics=Metrics())
+
+
+def dispatch(smalld, t):
+    smalld.notify_listeners(
+        JsonObject({"op": 0, "t": t, "s": 1, "d": {"session_id": "a"}})
+    )
+
+
+def test_reconnects_immediately_after_session_was_established(smalld):
+    policy = smalld.reconnect_policy
+    dispatch(smalld, "READY")
+    assert policy.next_delay(CloseReason(4900)) == 0
+
+    dispatch(smalld, "RESUMED")
+    assert policy.next_delay(CloseReason(1006)) == 0
+
+
+def test_backs_off_with_jitter_on_repeated_failures():
+    policy = ReconnectPolicy(base_delay=1, max_delay=4)
+    policy.has_session = True
+
+    delays = [policy.next_delay() for _ in range(6)]
+
+    assert delays[0] == 0
+    for delay, backoff in zip(delays[1:], [1, 2, 4, 4, 4]):
+        assert backoff / 2 <= delay <= backoff
+
+
+def test_spaces_identifies_when_session_is_lost(smalld, monotonic):
+    dispatch(smalld, "READY")
+    monotonic.return_value = 1030
+
+    assert smalld.reconnect_policy.next_delay(CloseReason(4009)) == 90
+
+
+def test_records_downtime(smalld, monotonic):
+    dispatch(smalld, "READY")
+    smalld.reconnect_policy.next_delay(CloseReason(4900))
+    monotonic.return_value = 1002.5
+    dispatch(smalld, "RESUMED")
+
+    assert smalld.reconnect_policy.last_downtime == 2.5
+    assert smalld.metrics.gateway_downtime.count() == 1
+
+
+def test_smalld_waits_as_policy_decides(smalld):
+    gateway_runs = [["READY"], [], []]
+
+    def iter_gateway():
+        if not gateway_runs:
+            smalld.close()
+            return
+        for t in gateway_runs.pop(0):
+            yield JsonObject({"op": 0, "t": t, "s": 1, "d": {"session_id": "a"}})
+
+    with patch("smalld.smalld.Gateway") as gateway_cls, patch(
+        "time.sleep"
+    ) as sleep, patch("random.uniform", return_value=1):
+        gateway_cls.return_value.__iter__.side_effect = iter_gateway
+        gateway_cls.return_value.close_reason = CloseReason(1006)
+        smalld.run()
+
+    assert [call[0][0] for call in sleep.call_args_list] == [0, 1, 2]
+
+
+READY = {
+    "op": 0,
+    "t": "READY",
+    "s": 1,
+    "d": {"session_id": "a", "resume_gateway_url": "wss://resume"},
+}
+
+
+def run_gateway(smalld, gateway_runs, connect_failed=False):
+    urls = []
+
+    def create_gateway(url, **kwargs):
+        urls.append(url)
+        gateway = Mock()
+        gateway.connect_failed = connect_failed
+        gateway.close_reason = CloseReason(1006)
+        gateway.__iter__ = Mock(side_effect=lambda: iter_gateway())
+        return gateway
+
+    def iter_gateway():
+        if not gateway_runs:
+            smalld.close()
+            return
+        for payload in gateway_runs.pop(0):
+            yield JsonObject(payload)
+
+    with patch("smalld.smalld.Gateway", side_effect=create_gateway), patch(
+        "time.sleep"
+    ):
+        smalld.run()
+
+    return urls
+
+
+def test_resumes_at_resume_gateway_url(smalld):
+    smalld.http.get.return_value = JsonObject({"url": "wss://gateway"})
+
+    urls = run_gateway(smalld, [[READY], []])
+
+    assert urls == ["wss://gateway", "wss://resume", "wss://resume"]
+    smalld.http.get.assert_called_once_with("/gateway/bot")
+
+
+def test_refetches_gateway_url_after_connect_failure(smalld):
+    smalld.http.get.return_value = JsonObject({"url": "wss://gateway"})
+    smalld.identify_listener.session_id = "a"
+    smalld.identify_listener.sequence.number = 1
+    smalld.identify_listener.resume_gateway_url = "wss://resume"
+
+    urls = run_gateway(smalld, [[]], connect_failed=True)
+
+    assert urls == ["wss://resume", "wss://gateway"]
+
+
+def test_uses_cached_gateway_url_when_fetch_fails(smalld, monotonic):
+    smalld.http.get.side_effect = [
+        JsonObject({"url": "wss://gateway"}),
+        NetworkError("down"),
+    ]
+    assert smalld.get_connect_url() == "wss://gateway"
+
+    assert smalld.get_connect_url() == "wss://gateway"
+
+    monotonic.return_value += GATEWAY_URL_TTL
+    smalld.http.get.side_effect = NetworkError("down")
+    with pytest.raises(NetworkError):
+        smalld.get_connect_url()
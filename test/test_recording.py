@@ -0,0 +1,95 @@
+import json
+from unittest import mock
+
+import pytest
+from smalld.exceptions import SmallDError
+from smalld.gateway import Gateway
+from smalld.recording import GatewayRecorder, read_recording, replay
+from smalld.smalld import SmallD
+from websocket import ABNF
+
+HELLO = {"op": 10, "t": None, "s": None, "d": {"heartbeat_interval": 41250}}
+
+
+def dispatch(t, s, d):
+    return json.dumps({"op": 0, "t": t, "s": s, "d": d}).encode("utf-8")
+
+
+@pytest.fixture
+def smalld():
+    with mock.patch("smalld.smalld.HttpClient", autospec=True):
+        yield SmallD("token")
+
+
+@pytest.fixture
+def recording(tmp_path):
+    return str(tmp_path / "gateway.rec")
+
+
+def record(path, frames, times):
+    recorder = GatewayRecorder(path)
+    with mock.patch("time.time", side_effect=times):
+        for frame in frames:
+            recorder.record(frame)
+    recorder.close()
+
+
+def test_gateway_records_received_frames(recording):
+    frames = [json.dumps(HELLO).encode("utf-8"), dispatch("READY", 1, {})]
+    recorder = GatewayRecorder(recording)
+
+    with mock.patch("smalld.gateway.WebSocket", autospec=True) as ws_class:
+        ws = ws_class.return_value
+        ws.readlock = mock.MagicMock()
+        ws.connected = True
+        ws.recv_data.side_effect = [(ABNF.OPCODE_TEXT, frame) for frame in frames]
+
+        it = iter(Gateway("ws://example.url/", recorder=recorder))
+        next(it), next(it)
+        it.close()
+    recorder.close()
+
+    assert [data for _, data in read_recording(recording)] == frames
+
+
+def test_recordings_are_appended_to(recording):
+    record(recording, [b"{}"], [1])
+    record(recording, [b"[]"], [2])
+
+    assert list(read_recording(recording)) == [(1, b"{}"), (2, b"[]")]
+
+
+def test_replay_feeds_dispatches_to_listeners(smalld, recording):
+    frames = [
+        json.dumps(HELLO).encode("utf-8"),
+        dispatch("MESSAGE_CREATE", 2, {"content": "a"}),
+        dispatch("TYPING_START", 3, {}),
+        dispatch("MESSAGE_CREATE", 4, {"content": "b"}),
+    ]
+    record(recording, frames, range(4))
+    messages = []
+    smalld.on_message_create(lambda data: messages.append(data.content))
+
+    count, _ = replay(smalld, recording)
+
+    assert messages == ["a", "b"]
+    assert count == 3
+
+
+def test_replay_keeps_recorded_pace(smalld, recording):
+    record(recording, [dispatch("TYPING_START", 1, {})] * 3, [100, 101, 102])
+
+    with mock.patch("time.sleep") as sleep:
+        replay(smalld, recording, speed=10)
+
+    # sleeps until each frame is due, measured from the start of the replay
+    delays = [call[0][0] for call in sleep.call_args_list]
+    assert delays == [pytest.approx(0.1, abs=0.05), pytest.approx(0.2, abs=0.05)]
+
+
+def test_replay_rejects_other_files(smalld, tmp_path):
+    path = tmp_path / "other"
+    path.write_bytes(b"{}")
+
+    with pytest.raises(SmallDError):
+        replay(smalld, str(path))
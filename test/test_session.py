@@ -0,0 +1,97 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from smalld.json_elements import JsonObject
+from smalld.session import SessionFile
+from smalld.smalld import SmallD
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "session.json")
+
+
+def create_smalld(path, shard=(0, 1)):
+    with patch("smalld.smalld.HttpClient", autospec=True):
+        smalld = SmallD("token", shard=shard, session_file=path)
+    smalld.gateway = Mock()
+    smalld.send_gateway_payload = Mock()
+    return smalld
+
+
+def receive(smalld, payload):
+    smalld.notify_listeners(JsonObject(payload))
+
+
+READY = {
+    "op": 0,
+    "t": "READY",
+    "s": 1,
+    "d": {"session_id": "abc", "resume_gateway_url": "wss://resume"},
+}
+
+
+def test_session_file_keeps_a_session_per_shard(path):
+    sessions = SessionFile(path)
+    sessions.save((0, 2), "a", 10, "wss://a")
+    sessions.save((1, 2), "b", 20)
+
+    assert sessions.load((0, 2))["session_id"] == "a"
+    assert sessions.load((1, 2))["sequence"] == 20
+    assert sessions.load((0, 1)) is None
+
+
+def test_session_file_ignores_old_sessions(path):
+    sessions = SessionFile(path)
+    with patch("time.time", return_value=0):
+        sessions.save((0, 1), "a", 10)
+
+    with patch("time.time", return_value=5 * 60 + 1):
+        assert sessions.load((0, 1)) is None
+
+
+def test_session_file_ignores_unreadable_file(path):
+    with open(path, "w") as f:
+        f.write("{")
+
+    assert SessionFile(path).load((0, 1)) is None
+
+
+def test_smalld_resumes_session_saved_by_previous_process(path):
+    smalld = create_smalld(path)
+    receive(smalld, READY)
+    receive(smalld, {"op": 0, "t": "TYPING_START", "s": 5, "d": {}})
+    smalld.close()
+
+    restarted = create_smalld(path)
+    with patch("smalld.standard_listeners.Thread"):
+        receive(restarted, {"op": 10, "d": {"heartbeat_interval": 41250}})
+    restarted.close()
+
+    resume = restarted.send_gateway_payload.call_args_list[0][0][0]
+    assert resume["op"] == 6
+    assert resume["d"]["session_id"] == "abc"
+    assert resume["d"]["seq"] == 5
+    assert SessionFile(path).load((0, 1))["resume_gateway_url"] == "wss://resume"
+
+
+def test_smalld_keeps_session_open_on_close(path):
+    smalld = create_smalld(path)
+    receive(smalld, READY)
+    smalld.close()
+
+    smalld.gateway.close.assert_called_once_with(status=4900)
+
+
+def test_smalld_checkpoints_on_heartbeat_ack(path):
+    smalld = create_smalld(path)
+    receive(smalld, READY)
+    receive(smalld, {"op": 0, "t": "TYPING_START", "s": 7, "d": {}})
+    receive(smalld, {"op": 11})
+
+    assert SessionFile(path).load((0, 1))["sequence"] == 1
+
+    smalld.session_checkpoint.saved_at -= 30
+    receive(smalld, {"op": 11})
+
+    assert SessionFile(path).load((0, 1))["sequence"] == 7
@@ -0,0 +1,166 @@
+import logging
+from threading import Event
+from unittest.mock import Mock, patch
+
+import pytest
+from smalld.json_elements import JsonObject
+from smalld.ratelimit import IdentifyRateLimiter
+from smalld.sharding import AutoShardedSmallD, Shard
+
+
+class ControllableTime:
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self.time += seconds
+
+
+@pytest.fixture(autouse=True)
+def time():
+    time = ControllableTime()
+    with patch("time.monotonic", side_effect=time), patch(
+        "time.sleep", side_effect=time.sleep
+    ) as sleep_mock:
+        time.sleep_mock = sleep_mock
+        yield time
+
+
+@pytest.fixture(autouse=True)
+def client_mock():
+    with patch("smalld.smalld.HttpClient", autospec=True) as client_cls:
+        instance = client_cls.return_value
+        instance.get.return_value = JsonObject(
+            {
+                "url": "url/to/gateway",
+                "shards": 4,
+                "session_start_limit": {"max_concurrency": 2},
+            }
+        )
+        yield instance
+
+
+@pytest.fixture()
+def shard_run():
+    with patch.object(Shard, "run", autospec=True) as run:
+        yield run
+
+
+def test_identify_ratelimiter_spaces_identifies_per_bucket(time):
+    limiter = IdentifyRateLimiter(max_concurrency=2)
+
+    for shard_id in range(4):
+        limiter.on_identify(shard_id)
+
+    assert time.sleep_mock.call_count == 1  # shard 2 waits for shard 0
+    assert time() == 5
+
+    limiter.on_identify(3)  # waits for shard 1
+
+    assert time() == 10
+
+
+def test_auto_sharded_smalld_runs_a_shard_per_recommended_shard(shard_run, client_mock):
+    smalld = AutoShardedSmallD("token")
+
+    smalld.run()
+
+    client_mock.get.assert_called_once_with("/gateway/bot")
+    assert [shard.shard for shard in smalld.shards] == [(i, 4) for i in range(4)]
+    assert shard_run.call_count == 4
+    assert smalld.identify_limiter.max_concurrency == 2
+    assert all(shard.http is smalld.http for shard in smalld.shards)
+    assert all(shard.get_gateway_url() == "url/to/gateway" for shard in smalld.shards)
+    assert smalld.closed
+
+
+def test_auto_sharded_smalld_logs_shards_started(shard_run, caplog):
+    with caplog.at_level(logging.INFO, logger="smalld"):
+        AutoShardedSmallD("token").run()
+
+    assert "Starting 4 of 4 shards with max concurrency 2." in caplog.messages
+
+
+def test_auto_sharded_smalld_uses_shard_count(shard_run):
+    smalld = AutoShardedSmallD("token", shard_count=2)
+
+    smalld.run()
+
+    assert [shard.shard for shard in smalld.shards] == [(0, 2), (1, 2)]
+
+
+def test_shards_notify_parent_listeners(shard_run):
+    callback, inline_callback = Mock(), Mock()
+    smalld = AutoShardedSmallD("token", shard_count=2)
+    smalld.on_message_create(callback)
+    smalld.on_gateway_payload(inline_callback, inline=True)
+    smalld.run()
+
+    payload = JsonObject({"op": 0, "t": "MESSAGE_CREATE", "s": 1, "d": {"a": 1}})
+    smalld.shards[1].notify_listeners(payload)
+
+    callback.assert_called_once_with({"a": 1})
+    inline_callback.assert_called_once_with(payload)
+    assert not smalld.shards[0].skip_dispatch("MESSAGE_CREATE")
+    assert smalld.shards[0].skip_dispatch("TYPING_START")
+
+
+def test_shards_identify_with_limiter(shard_run):
+    smalld = AutoShardedSmallD("token")
+    smalld.run()
+    shard = smalld.shards[3]
+    shard.closed_event.clear()
+    shard.gateway = Mock()
+    smalld.identify_limiter = shard.identify_limiter = Mock()
+
+    shard.notify_listeners(JsonObject({"op": 10, "d": {"heartbeat_interval": 1e9}}))
+    shard.identify_listener.thread.join()
+    shard.close()
+
+    shard.identify_limiter.on_identify.assert_called_once_with(3)
+    sent = [call[0][0] for call in shard.gateway.send.call_args_list]
+    assert [(data["op"], data["d"]["shard"]) for data in sent if data["op"] == 2] == [
+        (2, (3, 4))
+    ]
+
+
+def test_shards_heartbeat_while_waiting_to_identify(shard_run):
+    smalld = AutoShardedSmallD("token")
+    smalld.run()
+    shard = smalld.shards[3]
+    shard.closed_event.clear()
+    shard.gateway = Mock()
+    smalld.identify_limiter = shard.identify_limiter = Mock()
+    identify_allowed, heartbeat_sent, heartbeat_stopped = Event(), Event(), Event()
+    shard.reconnect = heartbeat_stopped.set
+    shard.identify_limiter.on_identify.side_effect = lambda _: identify_allowed.wait()
+    shard.gateway.send.side_effect = (
+        lambda data: data["op"] == 1 and heartbeat_sent.set()
+    )
+
+    shard.notify_listeners(JsonObject({"op": 10, "d": {"heartbeat_interval": 41250}}))
+
+    assert heartbeat_sent.wait(timeout=5)
+    identify_allowed.set()
+    shard.identify_listener.thread.join()
+    assert shard.gateway.send.call_args[0][0]["op"] == 2
+
+    # no ack is sent, so the heartbeat loop reconnects and stops
+    assert heartbeat_stopped.wait(timeout=5)
+    shard.close()
+
+
+def test_auto_sharded_smalld_routes_payloads_by_guild(shard_run):
+    smalld = AutoShardedSmallD("token")
+    smalld.run()
+    for shard in smalld.shards:
+        shard.gateway = Mock()
+
+    smalld.send_gateway_payload({"op": 8, "d": {"guild_id": str(3 << 22)}})
+    smalld.send_gateway_payload({"op": 3, "d": {"status": "online"}})
+
+    smalld.shards[3].gateway.send.assert_called_once()
+    smalld.shards[0].gateway.send.assert_called_once()
@@ -1,3 +1,4 @@
+from threading import current_thread
 from unittest.mock import Mock, patch
 
 import pytest
@@ -109,6 +110,90 @@ def test_smalld_calls_event_listener_on_payload(gateway_mock):
     callback.assert_called_once_with(data)
 
 
+def test_smalld_calls_listeners_in_registration_order(gateway_mock):
+    payload = {"op": 0, "t": "MESSAGE_CREATE", "d": {}, "s": 1}
+    calls = []
+    smalld = SmallD("token")
+    prepare_gateway_mock(gateway_mock, smalld, [[payload]])
+
+    smalld.on_gateway_payload(lambda data: calls.append("any"))
+    smalld.on_message_create(lambda data: calls.append("t"))
+    smalld.on_gateway_payload(op=0)(lambda data: calls.append("op"))
+    smalld.on_gateway_payload(op=0, t="MESSAGE_CREATE")(lambda d: calls.append("both"))
+    smalld.on_gateway_payload(op=1)(lambda data: calls.append("other op"))
+    smalld.on_typing_start(lambda data: calls.append("other t"))
+    smalld.run()
+
+    assert calls == ["any", "t", "op", "both"]
+
+
+def test_smalld_isolates_listener_exceptions(gateway_mock):
+    payload = {"op": 0, "t": "MESSAGE_CREATE", "d": {}, "s": 1}
+    callback = Mock()
+    smalld = SmallD("token")
+    prepare_gateway_mock(gateway_mock, smalld, [[payload]])
+
+    smalld.on_message_create(Mock(side_effect=Exception()))
+    smalld.on_message_create(callback)
+    smalld.run()
+
+    callback.assert_called_once_with({})
+
+
+def test_smalld_calls_dispatch_listeners_on_executor(gateway_mock):
+    payloads = [
+        {"op": 0, "t": "MESSAGE_CREATE", "d": {"guild_id": "1"}, "s": 1},
+        {"op": 11, "t": None, "d": None, "s": None},
+    ]
+    threads = {}
+    smalld = SmallD("token", event_workers=2)
+    prepare_gateway_mock(gateway_mock, smalld, [payloads])
+
+    smalld.on_message_create(lambda data: threads.update(dispatch=current_thread()))
+    smalld.on_gateway_payload(op=11)(lambda data: threads.update(ack=current_thread()))
+    smalld.run()
+    for thread in smalld.executor.threads:
+        thread.join()
+
+    assert threads["ack"] is current_thread()
+    assert threads["dispatch"] in smalld.executor.threads
+
+
+def test_smalld_skips_dispatches_without_listeners():
+    smalld = SmallD("token")
+
+    assert smalld.skip_dispatch("TYPING_START")
+    assert not smalld.skip_dispatch("READY")
+
+    smalld.on_typing_start(Mock())
+
+    assert not smalld.skip_dispatch("TYPING_START")
+
+
+def test_smalld_does_not_skip_dispatches_with_catch_all_listener():
+    smalld = SmallD("token")
+    smalld.on_gateway_payload(Mock())
+
+    assert not smalld.skip_dispatch("TYPING_START")
+
+
+def test_smalld_tracks_sequence_of_skipped_dispatches(gateway_mock):
+    callback = Mock()
+    smalld = SmallD("token")
+    prepare_gateway_mock(gateway_mock, smalld, [[{"op": 0, "t": "X", "s": 5}]])
+
+    smalld.on_gateway_payload(callback, op=0)
+    smalld.run()
+
+    callback.assert_not_called()
+    smalld.send_gateway_payload = Mock()
+    heartbeat = {"op": 1, "t": None, "s": None, "d": None}
+    prepare_gateway_mock(gateway_mock, smalld, [[heartbeat]])
+    smalld.run()
+
+    smalld.send_gateway_payload.assert_called_once_with({"op": 1, "d": 5})
+
+
 def test_smalld_ends_for_non_recoverable_gateway_errors(gateway_mock):
     smalld = SmallD("token")
 
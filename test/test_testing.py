@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from smalld import RateLimitError  # isort:skip
+from smalld.smalld import HttpClient  # isort:skip
+from smalld.testing import OP_INVALID_SESSION, OP_RECONNECT, FakeDiscord  # isort:skip
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(asyncio.wait_for(coro, 5))
+    finally:
+        loop.close()
+
+
+async def receive(ws):
+    return (await ws.receive()).json()
+
+
+def test_fake_discord_ratelimits_routes():
+    with FakeDiscord() as discord:
+        discord.ratelimit("channels/{}/messages", 2, 0.2)
+        client = HttpClient("token", discord.base_url, wait_on_ratelimit=True)
+        for _ in range(5):
+            client.post("channels/1/messages", {"content": "hi"})
+
+        assert len(discord.requests) == 5
+        assert discord.ratelimited == []
+
+        client = HttpClient("token", discord.base_url)
+        client.post("channels/2/messages", {"content": "hi"})
+        client.post("channels/2/messages", {"content": "hi"})
+        with pytest.raises(RateLimitError):
+            client.post("channels/2/messages", {"content": "hi"})
+
+
+def test_fake_discord_answers_429_when_limit_is_ignored():
+    with FakeDiscord() as discord:
+        discord.ratelimit("channels/{}/messages", 1, 10)
+        client = HttpClient("token", discord.base_url)
+        client.limiter.on_request = lambda method, path: None
+        client.get("channels/1/messages")
+
+        with pytest.raises(RateLimitError):
+            client.get("channels/1/messages")
+
+        assert discord.ratelimited == [("GET", "channels/1/messages")]
+
+
+def test_fake_discord_resumes_sessions():
+    async def main():
+        async with FakeDiscord() as discord:
+            discord.events = [{"t": "MESSAGE_CREATE", "d": {}}]
+            async with aiohttp.ClientSession() as session:
+                async with session.ws_connect(discord.gateway_url) as ws:
+                    await receive(ws)
+                    await ws.send_json({"op": 2, "d": {"token": "token"}})
+                    ready = await receive(ws)
+                    message = await receive(ws)
+                    await discord.send_all(OP_RECONNECT)
+                    assert (await receive(ws))["op"] == OP_RECONNECT
+
+                session_id = ready["d"]["session_id"]
+                async with session.ws_connect(discord.gateway_url) as ws:
+                    await receive(ws)
+                    resume = {"session_id": session_id, "seq": message["s"]}
+                    await ws.send_json({"op": 6, "d": resume})
+                    resumed = await receive(ws)
+
+                async with session.ws_connect(discord.gateway_url) as ws:
+                    await receive(ws)
+                    resume = {"session_id": "unknown", "seq": 1}
+                    await ws.send_json({"op": 6, "d": resume})
+                    invalid = await receive(ws)
+
+            return discord, resumed, invalid
+
+    discord, resumed, invalid = run(main())
+
+    assert resumed["t"] == "RESUMED" and resumed["s"] == 3
+    assert invalid["op"] == OP_INVALID_SESSION
+    assert len(discord.connects) == 3
+    assert len(discord.resumes) == 2
+
+
+def test_fake_discord_replays_missed_dispatches_on_resume():
+    async def main():
+        async with FakeDiscord() as discord:
+            discord.events = [{"t": "TYPING_START", "d": {"n": n}} for n in range(3)]
+            async with aiohttp.ClientSession() as session:
+                async with session.ws_connect(discord.gateway_url) as ws:
+                    await receive(ws)
+                    await ws.send_json({"op": 2, "d": {"token": "token"}})
+                    ready = await receive(ws)
+                    first = await receive(ws)
+
+                session_id = ready["d"]["session_id"]
+                async with session.ws_connect(discord.gateway_url) as ws:
+                    await receive(ws)
+                    resume = {"session_id": session_id, "seq": first["s"]}
+                    await ws.send_json({"op": 6, "d": resume})
+                    return [await receive(ws) for _ in range(3)]
+
+    replayed = run(main())
+
+    assert [(p["t"], p["s"]) for p in replayed] == [
+        ("TYPING_START", 3),
+        ("TYPING_START", 4),
+        ("RESUMED", 5),
+    ]